@@ -1,27 +1,105 @@
+import os
+import threading
 import time
 import importlib
+import uuid
 
 import dash
+import flask
 import dash_core_components as dcc
 import dash_html_components as html
 import numpy as np
-from dash.dependencies import Input, Output, State
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
+from dash.dependencies import ClientsideFunction, Input, Output, State
 from sklearn import datasets
 from sklearn.svm import SVC
 
 import utils.dash_reusable_components as drc
 import utils.figures as figs
+import utils.pm_dashboard as pm_dashboard
+from utils.dataset_cache import DatasetCache
+from utils.decision_surface import evaluate_mesh
+from utils.figure_payload import compact_figure
+from utils.jobs import JobQueue, RequestCoalescer, RequestSuperseded, report_progress
+from utils.model_cache import DiskCache, LRUCache, TieredCache
+from utils.timeseries import StationSeriesCache
 
 app = dash.Dash(
     __name__,
     meta_tags=[
         {"name": "viewport", "content": "width=device-width, initial-scale=1.0"}
     ],
+    # the graphs updated by the threshold callback are created by update_svm_graph
+    suppress_callback_exceptions=True,
 )
 server = app.server
 
+# "svm" serves the SVM Explorer, "pm" the PM2.5 dashboard of the sensor
+# archive in data/ (see utils/pm_dashboard.py)
+APP_MODE = os.environ.get("APP_MODE", "svm")
+PM_DATA_DIR = os.environ.get(
+    "PM_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+)
+
+# The whole mesh is evaluated exactly at a step of 0.3 by default. With
+# SVM_MESH_COARSE_FACTOR=n > 1 the step is 0.3 / n: the 0.3 grid is evaluated
+# first and the finer mesh is refined in every cell crossed by the contour of
+# one of the threshold slider positions, since the slider moves the contour to
+# any level between z_min and z_max in the browser. Only cells whose values lie
+# between two slider positions stay interpolated (see utils/decision_surface.py).
+MESH_COARSE_FACTOR = int(os.environ.get("SVM_MESH_COARSE_FACTOR", "1"))
+MESH_STEP = 0.3 / MESH_COARSE_FACTOR  # step size in the mesh
+THRESHOLD_STEPS = 100  # positions of the threshold slider (step 0.01)
+
+# Fitted models and decision surfaces of the most recent parameter combinations,
+# and the rendered figures. With SVM_CACHE_DIR set (e.g. when running several
+# workers with gunicorn, see wsgi.py) they are shared by all worker processes
+# through SQLite files in this directory.
+MODEL_CACHE_SIZE = 32
+FIGURE_CACHE_SIZE = 64
+CACHE_DIR = os.environ.get("SVM_CACHE_DIR")
+CACHE_MAX_MB = int(os.environ.get("SVM_CACHE_MAX_MB", "512"))
+if CACHE_DIR:
+    model_cache = TieredCache(
+        LRUCache(maxsize=MODEL_CACHE_SIZE),
+        DiskCache(
+            os.path.join(CACHE_DIR, "models.sqlite"),
+            max_bytes=CACHE_MAX_MB * 2 ** 20 * 3 // 4,
+        ),
+    )
+    figure_cache = TieredCache(
+        LRUCache(maxsize=FIGURE_CACHE_SIZE),
+        DiskCache(
+            os.path.join(CACHE_DIR, "figures.sqlite"),
+            max_bytes=CACHE_MAX_MB * 2 ** 20 // 4,
+        ),
+    )
+else:
+    model_cache = LRUCache(maxsize=MODEL_CACHE_SIZE)
+    figure_cache = LRUCache(maxsize=FIGURE_CACHE_SIZE)
+
+# Fits whose estimated time exceeds LONG_FIT_SECONDS run on a background worker
+# pool, the page polls their progress through dcc.Interval. The estimate grows
+# with the training samples times C, and for the polynomial kernel with
+# (3 * gamma) ** (2 * degree); the factors were measured on the slider ranges,
+# so the usual fits (C <= 100, any sample size) stay in the callback.
+FIT_WORKERS = 2
+LONG_FIT_SECONDS = 0.5
+FIT_SECONDS_PER_SAMPLE_C = 4e-7
+KERNEL_FIT_FACTOR = {"linear": 1.0, "poly": 1.0, "rbf": 0.1, "sigmoid": 0.01}
+# a job submitted on another worker process is waited for this long (seconds)
+# before the polling worker fits the model itself
+FIT_JOB_TIMEOUT = 300
+fit_queue = JobQueue(max_workers=FIT_WORKERS)
+
+# Identical requests computing at the same time share one computation, and a
+# request still waiting for one of the COMPUTE_SLOTS is dropped when a newer
+# request of its session arrives (e.g. while a slider is dragged). With
+# SVM_SLIDER_UPDATEMODE=drag the sliders send requests while being dragged,
+# by default only when they are released.
+COMPUTE_SLOTS = int(os.environ.get("SVM_COMPUTE_SLOTS", "2"))
+SLIDER_UPDATEMODE = os.environ.get("SVM_SLIDER_UPDATEMODE", "mouseup")
+coalescer = RequestCoalescer(max_concurrent=COMPUTE_SLOTS)
+
 
 def generate_data(n_samples, dataset, noise):
     if dataset == "moons":
@@ -54,7 +132,22 @@ def generate_data(n_samples, dataset, noise):
         )
 
 
-app.layout = html.Div(
+# All combinations offered by the dataset, sample size and noise controls are
+# generated once (at startup, see warm_up) and reused by every callback.
+# Set SVM_DATASET_CACHE_DIR to also keep them on disk between restarts.
+DATASETS = ["moons", "linear", "circles"]
+SAMPLE_SIZES = [100, 200, 300, 400, 500]
+NOISE_LEVELS = [i / 10 for i in range(0, 11)]
+dataset_cache = DatasetCache(
+    generate_data,
+    DATASETS,
+    SAMPLE_SIZES,
+    NOISE_LEVELS,
+    cache_dir=os.environ.get("SVM_DATASET_CACHE_DIR"),
+)
+
+
+main_layout = html.Div(
     children=[
         # .container class is fixed, .container.scalable is scalable
         html.Div(
@@ -125,6 +218,7 @@ app.layout = html.Div(
                                         drc.NamedSlider(
                                             name="Sample Size",
                                             id="slider-dataset-sample-size",
+                                            updatemode=SLIDER_UPDATEMODE,
                                             min=100,
                                             max=500,
                                             step=100,
@@ -137,6 +231,7 @@ app.layout = html.Div(
                                         drc.NamedSlider(
                                             name="Noise Level",
                                             id="slider-dataset-noise-level",
+                                            updatemode=SLIDER_UPDATEMODE,
                                             min=0,
                                             max=1,
                                             marks={
@@ -157,7 +252,7 @@ app.layout = html.Div(
                                             min=0,
                                             max=1,
                                             value=0.5,
-                                            step=0.01,
+                                            step=1 / THRESHOLD_STEPS,
                                         ),
                                         html.Button(
                                             "Reset Threshold",
@@ -193,6 +288,7 @@ app.layout = html.Div(
                                         drc.NamedSlider(
                                             name="Cost (C)",
                                             id="slider-svm-parameter-C-power",
+                                            updatemode=SLIDER_UPDATEMODE,
                                             min=-2,
                                             max=4,
                                             value=0,
@@ -203,6 +299,7 @@ app.layout = html.Div(
                                         ),
                                         drc.FormattedSlider(
                                             id="slider-svm-parameter-C-coef",
+                                            updatemode=SLIDER_UPDATEMODE,
                                             min=1,
                                             max=9,
                                             value=1,
@@ -210,6 +307,7 @@ app.layout = html.Div(
                                         drc.NamedSlider(
                                             name="Degree",
                                             id="slider-svm-parameter-degree",
+                                            updatemode=SLIDER_UPDATEMODE,
                                             min=2,
                                             max=10,
                                             value=3,
@@ -221,6 +319,7 @@ app.layout = html.Div(
                                         drc.NamedSlider(
                                             name="Gamma",
                                             id="slider-svm-parameter-gamma-power",
+                                            updatemode=SLIDER_UPDATEMODE,
                                             min=-5,
                                             max=0,
                                             value=-1,
@@ -231,6 +330,7 @@ app.layout = html.Div(
                                         ),
                                         drc.FormattedSlider(
                                             id="slider-svm-parameter-gamma-coef",
+                                            updatemode=SLIDER_UPDATEMODE,
                                             min=1,
                                             max=9,
                                             value=5,
@@ -261,6 +361,7 @@ app.layout = html.Div(
                                         ),
                                     ],
                                 ),
+                                html.Div(id="div-fit-status"),
                             ],
                         ),
                         html.Div(
@@ -274,6 +375,14 @@ app.layout = html.Div(
                                 ),
                             ),
                         ),
+                        # decision values of the current model for the
+                        # client-side threshold callback
+                        dcc.Store(id="store-decision-values"),
+                        # job id and parameters of a fit running in the background
+                        dcc.Store(id="store-fit-job"),
+                        dcc.Interval(
+                            id="interval-fit-job", interval=500, disabled=True
+                        ),
                     ],
                 )
             ],
@@ -282,6 +391,21 @@ app.layout = html.Div(
 )
 
 
+def serve_layout():
+    # a new session id per page load, a new fit of a session cancels its
+    # previous background fit
+    return html.Div(
+        children=main_layout.children
+        + [dcc.Store(id="session-id", data=str(uuid.uuid4()))]
+    )
+
+
+if APP_MODE == "pm":
+    pm_dashboard.register(app, StationSeriesCache(PM_DATA_DIR))
+else:
+    app.layout = serve_layout
+
+
 @app.callback(
     Output("slider-svm-parameter-gamma-coef", "marks"),
     [Input("slider-svm-parameter-gamma-power", "value")],
@@ -303,12 +427,12 @@ def update_slider_svm_parameter_C_coef(power):
 @app.callback(
     Output("slider-threshold", "value"),
     [Input("button-zero-threshold", "n_clicks")],
-    [State("graph-sklearn-svm", "figure")],
+    [State("store-decision-values", "data")],
 )
-def reset_threshold_center(n_clicks, figure):
-    if n_clicks:
-        Z = np.array(figure["data"][0]["z"])
-        value = -Z.min() / (Z.max() - Z.min())
+def reset_threshold_center(n_clicks, decision_values):
+    if n_clicks and decision_values:
+        z_min, z_max = decision_values["z_min"], decision_values["z_max"]
+        value = -z_min / (z_max - z_min)
     else:
         value = 0.4959986285375595
     return value
@@ -339,23 +463,7 @@ def disable_slider_param_gamma_power(kernel):
     return kernel not in ["rbf", "poly", "sigmoid"]
 
 
-@app.callback(
-    Output("div-graphs", "children"),
-    [
-        Input("dropdown-svm-parameter-kernel", "value"),
-        Input("slider-svm-parameter-degree", "value"),
-        Input("slider-svm-parameter-C-coef", "value"),
-        Input("slider-svm-parameter-C-power", "value"),
-        Input("slider-svm-parameter-gamma-coef", "value"),
-        Input("slider-svm-parameter-gamma-power", "value"),
-        Input("dropdown-select-dataset", "value"),
-        Input("slider-dataset-noise-level", "value"),
-        Input("radio-svm-parameter-shrinking", "value"),
-        Input("slider-threshold", "value"),
-        Input("slider-dataset-sample-size", "value"),
-    ],
-)
-def update_svm_graph(
+def model_params(
     kernel,
     degree,
     C_coef,
@@ -365,43 +473,114 @@ def update_svm_graph(
     dataset,
     noise,
     shrinking,
-    threshold,
     sample_size,
 ):
-    t_start = time.time()
-    h = 0.3  # step size in the mesh
+    """Cache key of a model. Parameters the kernel ignores are fixed, so they
+    don't create additional cache entries."""
+    C = C_coef * 10 ** C_power
+    gamma = gamma_coef * 10 ** gamma_power
+    if kernel != "poly":
+        degree = 3
+    if kernel == "linear":
+        gamma = "scale"
+
+    return (kernel, degree, C, gamma, shrinking == "True", dataset, noise, sample_size)
+
+
+def train_svm(kernel, degree, C, gamma, shrinking, dataset, noise, sample_size):
+    h = MESH_STEP
 
     # Data Pre-processing
-    X, y = generate_data(n_samples=sample_size, dataset=dataset, noise=noise)
-    X = StandardScaler().fit_transform(X)
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.4, random_state=42
-    )
+    report_progress(0.1, "Loading data")
+    data = dataset_cache.get(dataset, sample_size, noise)
+    X = data["X"]
+    X_train, X_test = data["X_train"], data["X_test"]
+    y_train, y_test = data["y_train"], data["y_test"]
 
     x_min = X[:, 0].min() - 0.5
     x_max = X[:, 0].max() + 0.5
     y_min = X[:, 1].min() - 0.5
     y_max = X[:, 1].max() + 0.5
-    xx, yy = np.meshgrid(np.arange(x_min, x_max, h), np.arange(y_min, y_max, h))
-
-    C = C_coef * 10 ** C_power
-    gamma = gamma_coef * 10 ** gamma_power
-
-    if shrinking == "True":
-        flag = True
-    else:
-        flag = False
-
-    # Train SVM
-    clf = SVC(C=C, kernel=kernel, degree=degree, gamma=gamma, shrinking=flag)
+    xs = np.arange(x_min, x_max, h)
+    ys = np.arange(y_min, y_max, h)
+    xx, yy = np.meshgrid(xs, ys)
+
+    # Train SVM. A cancelled job stops here at the latest, libsvm itself
+    # can't be interrupted once the fit has started.
+    report_progress(0.2, "Fitting SVM")
+    clf = SVC(C=C, kernel=kernel, degree=degree, gamma=gamma, shrinking=shrinking)
     clf.fit(X_train, y_train)
 
     # Plot the decision boundary. For that, we will assign a color to each
     # point in the mesh [x_min, x_max]x[y_min, y_max].
+    report_progress(0.8, "Evaluating decision surface")
     if hasattr(clf, "decision_function"):
-        Z = clf.decision_function(np.c_[xx.ravel(), yy.ravel()])
+        Z = evaluate_mesh(
+            clf.decision_function,
+            xs,
+            ys,
+            coarse_factor=MESH_COARSE_FACTOR,
+            n_levels=THRESHOLD_STEPS + 1,
+        )
     else:
-        Z = clf.predict_proba(np.c_[xx.ravel(), yy.ravel()])[:, 1]
+        Z = evaluate_mesh(
+            lambda points: clf.predict_proba(points)[:, 1],
+            xs,
+            ys,
+            coarse_factor=MESH_COARSE_FACTOR,
+            n_levels=THRESHOLD_STEPS + 1,
+        )
+
+    decision_values = dict(
+        z_min=float(Z.min()),
+        z_max=float(Z.max()),
+        decision_train=clf.decision_function(X_train).tolist(),
+        y_train=y_train.tolist(),
+        decision_test=clf.decision_function(X_test).tolist(),
+        y_test=y_test.tolist(),
+    )
+
+    return dict(
+        clf=clf,
+        X_train=X_train,
+        X_test=X_test,
+        y_train=y_train,
+        y_test=y_test,
+        xx=xx,
+        yy=yy,
+        Z=Z,
+        decision_values=decision_values,
+    )
+
+
+def estimate_fit_seconds(params):
+    kernel, degree, C, gamma, shrinking, dataset, noise, sample_size = params
+    n_train = sample_size * (1 - dataset_cache.test_size)
+    factor = KERNEL_FIT_FACTOR.get(kernel, 1.0)
+    if kernel == "poly":
+        factor *= max(1.0, (3 * gamma) ** (2 * degree))
+    return FIT_SECONDS_PER_SAMPLE_C * n_train * max(C, 1.0) * factor
+
+
+def is_long_fit(params):
+    return estimate_fit_seconds(params) > LONG_FIT_SECONDS
+
+
+def get_trained_svm(params):
+    """Return the fitted model and decision surface for the given cache key,
+    training it only if it is not cached yet."""
+    model = model_cache.get(params)
+    if model is None:
+        model = train_svm(*params)
+        model_cache.put(params, model)
+    return model
+
+
+def serve_figures(model, threshold):
+    clf = model["clf"]
+    X_train, X_test = model["X_train"], model["X_test"]
+    y_train, y_test = model["y_train"], model["y_test"]
+    xx, yy, Z = model["xx"], model["yy"], model["Z"]
 
     prediction_figure = figs.serve_prediction_plot(
         model=clf,
@@ -412,7 +591,7 @@ def update_svm_graph(
         Z=Z,
         xx=xx,
         yy=yy,
-        mesh_step=h,
+        mesh_step=MESH_STEP,
         threshold=threshold,
     )
 
@@ -422,6 +601,34 @@ def update_svm_graph(
         model=clf, X_test=X_test, y_test=y_test, Z=Z, threshold=threshold
     )
 
+    # mesh and points as float32 typed arrays instead of lists of floats
+    prediction_figure = compact_figure(prediction_figure)
+    roc_figure = compact_figure(roc_figure)
+
+    return dict(
+        prediction=prediction_figure,
+        roc=roc_figure,
+        confusion=confusion_figure,
+        decision_values=model["decision_values"],
+    )
+
+
+def get_figures(params, threshold):
+    """Return the figures for the given cache key and threshold, rendering them
+    (and training the model) only if they are not cached yet."""
+    key = (params, round(threshold, 4))
+    figures = figure_cache.get(key)
+    if figures is None:
+        figures = serve_figures(get_trained_svm(params), threshold)
+        figure_cache.put(key, figures)
+    return figures
+
+
+def render_graphs(figures):
+    prediction_figure = figures["prediction"]
+    roc_figure = figures["roc"]
+    confusion_figure = figures["confusion"]
+
     return [
         html.Div(
             id="svm-graph-container",
@@ -449,6 +656,153 @@ def update_svm_graph(
     ]
 
 
+@app.callback(
+    [
+        Output("div-graphs", "children"),
+        Output("store-decision-values", "data"),
+        Output("store-fit-job", "data"),
+        Output("interval-fit-job", "disabled"),
+        Output("div-fit-status", "children"),
+    ],
+    [
+        Input("dropdown-svm-parameter-kernel", "value"),
+        Input("slider-svm-parameter-degree", "value"),
+        Input("slider-svm-parameter-C-coef", "value"),
+        Input("slider-svm-parameter-C-power", "value"),
+        Input("slider-svm-parameter-gamma-coef", "value"),
+        Input("slider-svm-parameter-gamma-power", "value"),
+        Input("dropdown-select-dataset", "value"),
+        Input("slider-dataset-noise-level", "value"),
+        Input("radio-svm-parameter-shrinking", "value"),
+        Input("slider-dataset-sample-size", "value"),
+        Input("interval-fit-job", "n_intervals"),
+    ],
+    # threshold changes are handled in the browser (assets/svm_threshold.js)
+    [
+        State("slider-threshold", "value"),
+        State("session-id", "data"),
+        State("store-fit-job", "data"),
+    ],
+)
+def update_svm_graph(
+    kernel,
+    degree,
+    C_coef,
+    C_power,
+    gamma_coef,
+    gamma_power,
+    dataset,
+    noise,
+    shrinking,
+    sample_size,
+    n_intervals,
+    threshold,
+    session_id,
+    fit_job,
+):
+    t_start = time.time()
+    triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+
+    if "interval-fit-job.n_intervals" in triggered:
+        # polling a background fit
+        if not fit_job:
+            return dash.no_update, dash.no_update, None, True, ""
+        job = fit_queue.get(fit_job["job_id"])
+        params = tuple(fit_job["params"])
+        if job is not None and job.status == "done" and params not in model_cache:
+            # evicted from the model cache since the job finished
+            model_cache.put(params, job.result)
+        if params not in model_cache:
+            # the model is never trained on this request thread: without a
+            # result polling either continues or stops with a status
+            if job is not None and not job.finished:
+                status = "Training SVM: {} ({:.0%})".format(job.message, job.progress)
+                return dash.no_update, dash.no_update, dash.no_update, False, status
+            if job is not None and job.status == "failed":
+                return dash.no_update, dash.no_update, None, True, job.error
+            if job is None and time.time() - fit_job["submitted"] < FIT_JOB_TIMEOUT:
+                # the job runs on another worker process and its result will
+                # be in the shared cache, unless that worker went away
+                status = "Training SVM"
+                return dash.no_update, dash.no_update, dash.no_update, False, status
+            # cancelled, pruned or timed out
+            status = "Training SVM stopped, change a parameter to train again"
+            return dash.no_update, dash.no_update, None, True, status
+    else:
+        params = model_params(
+            kernel,
+            degree,
+            C_coef,
+            C_power,
+            gamma_coef,
+            gamma_power,
+            dataset,
+            noise,
+            shrinking,
+            sample_size,
+        )
+        if params not in model_cache and is_long_fit(params):
+            job = fit_queue.submit(session_id, get_trained_svm, params)
+            fit_job = dict(
+                job_id=job.id, params=list(params), submitted=time.time()
+            )
+            return dash.no_update, dash.no_update, fit_job, False, "Training SVM"
+        # a fast fit supersedes a long one still running for this session
+        fit_queue.cancel_session(session_id)
+
+    try:
+        figures = coalescer.run(
+            (params, round(threshold, 4)),
+            get_figures,
+            params,
+            threshold,
+            session_id=session_id,
+        )
+    except RequestSuperseded:
+        raise dash.exceptions.PreventUpdate
+
+    return render_graphs(figures), figures["decision_values"], None, True, ""
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="svm", function_name="updateThreshold"),
+    [
+        Output("graph-sklearn-svm", "figure"),
+        Output("graph-pie-confusion-matrix", "figure"),
+    ],
+    [Input("slider-threshold", "value")],
+    [
+        State("store-decision-values", "data"),
+        State("graph-sklearn-svm", "figure"),
+        State("graph-pie-confusion-matrix", "figure"),
+    ],
+)
+
+
+@server.route("/metrics/callbacks")
+def callback_metrics():
+    """Counters of the coalesced and dropped requests of update_svm_graph."""
+    return flask.jsonify(requests=coalescer.info(), model_cache=model_cache.info())
+
+
+def warm_up():
+    """Build all datasets and fit the default model, so neither the first
+    request nor later slider changes pay for data generation or imports."""
+    dataset_cache.warm_up()
+    get_trained_svm(
+        model_params("rbf", 3, 1, 0, 5, -1, "moons", 0.2, "True", 300)
+    )
+
+
+def start_warm_up():
+    """Run warm_up on a background thread. Called by the entry points (this
+    module as a script, wsgi), not on import, so tools importing the app such
+    as the load test do not build the datasets; SVM_WARM_UP=0 disables it."""
+    if APP_MODE == "svm" and os.environ.get("SVM_WARM_UP", "1") == "1":
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
 # Running the server
 if __name__ == "__main__":
+    start_warm_up()
     app.run_server(debug=True)
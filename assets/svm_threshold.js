@@ -0,0 +1,74 @@
+/*
+ * Client-side threshold handling of the SVM Explorer.
+ *
+ * The decision values of the mesh (min/max), of the training and of the test
+ * points are shipped once per model in the "store-decision-values" store, so
+ * moving the threshold slider only recolors the contour levels and recounts the
+ * confusion matrix in the browser instead of calling the server.
+ */
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    svm: {
+        updateThreshold: function (threshold, store, predictionFigure, pieFigure) {
+            var noUpdate = window.dash_clientside.no_update;
+            if (!store || !predictionFigure || !pieFigure ||
+                !predictionFigure.data || predictionFigure.data.length < 4 ||
+                !pieFigure.data || pieFigure.data.length < 1) {
+                return [noUpdate, noUpdate];
+            }
+
+            // same scaling as in figs.serve_prediction_plot
+            var scaledThreshold = threshold * (store.z_max - store.z_min) + store.z_min;
+            var range = Math.max(
+                Math.abs(scaledThreshold - store.z_min),
+                Math.abs(scaledThreshold - store.z_max)
+            );
+
+            function counts(decision, y, cut) {
+                var c = {tp: 0, fn: 0, fp: 0, tn: 0};
+                for (var i = 0; i < decision.length; i++) {
+                    var predicted = decision[i] > cut ? 1 : 0;
+                    if (predicted === 1 && y[i] === 1) { c.tp++; }
+                    else if (predicted === 0 && y[i] === 1) { c.fn++; }
+                    else if (predicted === 1 && y[i] === 0) { c.fp++; }
+                    else { c.tn++; }
+                }
+                return c;
+            }
+
+            function accuracy(c) {
+                var total = c.tp + c.fn + c.fp + c.tn;
+                return total > 0 ? (c.tp + c.tn) / total : 0;
+            }
+
+            // the accuracies in the legend use the unscaled threshold, like on the server
+            var train = counts(store.decision_train, store.y_train, threshold);
+            var test = counts(store.decision_test, store.y_test, threshold);
+            var confusion = counts(store.decision_test, store.y_test, scaledThreshold);
+
+            var data = predictionFigure.data.slice();
+            data[0] = Object.assign({}, data[0], {
+                zmin: scaledThreshold - range,
+                zmax: scaledThreshold + range
+            });
+            data[1] = Object.assign({}, data[1], {
+                contours: Object.assign({}, data[1].contours, {value: scaledThreshold})
+            });
+            data[2] = Object.assign({}, data[2], {
+                name: "Training Data (accuracy=" + accuracy(train).toFixed(3) + ")"
+            });
+            data[3] = Object.assign({}, data[3], {
+                name: "Test Data (accuracy=" + accuracy(test).toFixed(3) + ")"
+            });
+
+            var pieData = pieFigure.data.slice();
+            pieData[0] = Object.assign({}, pieData[0], {
+                values: [confusion.tp, confusion.fn, confusion.fp, confusion.tn]
+            });
+
+            return [
+                Object.assign({}, predictionFigure, {data: data}),
+                Object.assign({}, pieFigure, {data: pieData})
+            ];
+        }
+    }
+});
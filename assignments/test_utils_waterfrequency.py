@@ -9,6 +9,9 @@ __author__ = "Anna Buch, Student, Heidelberg University"
 __email__ = "a.buch@stud.uni-heidelberg.de"
 
 import os
+import sys
+import json
+import subprocess
 import numpy as np
 import rasterio as rio
 from utils_waterfrequency import *
@@ -218,3 +221,353 @@ def test_get_valid_pixels():
 
 	assert valid_pixels.sum() == exp_array.sum(), "Satellite scene only contains no data values.\nBe careful the number of scenes with NaNs affects the calculation"
 
+
+
+
+def test_block_windows():
+	"""
+	--- Check if the tiles are aligned to the internal blocks of the raster and cover the whole window ---
+	"""
+	# Given
+	win = rio.windows.Window(100, 700, 1000, 300)
+	block_shape = (512, 512)
+
+	# when
+	tiles = block_windows(win, block_shape)
+
+	# then
+	src_windows = [src_window for src_window, out_window in tiles]
+	out_windows = [out_window for src_window, out_window in tiles]
+	assert [w.col_off for w in src_windows] == [100, 512, 1024]
+	assert [w.width for w in src_windows] == [412, 512, 76]
+	assert sum(w.width * w.height for w in out_windows) == 1000 * 300
+	assert out_windows[1] == rio.windows.Window(412, 0, 512, 300)
+
+
+
+def test_read_ndwi_tile(tmp_path):
+	"""
+	--- Check if the NDWI of a tile is calculated and fill values and empty pixels are set to NaN ---
+	"""
+	# Given
+	profile = dict(driver="GTiff", dtype="uint16", count=1, width=4, height=2, crs="EPSG:32633",
+		transform=rio.transform.from_origin(600000, 5300000, 30, 30))
+	green = np.array([[12000, 12000, 10000, 0], [12000, 12000, 10000, 10000]], dtype=np.uint16)
+	swir = np.array([[5500, 5500, 15000, 15000], [5500, 0, 15000, 15000]], dtype=np.uint16)
+	for name, band in (("B3.TIF", green), ("B7.TIF", swir)):
+		with rio.open(str(tmp_path / name), "w", **profile) as dst:
+			dst.write(band, 1)
+	grid = TargetGrid("EPSG:32633", rio.transform.from_origin(600000, 5300000, 30, 30), (2, 4))
+	out_window = rio.windows.Window(0, 0, 4, 2)
+	task = (str(tmp_path / "B3.TIF"), str(tmp_path / "B7.TIF"), grid, out_window, -0.1, 2e-05, -0.1, 2e-05, 65535, 1)
+
+	# when
+	tile_window, ndwi = read_ndwi_tile(task)
+
+	# then
+	assert tile_window == out_window
+	assert ndwi.dtype == np.float32
+	assert np.isnan(ndwi[0, 3]) and np.isnan(ndwi[1, 1])
+	assert ndwi[0, 0] > 0.3 and ndwi[0, 2] < 0
+
+
+
+def test_open_raster_reused(tmp_path, monkeypatch):
+	"""
+	--- Check if both bands of a scene are opened only once when a scene is read tile by tile ---
+	"""
+	# Given
+	import utils_waterfrequency
+	profile = dict(driver="GTiff", dtype="uint16", count=1, width=8, height=8, crs="EPSG:32633",
+		transform=rio.transform.from_origin(600000, 5300000, 30, 30))
+	for name, value in (("B3.TIF", 12000), ("B7.TIF", 5500)):
+		with rio.open(str(tmp_path / name), "w", **profile) as dst:
+			dst.write(np.full((8, 8), value, dtype=np.uint16), 1)
+	grid = TargetGrid("EPSG:32633", profile["transform"], (8, 8))
+	opened = []
+	rio_open = rio.open
+	monkeypatch.setattr(rio, "open", lambda url, *args, **kwargs: opened.append(url) or rio_open(url, *args, **kwargs))
+	utils_waterfrequency._open_rasters.clear()
+
+	# when
+	tiles = [read_ndwi_tile((str(tmp_path / "B3.TIF"), str(tmp_path / "B7.TIF"), grid, out_window,
+			-0.1, 2e-05, -0.1, 2e-05, 65535, 1))
+		for _, out_window in grid.tiles(profile["transform"], (2, 2))]
+
+	# then
+	assert len(tiles) == 16
+	assert sorted(opened) == [str(tmp_path / "B3.TIF"), str(tmp_path / "B7.TIF")]
+
+
+def test_read_ndwi_tile_decimated(tmp_path):
+	"""
+	--- Check if a decimated read gives the NDWI of the coarser grid with the same georeferencing ---
+	"""
+	# Given
+	profile = dict(driver="GTiff", dtype="uint16", count=1, width=8, height=4, crs="EPSG:32633",
+		transform=rio.transform.from_origin(600000, 5300000, 30, 30))
+	water = np.kron(np.array([[1, 0, 0, 1], [0, 0, 1, 1]]), np.ones((2, 2))).astype(bool)
+	for name, band in (("B3.TIF", np.where(water, 12000, 10000)), ("B7.TIF", np.where(water, 5500, 15000))):
+		with rio.open(str(tmp_path / name), "w", **profile) as dst:
+			dst.write(band.astype(np.uint16), 1)
+	grid = TargetGrid("EPSG:32633", rio.transform.from_origin(600000, 5300000, 60, 60), (2, 4))
+	out_window = rio.windows.Window(0, 0, 4, 2)
+	task = (str(tmp_path / "B3.TIF"), str(tmp_path / "B7.TIF"), grid, out_window, -0.1, 2e-05, -0.1, 2e-05, 65535, 2)
+
+	# when
+	tile_window, ndwi = read_ndwi_tile(task)
+
+	# then
+	assert decimated_transform(profile["transform"], 2) == grid.transform
+	assert ndwi.shape == (2, 4)
+	assert np.array_equal(ndwi >= 0.3, water[::2, ::2])
+
+
+
+def test_instrumentation(tmp_path, capsys):
+	"""
+	--- Check if spans and events are only recorded while enabled and if bytes, pixels and latencies are aggregated ---
+	"""
+	# Given
+	events_file = tmp_path / "events.jsonl"
+	mtl = ["REFLECTANCE_MULT_BAND_3 = 2.0000E-05\n", "SPACECRAFT_ID = \"LANDSAT_8\"\n", "END\n"]
+	collector.clear()
+
+	# when
+	with measure("scene", scene="A") as disabled_record:
+		parse_mtl(mtl)
+	n_disabled = len(collector.events)
+	printed = capsys.readouterr().out
+
+	enable_instrumentation(str(events_file))
+	try:
+		for scene_id in ["A", "B"]:
+			with measure("scene", scene=scene_id) as record:
+				parse_mtl(mtl)
+				add_io(record, {"green": 100, "swir": 100}, pixels=50, read_s=0.1)
+	finally:
+		disable_instrumentation()
+	summary = collector.summary()
+	events = [json.loads(line) for line in events_file.read_text().splitlines()]
+
+	# then
+	assert disabled_record is None and n_disabled == 0
+	assert "Could convert 1 items" in printed
+	assert capsys.readouterr().out == ""
+	assert [event["event"] for event in events] == ["mtl_parsed", "span", "mtl_parsed", "span"]
+	assert events[0]["floats"] == 1 and events[1]["scene"] == "A"
+	assert summary["stages"]["scene"]["calls"] == 2
+	assert summary["stages"]["scene"]["read_s"] == 0.2
+	assert summary["bytes_read_per_asset"] == {"green": 200, "swir": 200}
+	assert summary["pixels"] == 100
+	assert summary["scene_latency"]["histogram"]["le_1s"] == 2
+	collector.clear()
+
+
+
+def test_WaterFrequencyAccumulator():
+	"""
+	--- Check if tiles of several scenes add up to the water frequency and pixels without observation are NaN ---
+	"""
+	# Given
+	accumulator = WaterFrequencyAccumulator((2, 4), threshold=0.3)
+	left = rio.windows.Window(0, 0, 2, 2)
+	right = rio.windows.Window(2, 0, 2, 2)
+
+	# when
+	for ndwi in [np.array([[0.5, 0.1, 0.4, np.nan], [0.2, 0.2, 0.6, np.nan]]),
+			np.array([[0.5, 0.5, 0.1, np.nan], [np.nan, 0.2, 0.6, np.nan]])]:
+		accumulator.add(ndwi[:, :2], left)
+		accumulator.add(ndwi[:, 2:], right)
+
+	# then
+	expected = np.array([[1.0, 0.5, 0.5, np.nan], [0.0, 0.0, 1.0, np.nan]])
+	assert np.array_equal(accumulator.frequency(), expected, equal_nan=True)
+	assert np.array_equal(accumulator.frequency(right), expected[:, 2:], equal_nan=True)
+	assert np.array_equal(accumulator.valid_count(right), [[2, 0], [2, 0]])
+
+
+
+def test_WaterStatisticsReducer():
+	"""
+	--- Check if all statistics of one pass match the water frequency of each threshold, month and date ---
+	"""
+	# Given
+	reducer = WaterStatisticsReducer((2, 2), thresholds=(0.3, 0.0), histogram_edges=[0.5])
+	scenes = [("2019-06-01", np.array([[0.6, 0.1], [-0.2, np.nan]])),
+		("2019-07-15", np.array([[0.4, -0.1], [0.35, np.nan]])),
+		("2020-06-20", np.array([[0.2, 0.05], [np.nan, np.nan]]))]
+
+	# when
+	for date, ndwi in scenes:
+		reducer.add(ndwi[:, :1], rio.windows.Window(0, 0, 1, 2), date)
+		reducer.add(ndwi[:, 1:], rio.windows.Window(1, 0, 1, 2), date)
+	bands = dict(zip(reducer.band_names(), reducer.bands()))
+
+	# then
+	for threshold in [0.3, 0.0]:
+		accumulator = WaterFrequencyAccumulator((2, 2), threshold=threshold)
+		for date, ndwi in scenes:
+			accumulator.add(ndwi)
+		assert np.array_equal(bands["water_frequency_{}".format(threshold)], accumulator.frequency(), equal_nan=True)
+		assert np.array_equal(accumulator.valid_count(), reducer.valid_count())
+	assert np.array_equal(bands["water_frequency_month_06"], [[0.5, 0.0], [0.0, np.nan]], equal_nan=True)
+	assert np.array_equal(bands["water_frequency_month_07"], [[1.0, 0.0], [1.0, np.nan]], equal_nan=True)
+	assert np.isnan(bands["water_frequency_month_01"]).all()
+	assert np.array_equal(bands["first_water"], [[20190601, np.nan], [20190715, np.nan]], equal_nan=True)
+	assert np.array_equal(bands["last_water"], [[20190715, np.nan], [20190715, np.nan]], equal_nan=True)
+	assert np.array_equal(bands["valid_observations"], [[3, 3], [2, 0]])
+	assert np.array_equal(bands["ndwi_histogram_0.5_inf"], [[1, 0], [0, 0]])
+	assert np.array_equal(reducer.bands(rio.windows.Window(1, 0, 1, 2)), reducer.bands()[:, :, 1:], equal_nan=True)
+
+
+
+def test_checkpoint(tmp_path):
+	"""
+	--- Check if a resumed accumulator continues with the counters and scenes of the checkpoint of the same run ---
+	"""
+	# Given
+	path = str(tmp_path / "site_checkpoint.npz")
+	run_hash = config_hash([16.5, 47.6, 17.0, 47.9], "2019-06-01/2019-08-31", 3)
+	scenes = [np.array([[0.5, 0.1], [np.nan, 0.4]]), np.array([[0.2, 0.6], [0.1, np.nan]])]
+	reducer = WaterStatisticsReducer((2, 2), thresholds=(0.3, 0.0))
+	reducer.add(scenes[0], date="2019-06-01")
+
+	# when
+	save_checkpoint(path, reducer, ["LC81890272019152"], run_hash)
+	resumed = WaterStatisticsReducer((2, 2), thresholds=(0.3, 0.0))
+	resumed_scenes = load_checkpoint(path, resumed, run_hash)
+	other_run = load_checkpoint(path, WaterStatisticsReducer((2, 2)), config_hash("other settings"))
+	for accumulator in [reducer, resumed]:
+		accumulator.add(scenes[1], date="2019-06-17")
+
+	# then
+	assert resumed_scenes == ["LC81890272019152"]
+	assert other_run == []
+	assert load_checkpoint(str(tmp_path / "missing.npz"), resumed, run_hash) == []
+	assert np.array_equal(resumed.bands(), reducer.bands(), equal_nan=True)
+	assert not os.path.exists(path + ".tmp")
+
+
+
+def test_TargetGrid_from_bbox():
+	"""
+	--- Check if the grid covers the bounding box and its pixel edges lie on the lattice of the scene ---
+	"""
+	# Given
+	bbox = [16.516, 47.595, 17.018, 47.974]
+	origin = (600015.0, 5330085.0)
+
+	# when
+	grid = TargetGrid.from_bbox(bbox, "EPSG:4326", "EPSG:32633", 30, origin=origin)
+
+	# then
+	assert (grid.transform.c - origin[0]) % 30 == 0
+	assert (grid.transform.f - origin[1]) % 30 == 0
+	assert grid.shape == (1433, 1287)
+
+
+
+def test_TargetGrid_tiles():
+	"""
+	--- Check if the tiles of the grid read whole blocks of the scene which defined the grid ---
+	"""
+	# Given
+	bbox = [16.516, 47.595, 17.018, 47.974]
+	scene_transform = rio.transform.from_origin(560000 - 15, 5340000 + 15, 30, 30)
+	grid = TargetGrid.from_bbox(bbox, "EPSG:4326", "EPSG:32633", 30, origin=(scene_transform.c, scene_transform.f))
+
+	# when
+	tiles = grid.tiles(scene_transform, (512, 512))
+	src_windows = [remap_index(grid, "EPSG:32633", scene_transform, out_window).src_window for _, out_window in tiles]
+
+	# then
+	assert src_windows[0].col_off % 512 != 0
+	assert [w for w, _ in tiles] == src_windows
+	assert all(w.col_off // 512 == (w.col_off + w.width - 1) // 512 for w in src_windows)
+	assert all(w.row_off // 512 == (w.row_off + w.height - 1) // 512 for w in src_windows)
+	assert sum(w.width * w.height for _, w in tiles) == grid.shape[0] * grid.shape[1]
+
+
+
+def test_remap_index():
+	"""
+	--- Check if scenes of another path/row are resampled to the target grid and the index is cached ---
+	"""
+	# Given
+	grid = TargetGrid("EPSG:32633", rio.transform.from_origin(600000, 5300000, 30, 30), (4, 6))
+	# scene with a lattice shifted by 40 m (1 1/3 pixels) to the west and 2 pixels to the north
+	src_transform = rio.transform.from_origin(600000 - 40, 5300000 + 60, 30, 30)
+	src_array = np.arange(100).reshape(10, 10)
+	window = rio.windows.Window(2, 1, 4, 3)
+
+	# when
+	index = remap_index(grid, "EPSG:32633", src_transform, window)
+	tile = index.remap(src_array[index.src_window.toslices()])
+	index_utm32 = remap_index(grid, "EPSG:32632", rio.transform.from_origin(1000000, 5400000, 30, 30), window)
+
+	# then
+	assert remap_index(grid, "EPSG:32633", src_transform, window) is index
+	assert index.rows.ndim == 1
+	assert index.src_window == rio.windows.Window(3, 3, 4, 3)
+	assert tile.tolist() == [[33, 34, 35, 36], [43, 44, 45, 46], [53, 54, 55, 56]]
+	assert index_utm32.rows.shape == (3, 4)
+
+
+
+def test_NDWIStore(tmp_path):
+	"""
+	--- Check if the NDWI of the scenes is kept on disk and the water frequency is calculated for any threshold and season ---
+	"""
+	# Given
+	grid = TargetGrid("EPSG:32633", rio.transform.from_origin(600000, 5300000, 30, 30), (3, 2))
+	store = NDWIStore.create(str(tmp_path / "store"), grid, max_scenes=3)
+	scenes = [("LC81890272020102", "2020-04-11", [[0.5, 0.1], [0.35, np.nan], [0.2, 0.2]]),
+		("LC81900272020093", "2020-04-02", [[0.5, 0.5], [0.1, np.nan], [0.2, 0.6]]),
+		("LC81890272020166", "2020-06-14", [[0.1, 0.5], [0.35, np.nan], [np.nan, 0.6]])]
+	for scene_id, date, ndwi in scenes:
+		index = store.add_scene(scene_id, date)
+		# two tiles of one row and of two rows
+		store.write(index, np.array(ndwi[:1]), rio.windows.Window(0, 0, 2, 1))
+		store.write(index, np.array(ndwi[1:]), rio.windows.Window(0, 1, 2, 2))
+	store.flush()
+
+	# when
+	reopened = NDWIStore(str(tmp_path / "store"))
+	all_scenes = water_frequency_from_store(reopened, threshold=0.3, chunk_rows=2)
+	april = water_frequency_from_store(reopened, threshold=0.3, start="2020-04-01", end="2020-04-30")
+	summer_high = water_frequency_from_store(reopened, threshold=0.55, months=[6, 7, 8])
+
+	# then
+	assert reopened.scenes == ["LC81890272020102", "LC81900272020093", "LC81890272020166"]
+	assert reopened.grid.shape == (3, 2)
+	assert np.allclose(all_scenes, [[2 / 3, 2 / 3], [2 / 3, np.nan], [0, 2 / 3]], equal_nan=True)
+	assert np.allclose(april, [[1, 0.5], [0.5, np.nan], [0, 0.5]], equal_nan=True)
+	assert np.allclose(summer_high, [[0, 0], [0, np.nan], [np.nan, 1]], equal_nan=True)
+
+
+
+def test_import_time():
+	"""
+	--- Check if importing the pipeline stays within a generous startup budget and does not load the plotting, search and debugging modules ---
+	"""
+	# Given
+	# several times the usual import time, as it depends on the machine and the disk cache (IMPORT_TIME_BUDGET_S overrides it)
+	budget_s = float(os.environ.get("IMPORT_TIME_BUDGET_S", "2.0"))
+	module_dir = os.path.dirname(os.path.abspath(__file__))
+
+	# when
+	result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import waterfrequency"],
+		cwd=module_dir, capture_output=True, text=True, check=True)
+	# stderr lines: "import time: self [us] | cumulative | imported package"
+	imports = {}
+	for line in result.stderr.splitlines()[1:]:
+		_, cumulative, name = line.split("|")
+		imports[name.strip()] = int(cumulative)
+
+	# then
+	assert not [name for name in imports if name.split(".")[0] in ("matplotlib", "satsearch", "pytest", "pdb")]
+	assert imports["waterfrequency"] / 1e6 < budget_s
+	# star imports of utils_waterfrequency still get Search
+	import utils_waterfrequency
+	assert "Search" in utils_waterfrequency.__all__
@@ -1,11 +1,195 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import json
+import time
+import hashlib
+import contextlib
+import importlib
 import numpy as np
 import rasterio as rio
 import pyproj
-from satsearch import Search
 from datetime import datetime
+from collections import OrderedDict
+
+## satsearch is only needed for the search and imported by satellite_search_AWS, Search can still be taken from
+## this module (PEP 562), a star import gets it as well (see __all__ at the end of the module)
+_LAZY_IMPORTS = {"Search": ("satsearch", "Search")}
+
+
+def __getattr__(name):
+	if name not in _LAZY_IMPORTS:
+		raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+	module_name, attribute = _LAZY_IMPORTS[name]
+	value = getattr(importlib.import_module(module_name), attribute)
+	globals()[name] = value
+	return value
+
+########## ------- Opt-in instrumentation of the satellite pipeline ------- ##########
+## Enable with enable_instrumentation() or by setting the environment variable WATERFREQUENCY_INSTRUMENT=1,
+## the events are then also appended as JSON lines to the file WATERFREQUENCY_EVENTS (if set).
+## While disabled, progress() prints its message and measure() returns a context manager which does nothing.
+
+_INSTRUMENTATION = {"enabled": os.environ.get("WATERFREQUENCY_INSTRUMENT", "0") == "1",
+	"events_path": os.environ.get("WATERFREQUENCY_EVENTS")}
+
+# upper bounds in seconds of the buckets of the scene latency histogram
+SCENE_LATENCY_BUCKETS = (1, 2, 5, 10, 30, 60, 120, float("inf"))
+
+
+class PipelineCollector:
+	"""
+	--- Collect the events and stage spans of the pipeline and aggregate them ----
+	Each event is a dictionary with the name of the event, its time and further fields, stage spans are events
+	"span" with the name of the stage, wall time, bytes read per asset and processed pixels.
+	"""
+
+	def __init__(self):
+		self.events = []
+
+	def emit(self, event, **fields):
+		record = {"event": event, "time": datetime.now().isoformat()}
+		record.update(fields)
+		self.events.append(record)
+		if _INSTRUMENTATION["events_path"]:
+			with open(_INSTRUMENTATION["events_path"], "a") as dst:
+				dst.write(json.dumps(record, default=str) + "\n")
+		return record
+
+	def clear(self):
+		self.events = []
+
+	def summary(self, since=0):
+		"""
+		--- Aggregate the spans per stage, the bytes read per asset and the latency of the scenes ----
+		since : index of the first event to aggregate, eg. len(collector.events) at the start of a run
+		return dictionary with the stages, assets, number of scenes and pixels and the scene latency histogram
+		"""
+		stages = {}
+		assets = {}
+		latencies = []
+		for record in self.events[since:]:
+			if record["event"] != "span":
+				continue
+			total = stages.setdefault(record["name"], {"calls": 0, "wall_time_s": 0.0, "bytes_read": 0, "pixels": 0})
+			total["calls"] += 1
+			total["wall_time_s"] += record["wall_time_s"]
+			total["bytes_read"] += sum(record["bytes_read"].values())
+			total["pixels"] += record["pixels"]
+			# times of sub-steps, eg. read_s and ndwi_s summed over the tiles of a scene (which may run in parallel)
+			for key in ("read_s", "ndwi_s"):
+				if key in record:
+					total[key] = total.get(key, 0.0) + record[key]
+			for asset, n_bytes in record["bytes_read"].items():
+				assets[asset] = assets.get(asset, 0) + n_bytes
+			if record["name"] == "scene":
+				latencies.append(record["wall_time_s"])
+
+		histogram = {}
+		lower = 0
+		for upper in SCENE_LATENCY_BUCKETS:
+			label = "le_{}s".format(upper) if upper != float("inf") else "gt_{}s".format(lower)
+			histogram[label] = sum(lower < latency <= upper for latency in latencies)
+			lower = upper
+		latency = {"histogram": histogram}
+		if latencies:
+			latency.update(zip(["p50_s", "p95_s", "max_s"], np.percentile(latencies, [50, 95, 100]).tolist()))
+		return {"stages": stages, "bytes_read_per_asset": assets, "scenes": len(latencies),
+			"pixels": stages.get("scene", {}).get("pixels", 0), "scene_latency": latency}
+
+	def to_jsonl(self, path):
+		"""
+		--- Write one JSON line per event ----
+		path : output file, existing files are extended
+		"""
+		with open(path, "a") as dst:
+			for record in self.events:
+				dst.write(json.dumps(record, default=str) + "\n")
+
+
+collector = PipelineCollector()
+
+
+def enable_instrumentation(events_path=None):
+	"""
+	--- Start recording the events of the pipeline into the collector ----
+	events_path : optional file to which each event is appended as a JSON line
+	"""
+	_INSTRUMENTATION["enabled"] = True
+	_INSTRUMENTATION["events_path"] = events_path
+
+
+def disable_instrumentation():
+	_INSTRUMENTATION["enabled"] = False
+	_INSTRUMENTATION["events_path"] = None
+
+
+def instrumentation_enabled():
+	return _INSTRUMENTATION["enabled"]
+
+
+class _Span:
+	"""
+	--- Context manager recording a stage of the pipeline ----
+	"""
+
+	def __init__(self, name, fields):
+		self.record = {"name": name, "wall_time_s": None, "bytes_read": {}, "pixels": 0}
+		self.record.update(fields)
+
+	def __enter__(self):
+		self._t_start = time.perf_counter()
+		return self.record
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.record["wall_time_s"] = time.perf_counter() - self._t_start
+		if exc_type is not None:
+			self.record["error"] = repr(exc_value)
+		collector.emit("span", **self.record)
+		return False
+
+
+def measure(name, **fields):
+	"""
+	--- Context manager to time a stage of the pipeline, eg. with measure("scene", scene=item.id) as record: ----
+	name : name of the stage in the collector
+	fields : further fields of the span, eg. the scene id
+	return context manager giving the record of the span (see add_io), or None while the instrumentation is disabled
+	"""
+	if not _INSTRUMENTATION["enabled"]:
+		return contextlib.nullcontext()
+	return _Span(name, fields)
+
+
+def add_io(record, bytes_read=None, pixels=0, **seconds):
+	"""
+	--- Adds bytes read per asset, processed pixels and times of sub-steps to the record of a span ----
+	record : record of measure(), nothing is done for None
+	bytes_read : dictionary with asset name and bytes
+	pixels : number of processed pixels
+	seconds : further times in seconds which are summed up, eg. read_s=0.2
+	"""
+	if record is None:
+		return
+	for asset, n_bytes in (bytes_read or {}).items():
+		record["bytes_read"][asset] = record["bytes_read"].get(asset, 0) + n_bytes
+	record["pixels"] += pixels
+	for key, value in seconds.items():
+		record[key] = record.get(key, 0.0) + value
+
+
+def progress(message, event, **fields):
+	"""
+	--- Reports the progress of the pipeline ----
+	message : text for the user, printed while the instrumentation is disabled
+	event : name of the event emitted while the instrumentation is enabled
+	fields : further fields of the event, eg. the scene id
+	"""
+	if _INSTRUMENTATION["enabled"]:
+		collector.emit(event, message=message, **fields)
+	else:
+		print(message)
 
 
 
@@ -18,6 +202,9 @@ def satellite_search_AWS(bbox, time_period, cloud_cover, collection):
 	collection: string of the satellite version eg. "landsat-8-l1" or "sentinel-s1-l1c"
 	return satstac.itemcollection.ItemCollection
 	"""
+	# only needed for the search, not by the worker processes reading the tiles
+	from satsearch import Search
+
 	## Check if collection exists in AWS
 	collection_query = {"collection": {"eq": collection}}
 	collection_expression = Search(query=collection_query)
@@ -50,7 +237,8 @@ def satellite_search_AWS(bbox, time_period, cloud_cover, collection):
 	# execute search on AWS Open Data Registry
 	search_result = Search(bbox=bbox, query=query, datetime=time_period)
 	# show user the number of scenes
-	print("{} satellite scenes were found".format(search_result.found())) 
+	found = search_result.found()
+	progress("{} satellite scenes were found".format(found), "search", found=found, collection=collection)
 	items = search_result.items()
 
 	return items
@@ -145,7 +333,8 @@ def parse_mtl(metadata):
 		except ValueError:
 			v = str(v)
 			rest[k] = v
-	print("Could convert", len(params), "items from a satellite metafile to float and added them to output,\nall other items were added as strings", len(rest), "items.")
+	progress("Could convert {} items from a satellite metafile to float and added them to output,\nall other items were added as strings {} items.".format(len(params), len(rest)),
+		"mtl_parsed", floats=len(params), strings=len(rest))
 
 	return params
 
@@ -179,3 +368,647 @@ def calc_ndwi(green, swir):
 	ndwi = (green - swir) / (green + swir)
 	return ndwi
 
+
+
+def block_windows(window, block_shape):
+	"""
+	--- Splits a window into blocks which are aligned to the internal tiling of a raster ---
+	window : rasterio.windows.Window in pixel coordinates of the raster
+	block_shape : tuple (rows, cols) of the internal blocks of the raster, eg. src.block_shapes[0]
+	return list of tuples (window in the raster, window in the array of the whole window)
+	"""
+	block_rows, block_cols = block_shape
+	row_off, col_off = int(window.row_off), int(window.col_off)
+	height, width = int(window.height), int(window.width)
+
+	def edges(offset, size, block):
+		# first block boundary after the offset, then every block size
+		start = (offset // block + 1) * block
+		return [offset] + list(range(start, offset + size, block)) + [offset + size]
+
+	tiles = []
+	row_edges = edges(row_off, height, block_rows)
+	col_edges = edges(col_off, width, block_cols)
+	for top, bottom in zip(row_edges[:-1], row_edges[1:]):
+		for left, right in zip(col_edges[:-1], col_edges[1:]):
+			src_window = rio.windows.Window(left, top, right - left, bottom - top)
+			out_window = rio.windows.Window(left - col_off, top - row_off, right - left, bottom - top)
+			tiles.append((src_window, out_window))
+	return tiles
+
+
+# opened rasters of a (worker) process, so the headers of a scene are only read once per process,
+# the least recently used raster is closed beyond OPEN_RASTERS_SIZE (both bands of the current and the previous scene)
+_open_rasters = OrderedDict()
+OPEN_RASTERS_SIZE = 4
+
+def open_raster(url):
+	"""
+	--- Opens a raster once per process and keeps it open for reading further tiles ---
+	url : path or URL of the raster
+	return rasterio.io.DatasetReader
+	"""
+	src = _open_rasters.get(url)
+	if src is not None:
+		_open_rasters.move_to_end(url)
+		return src
+
+	src = _open_rasters[url] = rio.open(url)
+	while len(_open_rasters) > OPEN_RASTERS_SIZE:
+		_, old_src = _open_rasters.popitem(last=False)
+		old_src.close()
+	return src
+
+
+class TargetGrid:
+	"""
+	--- Common output grid of a site, every scene is resampled to it before the accumulation ---
+	crs : crs of the grid given as string, eg. "EPSG:32633"
+	transform : affine transformation of the grid (north up)
+	shape : tuple (rows, cols) of the grid
+	"""
+
+	def __init__(self, crs, transform, shape):
+		self.crs = str(crs)
+		self.transform = transform
+		self.shape = tuple(int(n) for n in shape)
+
+	@classmethod
+	def from_bbox(cls, bbox, bbox_crs, crs, resolution, origin=(0.0, 0.0)):
+		"""
+		--- Grid covering a bounding box, with pixel edges on the lattice of a scene ---
+		bbox : list of coordinates [xmin, ymin, xmax, ymax]
+		bbox_crs : crs of bounding box given as string, eg. "epsg:4326"
+		crs : crs of the grid, eg. the crs of the first scene
+		resolution : pixel size of the grid in units of its crs
+		origin : tuple (x, y) of a pixel corner of the lattice, eg. the upper left corner of the first scene
+		return TargetGrid
+		"""
+		transformer = pyproj.Transformer.from_crs(bbox_crs, str(crs), always_xy=True)
+		# points along the edges of the bbox, the edges are curved in the crs of the grid
+		steps = np.linspace(0, 1, 21)
+		xs = np.r_[bbox[0] + steps * (bbox[2] - bbox[0]), np.full(21, bbox[2]),
+			bbox[0] + steps * (bbox[2] - bbox[0]), np.full(21, bbox[0])]
+		ys = np.r_[np.full(21, bbox[1]), bbox[1] + steps * (bbox[3] - bbox[1]),
+			np.full(21, bbox[3]), bbox[1] + steps * (bbox[3] - bbox[1])]
+		x, y = transformer.transform(xs, ys)
+
+		x0, y0 = origin
+		xmin = x0 + np.floor((np.min(x) - x0) / resolution) * resolution
+		xmax = x0 + np.ceil((np.max(x) - x0) / resolution) * resolution
+		ymin = y0 + np.floor((np.min(y) - y0) / resolution) * resolution
+		ymax = y0 + np.ceil((np.max(y) - y0) / resolution) * resolution
+		shape = (int(round((ymax - ymin) / resolution)), int(round((xmax - xmin) / resolution)))
+		return cls(crs, rio.transform.from_origin(xmin, ymax, resolution, resolution), shape)
+
+	@property
+	def key(self):
+		return (self.crs, tuple(self.transform)[:6], self.shape)
+
+	def tiles(self, src_transform, block_shape):
+		"""
+		--- Splits the grid into tiles which are aligned to the internal tiling of a scene on the same lattice ---
+		src_transform : affine transformation of the scene, eg. the scene which defined the grid
+		block_shape : tuple (rows, cols) of the internal blocks of the scene, eg. src.block_shapes[0]
+		return list of tuples (window in the scene, window in the grid), see block_windows
+		"""
+		# pixel offset of the grid in the scene, the tile edges then fall on the block boundaries of the scene
+		col_off, row_off = ~src_transform * (self.transform.c, self.transform.f)
+		window = rio.windows.Window(int(round(col_off)), int(round(row_off)), self.shape[1], self.shape[0])
+		return block_windows(window, block_shape)
+
+
+class RemapIndex:
+	"""
+	--- Pixel of a source raster for every pixel of a tile of the target grid (nearest neighbour) ---
+	src_window : rasterio.windows.Window of the source raster covering the tile
+	rows, cols : row and column in the source window, 1-dimensional if rows and columns of the grids are parallel
+	"""
+
+	def __init__(self, src_window, rows, cols):
+		self.src_window = src_window
+		self.rows = rows
+		self.cols = cols
+
+	def remap(self, src_array):
+		"""
+		--- Resamples an array read from the source window to the tile of the target grid ---
+		src_array : array of the source window
+		return array with the shape of the tile
+		"""
+		if self.rows.ndim == 1:
+			return src_array[np.ix_(self.rows, self.cols)]
+		return src_array[self.rows, self.cols]
+
+
+# remap indices per source grid and tile, scenes of the same path/row share them
+_remap_cache = OrderedDict()
+REMAP_CACHE_SIZE = 512
+
+def remap_index(grid, src_crs, src_transform, window):
+	"""
+	--- Cached RemapIndex of a tile of the target grid for a source grid ---
+	grid : TargetGrid
+	src_crs : crs of the source raster
+	src_transform : affine transformation of the source raster
+	window : rasterio.windows.Window of the tile in the target grid
+	return RemapIndex
+	"""
+	key = (grid.key, str(src_crs), tuple(src_transform)[:6],
+		(window.col_off, window.row_off, window.width, window.height))
+	index = _remap_cache.get(key)
+	if index is not None:
+		_remap_cache.move_to_end(key)
+		return index
+
+	# centers of the pixels of the tile
+	t = grid.transform
+	x = t.c + (np.arange(window.col_off, window.col_off + window.width) + 0.5) * t.a
+	y = t.f + (np.arange(window.row_off, window.row_off + window.height) + 0.5) * t.e
+	inv = ~src_transform
+	separable = str(src_crs) == grid.crs and inv.b == 0 and inv.d == 0
+	if separable:
+		# same crs and north up: the source column only depends on x and the row on y
+		cols = np.floor(inv.a * x + inv.c).astype(np.int64)
+		rows = np.floor(inv.e * y + inv.f).astype(np.int64)
+	else:
+		xx, yy = np.meshgrid(x, y)
+		if str(src_crs) != grid.crs:
+			transformer = pyproj.Transformer.from_crs(grid.crs, str(src_crs), always_xy=True)
+			xx, yy = transformer.transform(xx, yy)
+		cols = np.floor(inv.a * xx + inv.b * yy + inv.c).astype(np.int64)
+		rows = np.floor(inv.d * xx + inv.e * yy + inv.f).astype(np.int64)
+
+	row_off, col_off = int(rows.min()), int(cols.min())
+	src_window = rio.windows.Window(col_off, row_off,
+		int(cols.max()) - col_off + 1, int(rows.max()) - row_off + 1)
+	index = RemapIndex(src_window, (rows - row_off).astype(np.int32), (cols - col_off).astype(np.int32))
+
+	_remap_cache[key] = index
+	while len(_remap_cache) > REMAP_CACHE_SIZE:
+		_remap_cache.popitem(last=False)
+	return index
+
+
+def decimated_transform(transform, decimation):
+	"""
+	--- Affine transformation of a raster read with a pixel size decimation times larger ---
+	transform : affine transformation of the raster
+	decimation : integer factor of the pixel size, 1 for full resolution
+	return affine.Affine
+	"""
+	return transform * rio.Affine.scale(decimation)
+
+
+def read_ndwi(green_url, swir_url, src_window, green_add, green_mult, swir_add, swir_mult, fill_value, decimation=1,
+		stats=None):
+	"""
+	--- Reads a window of the green and the swir band of a scene and calculates its NDWI ---
+	green_url, swir_url : path or URL of band 3 and band 7
+	src_window : rasterio.windows.Window of the scene, pixels outside the scene get the fill value
+	green_add, green_mult, swir_add, swir_mult : parameters for the conversion to ToA reflectance
+	fill_value : value of pixels outside the scene
+	decimation : integer factor of the pixel size, src_window is then given in pixels of the decimated raster
+		(see decimated_transform) and the bands are read from the overviews of the COGs
+	stats : optional dictionary for add_io(), gets the read time and the bytes of the decoded bands
+	return NDWI as float32 array with NaN for invalid pixels
+	"""
+	read_window, out_shape = src_window, None
+	if decimation > 1:
+		# GDAL reads a smaller output shape from the closest overview instead of the full resolution
+		read_window = rio.windows.Window(src_window.col_off * decimation, src_window.row_off * decimation,
+			src_window.width * decimation, src_window.height * decimation)
+		out_shape = (int(src_window.height), int(src_window.width))
+	t_start = time.perf_counter()
+	green = open_raster(green_url).read(1, window=read_window, out_shape=out_shape, boundless=True, fill_value=fill_value)
+	swir = open_raster(swir_url).read(1, window=read_window, out_shape=out_shape, boundless=True, fill_value=fill_value)
+	if stats is not None:
+		add_io(stats, {"green": green.nbytes, "swir": swir.nbytes}, read_s=time.perf_counter() - t_start)
+
+	# Create a binary array indicating pixels which contain valid data
+	valid_pixels = (green != fill_value) & (swir > 0) & (green > 0)
+
+	green_toa = to_toa(green.astype(np.float32), np.float32(green_add), np.float32(green_mult))
+	swir_toa = to_toa(swir.astype(np.float32), np.float32(swir_add), np.float32(swir_mult))
+	with np.errstate(divide="ignore", invalid="ignore"):
+		ndwi = calc_ndwi(green_toa, swir_toa)
+	ndwi[~valid_pixels] = np.nan
+
+	return ndwi
+
+
+def read_ndwi_tile(task, stats=None):
+	"""
+	--- Calculates the NDWI of a scene for one tile of the target grid ---
+	task : tuple (green_url, swir_url, grid, out_window, green_add, green_mult, swir_add, swir_mult, fill_value,
+		decimation), decimation > 1 reads the scene at a decimation times larger pixel size (see read_ndwi)
+	stats : optional dictionary for add_io(), see read_ndwi
+	return tuple (out_window, NDWI as float32 array with NaN for invalid pixels)
+	"""
+	green_url, swir_url, grid, out_window, green_add, green_mult, swir_add, swir_mult, fill_value, decimation = task
+	src = open_raster(green_url)
+	index = remap_index(grid, src.crs, decimated_transform(src.transform, decimation), out_window)
+	ndwi = read_ndwi(green_url, swir_url, index.src_window,
+		green_add, green_mult, swir_add, swir_mult, fill_value, decimation, stats)
+
+	return out_window, index.remap(ndwi)
+
+
+def read_ndwi_tile_measured(task):
+	"""
+	--- read_ndwi_tile which also returns the measurements of the tile, the stats are sent back from a worker process ---
+	task : see read_ndwi_tile
+	return tuple (out_window, NDWI, dictionary for add_io() with bytes_read, pixels, read_s and ndwi_s)
+	"""
+	stats = {"bytes_read": {}, "pixels": 0}
+	t_start = time.perf_counter()
+	out_window, ndwi = read_ndwi_tile(task, stats)
+	stats["ndwi_s"] = time.perf_counter() - t_start - stats["read_s"]
+	stats["pixels"] = ndwi.size
+	return out_window, ndwi, stats
+
+
+class WaterFrequencyAccumulator:
+	"""
+	--- Running counts of water and valid observations per pixel, instead of a stack of all NDWI scenes ---
+	shape : tuple (rows, cols) of the output raster
+	threshold : NDWI value from which on a pixel is covered by water
+	"""
+
+	def __init__(self, shape, threshold=0.3):
+		self.shape = tuple(shape)
+		self.threshold = threshold
+		self.water_count = np.zeros(self.shape, dtype=np.uint16)
+		self._valid_count = np.zeros(self.shape, dtype=np.uint16)
+
+	def add(self, ndwi, window=None, date=None):
+		"""
+		--- Adds the NDWI of one scene, or of one tile of a scene ---
+		ndwi : NDWI array with NaN for invalid pixels
+		window : rasterio.windows.Window of the tile in the output raster, None for the whole raster
+		date : acquisition date of the scene (not needed for the water frequency)
+		"""
+		index = (slice(None), slice(None)) if window is None else window.toslices()
+		self.water_count[index] += ndwi >= self.threshold
+		self._valid_count[index] += ~np.isnan(ndwi)
+
+	def frequency(self, window=None):
+		"""
+		--- Water frequency, NaN where no valid observation exists ---
+		window : rasterio.windows.Window of a part of the output raster, None for the whole raster
+		return float64 array
+		"""
+		index = (slice(None), slice(None)) if window is None else window.toslices()
+		valid = self._valid_count[index]
+		with np.errstate(divide="ignore", invalid="ignore"):
+			return np.where(valid > 0, self.water_count[index] / valid, np.nan)
+
+	def state(self):
+		"""
+		--- Counters of the accumulator, eg. for a checkpoint ---
+		return dictionary of arrays
+		"""
+		return {"water_count": self.water_count, "valid_count": self._valid_count}
+
+	def load_state(self, state):
+		"""
+		--- Continues from the counters of state() ---
+		state : dictionary of arrays
+		"""
+		for name, counts in self.state().items():
+			counts[...] = state[name]
+
+	def valid_count(self, window=None):
+		"""
+		--- Number of valid observations per pixel ---
+		window : rasterio.windows.Window of a part of the output raster, None for the whole raster
+		return uint16 array
+		"""
+		index = (slice(None), slice(None)) if window is None else window.toslices()
+		return self._valid_count[index]
+
+	def band_names(self):
+		return ["water_frequency"]
+
+	def bands(self, window=None):
+		"""
+		--- Output bands of a part of the output raster ---
+		window : rasterio.windows.Window of a part of the output raster, None for the whole raster
+		return float64 array (bands, rows, cols)
+		"""
+		return self.frequency(window)[np.newaxis]
+
+
+def _date_number(date):
+	"""
+	--- Date as number YYYYMMDD, which is readable in a raster and keeps the order of the dates ---
+	date : datetime.date or string "YYYY-MM-DD"
+	return int
+	"""
+	return int(str(date)[:10].replace("-", ""))
+
+
+class WaterStatisticsReducer:
+	"""
+	--- Several water statistics per pixel, calculated in a single pass over the scenes ---
+	shape : tuple (rows, cols) of the output raster
+	thresholds : NDWI thresholds of the water frequencies, the first one is used for the monthly frequencies
+		and the first/last water observation
+	monthly : if True, water frequency per month (1-12) over all years
+	first_last : if True, dates (YYYYMMDD) of the first and the last water observation
+	histogram_edges : optional further NDWI bin edges, the number of valid observations per NDWI bin is written
+	The NDWI of a pixel is counted in a histogram with the thresholds and histogram_edges as bin edges,
+	so every frequency is a sum over bins and no NDWI has to be kept.
+	"""
+
+	def __init__(self, shape, thresholds=(0.3,), monthly=True, first_last=True, histogram_edges=None):
+		self.shape = tuple(shape)
+		self.thresholds = [float(t) for t in thresholds]
+		self.threshold = self.thresholds[0]
+		self.monthly = monthly
+		self.first_last = first_last
+		self.histogram_edges = sorted(float(e) for e in histogram_edges) if histogram_edges else []
+		self.edges = np.array(sorted(set(self.thresholds) | set(self.histogram_edges)))
+		# bin 0: NDWI below the first edge, bin i: NDWI from edges[i - 1] to below edges[i]
+		self.histogram = np.zeros((len(self.edges) + 1,) + self.shape, dtype=np.uint16)
+		if monthly:
+			self.monthly_water = np.zeros((12,) + self.shape, dtype=np.uint16)
+			self.monthly_valid = np.zeros((12,) + self.shape, dtype=np.uint16)
+		if first_last:
+			self.first_water = np.full(self.shape, np.iinfo(np.int32).max, dtype=np.int32)
+			self.last_water = np.zeros(self.shape, dtype=np.int32)
+
+	def add(self, ndwi, window=None, date=None):
+		"""
+		--- Adds the NDWI of one scene, or of one tile of a scene ---
+		ndwi : NDWI array with NaN for invalid pixels
+		window : rasterio.windows.Window of the tile in the output raster, None for the whole raster
+		date : acquisition date of the scene (datetime.date or "YYYY-MM-DD"), needed for monthly and first_last
+		"""
+		rows, cols = (slice(None), slice(None)) if window is None else window.toslices()
+		valid = ~np.isnan(ndwi)
+		# quantize the NDWI to its bin and count it, pixel by pixel
+		bins = np.where(valid, np.searchsorted(self.edges, ndwi, side="right"), -1)
+		histogram = self.histogram[:, rows, cols]
+		for i in range(len(histogram)):
+			histogram[i] += bins == i
+
+		if self.monthly or self.first_last:
+			water = valid & (ndwi >= self.threshold)
+			date_number = _date_number(date)
+		if self.monthly:
+			month = date_number // 100 % 100 - 1
+			self.monthly_water[month, rows, cols] += water
+			self.monthly_valid[month, rows, cols] += valid
+		if self.first_last:
+			first = self.first_water[rows, cols]
+			first[water] = np.minimum(first[water], date_number)
+			last = self.last_water[rows, cols]
+			last[water] = np.maximum(last[water], date_number)
+
+	def _index(self, window):
+		return (slice(None), slice(None)) if window is None else window.toslices()
+
+	def valid_count(self, window=None):
+		rows, cols = self._index(window)
+		return self.histogram[:, rows, cols].sum(axis=0)
+
+	def frequency(self, window=None, threshold=None):
+		"""
+		--- Water frequency of a threshold, NaN where no valid observation exists ---
+		window : rasterio.windows.Window of a part of the output raster, None for the whole raster
+		threshold : one of the thresholds or histogram edges, None for the first threshold
+		return float64 array
+		"""
+		threshold = self.threshold if threshold is None else threshold
+		first_bin = int(np.searchsorted(self.edges, threshold, side="right"))
+		if self.edges[first_bin - 1] != threshold:
+			raise ValueError("{} is not one of the thresholds {}".format(threshold, list(self.edges)))
+		rows, cols = self._index(window)
+		histogram = self.histogram[:, rows, cols]
+		valid = histogram.sum(axis=0)
+		with np.errstate(divide="ignore", invalid="ignore"):
+			return np.where(valid > 0, histogram[first_bin:].sum(axis=0) / valid, np.nan)
+
+	def state(self):
+		"""
+		--- Counters of the reducer, eg. for a checkpoint ---
+		return dictionary of arrays
+		"""
+		state = {"histogram": self.histogram}
+		if self.monthly:
+			state.update(monthly_water=self.monthly_water, monthly_valid=self.monthly_valid)
+		if self.first_last:
+			state.update(first_water=self.first_water, last_water=self.last_water)
+		return state
+
+	def load_state(self, state):
+		"""
+		--- Continues from the counters of state() ---
+		state : dictionary of arrays
+		"""
+		for name in self.state():
+			getattr(self, name)[...] = state[name]
+
+	def band_names(self):
+		names = ["water_frequency_{}".format(t) for t in self.thresholds]
+		if self.monthly:
+			names += ["water_frequency_month_{:02d}".format(m) for m in range(1, 13)]
+		if self.first_last:
+			names += ["first_water", "last_water"]
+		names.append("valid_observations")
+		if self.histogram_edges:
+			bounds = [-np.inf] + list(self.edges) + [np.inf]
+			names += ["ndwi_histogram_{}_{}".format(lower, upper) for lower, upper in zip(bounds[:-1], bounds[1:])]
+		return names
+
+	def bands(self, window=None):
+		"""
+		--- All statistics of a part of the output raster, in the order of band_names() ---
+		window : rasterio.windows.Window of a part of the output raster, None for the whole raster
+		return float64 array (bands, rows, cols), NaN where a statistic is not defined
+		"""
+		rows, cols = self._index(window)
+		bands = [self.frequency(window, t) for t in self.thresholds]
+		with np.errstate(divide="ignore", invalid="ignore"):
+			if self.monthly:
+				valid = self.monthly_valid[:, rows, cols]
+				bands += list(np.where(valid > 0, self.monthly_water[:, rows, cols] / valid, np.nan))
+		if self.first_last:
+			last = self.last_water[rows, cols].astype(np.float64)
+			bands.append(np.where(last > 0, self.first_water[rows, cols], np.nan))
+			bands.append(np.where(last > 0, last, np.nan))
+		bands.append(self.valid_count(window).astype(np.float64))
+		if self.histogram_edges:
+			bands += list(self.histogram[:, rows, cols].astype(np.float64))
+		return np.stack(bands)
+
+
+
+def config_hash(*config):
+	"""
+	--- Hash of the settings of a run, a checkpoint is only resumed by a run with the same settings ---
+	config : json serializable settings, eg. bbox, time period, cloud cover
+	return hex string
+	"""
+	return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def save_checkpoint(path, accumulator, scene_ids, run_hash):
+	"""
+	--- Saves the counters of an accumulator and the ids of the scenes added to it ---
+	path : path of the checkpoint (.npz)
+	accumulator : WaterFrequencyAccumulator or WaterStatisticsReducer
+	scene_ids : ids of the scenes which were completely added
+	run_hash : config_hash() of the run
+	The checkpoint is written to a temporary file first and then renamed, so an interrupted write leaves the
+	previous checkpoint intact.
+	"""
+	tmp_path = path + ".tmp"
+	with open(tmp_path, "wb") as dst:
+		np.savez(dst, scene_ids=np.array(scene_ids, dtype=str), run_hash=np.array(run_hash), **accumulator.state())
+	os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, accumulator, run_hash):
+	"""
+	--- Loads the counters of a checkpoint into an accumulator ---
+	path : path of the checkpoint (.npz)
+	accumulator : WaterFrequencyAccumulator or WaterStatisticsReducer with the shape of the checkpoint
+	run_hash : config_hash() of the run
+	return list of the ids of the scenes in the checkpoint, empty if there is no checkpoint of this run
+	"""
+	if not os.path.exists(path):
+		return []
+	with np.load(path, allow_pickle=False) as checkpoint:
+		if str(checkpoint["run_hash"]) != run_hash:
+			print("Checkpoint {} is from a run with other settings and is not used".format(path))
+			return []
+		accumulator.load_state(checkpoint)
+		return [str(scene_id) for scene_id in checkpoint["scene_ids"]]
+
+
+class NDWIStore:
+	"""
+	--- On-disk memory-mapped cube of the NDWI of all scenes of a site, with scene ids, dates and valid masks ---
+	path : directory of the store (meta.json, ndwi.dat, valid.dat)
+	mode : "r" for reading, "r+" for adding scenes
+	"""
+
+	def __init__(self, path, mode="r"):
+		self.path = path
+		self.mode = mode
+		with open(os.path.join(path, "meta.json")) as src:
+			self.meta = json.load(src)
+		cube_shape = (self.meta["max_scenes"],) + tuple(self.meta["shape"])
+		self.ndwi = np.memmap(os.path.join(path, "ndwi.dat"), dtype=self.meta["dtype"], mode=mode, shape=cube_shape)
+		self.valid = np.memmap(os.path.join(path, "valid.dat"), dtype=np.bool_, mode=mode, shape=cube_shape)
+
+	@classmethod
+	def create(cls, path, grid, max_scenes, dtype="float16"):
+		"""
+		--- Creates an empty store for up to max_scenes scenes of the target grid ---
+		path : directory of the store, created if it does not exist
+		grid : TargetGrid of the site
+		max_scenes : number of scenes, eg. the number of items of the search
+		dtype : "float16" or "float32"
+		return NDWIStore opened for adding scenes
+		"""
+		if not os.path.exists(path):
+			os.makedirs(path)
+		meta = {"shape": list(grid.shape), "max_scenes": int(max_scenes), "dtype": dtype,
+			"crs": grid.crs, "transform": list(grid.transform)[:6], "scenes": [], "dates": []}
+		with open(os.path.join(path, "meta.json"), "w") as dst:
+			json.dump(meta, dst)
+		cube_shape = (int(max_scenes),) + tuple(grid.shape)
+		# sparse files, the cube only takes disk space for the scenes written
+		for name, cube_dtype in (("ndwi.dat", dtype), ("valid.dat", np.bool_)):
+			np.memmap(os.path.join(path, name), dtype=cube_dtype, mode="w+", shape=cube_shape).flush()
+		return cls(path, mode="r+")
+
+	@property
+	def scenes(self):
+		return self.meta["scenes"]
+
+	@property
+	def dates(self):
+		return self.meta["dates"]
+
+	@property
+	def grid(self):
+		return TargetGrid(self.meta["crs"], rio.Affine(*self.meta["transform"]), self.meta["shape"])
+
+	def add_scene(self, scene_id, date):
+		"""
+		--- Reserves the plane of the next scene ---
+		scene_id : id of the satellite scene
+		date : acquisition date as string "YYYY-MM-DD"
+		return index of the scene in the cube
+		"""
+		if len(self.scenes) >= self.meta["max_scenes"]:
+			raise ValueError("The NDWI store is full ({} scenes)".format(self.meta["max_scenes"]))
+		self.scenes.append(str(scene_id))
+		self.dates.append(str(date))
+		return len(self.scenes) - 1
+
+	def write(self, index, ndwi, window):
+		"""
+		--- Writes the NDWI of a tile of a scene ---
+		index : index of the scene, see add_scene()
+		ndwi : NDWI array with NaN for invalid pixels
+		window : rasterio.windows.Window of the tile in the target grid
+		"""
+		rows, cols = window.toslices()
+		self.ndwi[index, rows, cols] = ndwi
+		self.valid[index, rows, cols] = ~np.isnan(ndwi)
+
+	def flush(self):
+		self.ndwi.flush()
+		self.valid.flush()
+		with open(os.path.join(self.path, "meta.json"), "w") as dst:
+			json.dump(self.meta, dst)
+
+	def select(self, start=None, end=None, months=None):
+		"""
+		--- Indices of the scenes of a time period and/or season ---
+		start, end : first and last date as string "YYYY-MM-DD", None for no limit
+		months : list of months (1-12), eg. [6, 7, 8] for summer, None for all months
+		return array of scene indices
+		"""
+		return np.array([i for i, date in enumerate(self.dates)
+			if (start is None or date >= start) and (end is None or date <= end)
+			and (months is None or int(date[5:7]) in months)], dtype=np.int64)
+
+
+def water_frequency_from_store(store, threshold=0.3, start=None, end=None, months=None, chunk_rows=256):
+	"""
+	--- Water frequency of a threshold and a selection of scenes, read out-of-core from an NDWIStore ---
+	store : NDWIStore
+	threshold : NDWI value from which on a pixel is covered by water
+	start, end, months : selection of scenes, see NDWIStore.select()
+	chunk_rows : number of rows read at once, bounds the memory to chunk_rows x cols x number of scenes
+	return float64 array, NaN where no valid observation exists
+	"""
+	selected = store.select(start, end, months)
+	rows, cols = store.meta["shape"]
+	water_frequency = np.full((rows, cols), np.nan)
+	if len(selected) == 0:
+		return water_frequency
+
+	for row in range(0, rows, chunk_rows):
+		chunk = slice(row, min(row + chunk_rows, rows))
+		water_count = np.zeros((chunk.stop - row, cols), dtype=np.uint16)
+		valid_count = np.zeros((chunk.stop - row, cols), dtype=np.uint16)
+		# scene by scene, every plane is read sequentially
+		for index in selected:
+			valid = store.valid[index, chunk]
+			water_count += valid & (store.ndwi[index, chunk] >= threshold)
+			valid_count += valid
+		with np.errstate(divide="ignore", invalid="ignore"):
+			water_frequency[chunk] = np.where(valid_count > 0, water_count / valid_count, np.nan)
+
+	return water_frequency
+
+
+## every public name like without __all__, plus the lazily imported ones
+__all__ = [name for name in globals() if not name.startswith("_")] + list(_LAZY_IMPORTS)
@@ -10,23 +10,41 @@ Write tests: Check special cases. Satellite images often show no data values.
 Follow the PEP8 Style guide and refactore (rename) variables for better readability
 """
 
+import contextlib
 import json
 import os
 import math
 import numpy as np
 import rasterio as rio
 import pyproj
-import matplotlib.pyplot as plt
-from utils_waterfrequency import *
-from test_utils_waterfrequency import *
-import pdb
+from concurrent.futures import ProcessPoolExecutor
+# the names are imported explicitly, a star import would also import satsearch (Search)
+from utils_waterfrequency import (NDWIStore, TargetGrid, WaterFrequencyAccumulator, WaterStatisticsReducer, add_io,
+	collector, config_hash, decimated_transform, instrumentation_enabled, load_checkpoint, measure, parse_mtl, progress,
+	read_metafile, read_ndwi_tile, read_ndwi_tile_measured, satellite_search_AWS, save_checkpoint,
+	water_frequency_from_store)
 
 
-def calc_water_frequency(config_site, output_dir):
+def calc_water_frequency(config_site, output_dir, tile_workers=None, ndwi_store=None, statistics=None,
+		checkpoint_every=None, preview_factor=None):
 	"""
 	-----  Calculates the water frequency of a whole satellite time series ------
 	config_site : arguments from Configuration file (.json) indicating for which area(s) the water frequency is proceed
 	output_dir :  argument from Configuration file (.json) indicating the folder where to store the output
+	tile_workers : number of processes reading the tiles of a scene in parallel, None or 1 reads them in this process,
+		can also be set in the configuration of the site ("tile_workers")
+	ndwi_store : directory to keep the NDWI of every scene in a memory-mapped NDWIStore, for calculating the water
+		frequency of other thresholds or seasons later without downloading the scenes again (see
+		water_frequency_from_ndwi_store), can also be set in the configuration of the site ("ndwi_store")
+	statistics : dictionary with the arguments of WaterStatisticsReducer (thresholds, monthly, first_last,
+		histogram_edges), all statistics are calculated in the same pass over the scenes and written as the bands
+		of <name>_waterstatistics.tif, can also be set in the configuration of the site ("statistics")
+	checkpoint_every : number of scenes after which the counters and the ids of the processed scenes are saved to
+		<output_dir>/<name>_checkpoint.npz, a run with the same settings resumes from it and skips the processed
+		scenes, None for no checkpoints, can also be set in the configuration of the site ("checkpoint_every")
+	preview_factor : integer factor of the pixel size for a quick look, the scenes are read from the overviews of
+		the COGs and <name>_waterfrequency_preview.tif covers the same area on a grid with preview_factor times
+		larger pixels, None for full resolution, can also be set in the configuration of the site ("preview_factor")
 	returns TIF file on disk
 	"""
 
@@ -40,10 +58,12 @@ def calc_water_frequency(config_site, output_dir):
 	cloud_cover = config_site["cloud_cover"]
 	collection = "landsat-8-l1"
 
-	items = satellite_search_AWS(bbox, time_period, cloud_cover, collection)
+	# Stage spans and progress events of this run (see enable_instrumentation), summarized at the end
+	first_event = len(collector.events)
+	with measure("search", site=config_site["name"]):
+		items = satellite_search_AWS(bbox, time_period, cloud_cover, collection)
 
-	print(items._collections)
-	print(items.summary())
+	progress("{}\n{}".format(items._collections, items.summary()), "search_result", items=len(items))
 
 	# Create a folder to store the data.
 	scene_dir = r".\scenes"
@@ -56,8 +76,9 @@ def calc_water_frequency(config_site, output_dir):
 
 	# Areas within the bounding box which are not covered by the image are assigned the value 65535, later they are replaced with no value
 	FILL_VALUE = 65535
-	# Store calculated water frequency from each scene in list bands
-	bands = []
+	# Running counts of water and valid observations, the NDWI scenes are not kept in memory
+	accumulator = None
+	grid = None
 	# amount of all scenes, needed for user information
 	total_itemNumber = len(items)
 	# scene which is currently proceed while going through the time series, needed for user information
@@ -66,81 +87,129 @@ def calc_water_frequency(config_site, output_dir):
 	# window coordinates for scene
 	bbox_crs = "EPSG:4326"
 
+	# Each scene is split into tiles along the internal tiling of the COGs, the tiles are read and converted to NDWI
+	# on a pool of processes, so the memory of a worker is bounded by the tile size
+	tile_workers = tile_workers or config_site.get("tile_workers")
 
-	########### ------- STEP 3: --------##############
-	## Calculate NDWI (Normalized difference water index) by going through each satellite scene
-
-	for item in items[:2]:
-		item_counter += 1
-
-		# Load images from URLs by using rasterio
-		band_swir_url = item.assets["B7"]["href"]
-		band_green_url = item.assets["B3"]["href"]
-
-		# Read metadata from each satellite scene
-		mtl = read_metafile(item, scene_dir)
-
-		###### Parsing the metadata files ########
-		reflectance_mult = 'REFLECTANCE_MULT_BAND_'
-		reflectance_add = 'REFLECTANCE_ADD_BAND_'
-		parameters = parse_mtl(mtl)
+	# Quick look at a coarser resolution, the outputs of a preview get their own names
+	preview_factor = int(preview_factor or config_site.get("preview_factor") or 1)
+	suffix = "_preview" if preview_factor > 1 else ""
 
-		# Extract required parameters for conversion to ToA reflectance
-		band_green_mult = parameters[reflectance_mult + '3']
-		band_green_add = parameters[reflectance_add + '3']
-		band_swir_mult = parameters[reflectance_mult + '7']
-		band_swir_add = parameters[reflectance_add + '7']
-	
-		# Read green spectral band (band 3)
-		with rio.open(band_green_url) as src:
-			scene_affine = src.transform
-			scene_crs = src.crs
-			win = get_window_for_scene(bbox, bbox_crs, scene_affine, scene_crs)
-			green = src.read(1, window=win, boundless=True, fill_value=FILL_VALUE)
-	
-		# Read shortwave infrared spectral band (band 7)
-		with rio.open(band_swir_url) as src:
-			scene_affine = src.transform
-			scene_crs = src.crs
-			win = get_window_for_scene(bbox, bbox_crs, scene_affine, scene_crs)
-			swir = src.read(1, window=win, boundless=True, fill_value=FILL_VALUE)
-
-		# Create a binary array indicating pixels which contain valid data
-		valid_pixels = np.where((green != FILL_VALUE) & (swir > 0) & (green > 0), True, False)
+	# The NDWI store keeps full resolution scenes only
+	ndwi_store = (ndwi_store or config_site.get("ndwi_store")) if preview_factor == 1 else None
+	store = None
+	statistics = statistics or config_site.get("statistics")
 
-		# Convert the two spectral bands to ToA reflectance.
-		green_toa = to_toa(green, band_green_add, band_green_mult)
-		swir_toa = to_toa(swir, band_swir_add, band_swir_mult)
-		#plt.imshow(green_toa)
+	# Periodic checkpoints, so an interrupted run does not start again from the first scene
+	checkpoint_every = checkpoint_every or config_site.get("checkpoint_every")
+	checkpoint_path = os.path.join(output_dir, config_site["name"] + suffix + "_checkpoint.npz")
+	processed_scenes = []
 
-		# calculate ndwi
-		ndwi = calc_ndwi(green_toa, swir_toa)
-		#plt.imshow(ndwi)
 
-		# convert invalid pixels to nan
-		ndwi = np.where(valid_pixels, ndwi, np.nan)
-
-		bands.append(ndwi)
+	########### ------- STEP 3: --------##############
+	## Calculate NDWI (Normalized difference water index) by going through each satellite scene
 
-		print("NDWI-Scene {} was append to output list,\nit's the {}. item from {} satellite scenes".format(item, item_counter, total_itemNumber))
+	# the worker processes are shut down when a scene fails as well
+	with (ProcessPoolExecutor(max_workers=tile_workers) if tile_workers and tile_workers > 1
+			else contextlib.nullcontext()) as pool:
+		for item in items[:2]:
+			item_counter += 1
+
+			# Load images from URLs by using rasterio
+			band_swir_url = item.assets["B7"]["href"]
+			band_green_url = item.assets["B3"]["href"]
+
+			# The first scene defines the target grid of the site (crs, pixel size and lattice) and its tiling,
+			# scenes of other path/rows are resampled to it, band 3 and band 7 share the same grid
+			if grid is None:
+				with measure("grid"), rio.open(band_green_url) as src:
+					scene_affine = src.transform
+					grid = TargetGrid.from_bbox(bbox, bbox_crs, src.crs, scene_affine.a * preview_factor,
+						origin=(scene_affine.c, scene_affine.f))
+					# in a preview a block of the scene spans fewer pixels of the decimated grid
+					block_shape = tuple(max(n // preview_factor, 1) for n in src.block_shapes[0])
+					grid_tiles = grid.tiles(decimated_transform(scene_affine, preview_factor), block_shape)
+				if statistics:
+					accumulator = WaterStatisticsReducer(grid.shape, **statistics)
+				else:
+					accumulator = WaterFrequencyAccumulator(grid.shape)
+				run_hash = config_hash(bbox, time_period, cloud_cover, collection, statistics, grid.key)
+				if checkpoint_every:
+					processed_scenes = load_checkpoint(checkpoint_path, accumulator, run_hash)
+					if processed_scenes:
+						progress("Resume from checkpoint {} with {} processed scenes".format(checkpoint_path, len(processed_scenes)),
+							"resume", checkpoint=checkpoint_path, processed=len(processed_scenes))
+				if ndwi_store and processed_scenes:
+					# scenes added to the store after the checkpoint are overwritten
+					store = NDWIStore(ndwi_store, mode="r+")
+					del store.scenes[len(processed_scenes):], store.dates[len(processed_scenes):]
+				elif ndwi_store:
+					store = NDWIStore.create(ndwi_store, grid, total_itemNumber)
+
+			if item.id in processed_scenes:
+				continue
+
+			with measure("scene", scene=item.id) as scene_record:
+				# Read metadata from each satellite scene
+				with measure("mtl", scene=item.id) as mtl_record:
+					mtl = read_metafile(item, scene_dir)
+					add_io(mtl_record, {"MTL": sum(len(line) for line in mtl)})
+
+				###### Parsing the metadata files ########
+				reflectance_mult = 'REFLECTANCE_MULT_BAND_'
+				reflectance_add = 'REFLECTANCE_ADD_BAND_'
+				parameters = parse_mtl(mtl)
+
+				# Extract required parameters for conversion to ToA reflectance
+				band_green_mult = parameters[reflectance_mult + '3']
+				band_green_add = parameters[reflectance_add + '3']
+				band_swir_mult = parameters[reflectance_mult + '7']
+				band_swir_add = parameters[reflectance_add + '7']
+
+				if store is not None:
+					scene_index = store.add_scene(item.id, item.date)
+
+				tasks = [(band_green_url, band_swir_url, grid, out_window,
+						band_green_add, band_green_mult, band_swir_add, band_swir_mult, FILL_VALUE, preview_factor)
+					for _, out_window in grid_tiles]
+				# with the instrumentation enabled the tiles also return their read time, NDWI time and bytes read
+				read_tile = read_ndwi_tile_measured if instrumentation_enabled() else read_ndwi_tile
+				tiles = pool.map(read_tile, tasks) if pool is not None else map(read_tile, tasks)
+
+				# Count water (NDWI >= 0.3) and valid observations of each tile
+				for out_window, ndwi, *tile_stats in tiles:
+					accumulator.add(ndwi, out_window, item.date)
+					if store is not None:
+						store.write(scene_index, ndwi, out_window)
+					if tile_stats:
+						add_io(scene_record, **tile_stats[0])
+				processed_scenes.append(str(item.id))
+
+			if checkpoint_every and len(processed_scenes) % checkpoint_every == 0:
+				with measure("checkpoint"):
+					if not os.path.exists(output_dir):
+						os.mkdir(output_dir)
+					if store is not None:
+						store.flush()
+					save_checkpoint(checkpoint_path, accumulator, processed_scenes, run_hash)
+
+			progress("NDWI-Scene {} was added to the water frequency,\nit's the {}. item from {} satellite scenes".format(item, item_counter, total_itemNumber),
+				"scene_done", scene=item.id, item=item_counter, items=total_itemNumber)
 
 
 	#############--------- STEP 4:	----------###########
 	## Calculate the water frequency and save it
 
-	# NDWI images stacked to 3-dimnesional array
-	bands_arr = np.array(bands)
+	if store is not None:
+		store.flush()
 
-	# Create binary values based on boundary (0.3), with water (1) and no-water (0).
-	water_masks = np.where(bands_arr >= 0.3, 1, 0)
-	print("Create binary values indicating areas covered by water or land")
+	# Water frequency: number of observations with water (1) divided by the number of valid observations
+	valid_pixels = accumulator.valid_count()
+	water_frequency = accumulator.frequency()
+	progress("Calculate the water frequency for the whole time period", "frequency")
 
-	# Number of valid pixels during in whole time series
-	valid_pixels = get_valid_pixels(bands_arr)
-
-	# Number of pixel with water in whole time series
-	water_frequency = water_masks.sum(axis=0) / valid_pixels
-	print("Calculate the water frequency for the whole time period")
+	# matplotlib is only imported here, it is not needed by the worker processes
+	import matplotlib.pyplot as plt
 
 	# Display the water frequency (whole time series)
 	fig, axes = plt.subplots(1,1,figsize=(10,10))
@@ -155,7 +224,7 @@ def calc_water_frequency(config_site, output_dir):
 
 	###############------------ STEP 5: ----------#################
 	## Saving image of water frequency as tif file
-	outname=config_site["name"]+"_waterfrequency.tif"
+	outname = config_site["name"] + ("_waterstatistics" if statistics else "_waterfrequency") + suffix + ".tif"
 	outfilepath = output_dir + "/" + outname
 
 	if not os.path.exists(output_dir):
@@ -165,13 +234,49 @@ def calc_water_frequency(config_site, output_dir):
 	## Reuse profile from band7 (STEP 3) and adapt it to size and datatype of waterfrequency (array)
 	with rio.open(band_swir_url) as src:
 		profile = src.profile.copy()
+	band_names = accumulator.band_names()
 	profile.update({'dtype': 'float64',
+				'count': len(band_names),
 				'height': water_frequency.shape[0],
-				'width': water_frequency.shape[1]}) 
-				#'transform':scene_affine stays the same like in STEP 3
+				'width': water_frequency.shape[1],
+				'crs': grid.crs,
+				'transform': grid.transform})
+
+	# Written tile by tile, with the same tiling as the scenes
+	with measure("write", path=outfilepath), rio.open(outfilepath, "w", **profile) as dst:
+		progress("Write water frequency to: {}".format(outname), "write", path=outfilepath)
+		for band, band_name in enumerate(band_names, 1):
+			dst.set_band_description(band, band_name)
+		for _, out_window in grid_tiles:
+			dst.write(accumulator.bands(out_window), window=out_window)
+
+	# The run is complete, the next run starts from the first scene again
+	if os.path.exists(checkpoint_path):
+		os.remove(checkpoint_path)
+
+	if instrumentation_enabled():
+		collector.emit("run_summary", site=config_site["name"], **collector.summary(since=first_event))
+
+
 
+def water_frequency_from_ndwi_store(store_dir, outfilepath, threshold=0.3, time_period=None, months=None):
+	"""
+	----- Calculates the water frequency from the NDWI kept by calc_water_frequency(..., ndwi_store=store_dir) -----
+	store_dir : directory of the NDWIStore
+	outfilepath : path of the TIF file to write
+	threshold : NDWI value from which on a pixel is covered by water
+	time_period : string with start and end date in format "YYYY-MM-DD/YYYY-MM-DD", None for all scenes
+	months : list of months (1-12) of a season, eg. [6, 7, 8], None for all months
+	returns TIF file on disk
+	"""
+	store = NDWIStore(store_dir)
+	start, end = time_period.split("/") if time_period else (None, None)
+	water_frequency = water_frequency_from_store(store, threshold, start, end, months)
+
+	grid = store.grid
+	profile = {'driver': 'GTiff', 'dtype': 'float64', 'count': 1, 'crs': grid.crs, 'transform': grid.transform,
+		'height': grid.shape[0], 'width': grid.shape[1], 'tiled': True, 'compress': 'deflate'}
 	with rio.open(outfilepath, "w", **profile) as dst:
-		print("Write water frequency to: {}".format(outname))
 		dst.write(water_frequency, 1)
 
 
@@ -185,4 +290,3 @@ if __name__ == "__main__":
 	for site in config["sites"].items():
 		calc_water_frequency(site[1], config["output_dir"])
 ## site[1] = inner dictonary with bbox, name, time = keys()
-
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the PM2.5 pipeline from "utils_finalproject" with synthetic sensor archives.
+The archive is generated in a temporary folder in the same layout as archive.sensor.community,
+so no connection to the sensor community or the DWD is needed.
+
+Example (from the root of the repository):
+	python utils/benchmark_finalproject.py --sensors 13 --days 31 --readings-per-hour 12 --out bench.json
+	python utils/benchmark_finalproject.py --sensors 13 --days 31 --baseline bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.svm import SVR
+
+from utils_finalproject import mergedCSVpattern, merge_df2csv, splitTrainTest_TS
+
+
+SENSOR_COLS = ["sensor_id", "sensor_type", "location", "lat", "lon", "timestamp", "P1", "durP1", "ratioP1", "P2", "durP2", "ratioP2"]
+WEATHER_COLS = ["precipitation", "temperature", "humidity", "pressure", "wind_speed", "wind_deg"]
+
+
+def generate_sensor_archive(outdir, n_sensors, n_days, readings_per_hour, start_date="2020-10-01", seed=0):
+	"""
+	--- Write synthetic daily SDS011 csv files like they are stored on archive.sensor.community ----
+	outdir : folder in which one subfolder per day is created
+	n_sensors : number of sensors, each sensor gets one file per day
+	n_days : number of days
+	readings_per_hour : number of readings per sensor and hour
+	start_date : string indicating the first day in format "YYYY-MM-DD"
+	seed : seed of the random number generator
+	return list of sensor ids
+	"""
+	rng = np.random.RandomState(seed)
+	sensor_ids = list(range(1000, 1000 + n_sensors))
+	lats = rng.uniform(48.70, 48.82, n_sensors).round(3)
+	lons = rng.uniform(9.10, 9.25, n_sensors).round(3)
+	n_readings = 24 * readings_per_hour
+	offsets = pd.to_timedelta(np.arange(n_readings) * 3600 // readings_per_hour + 1, unit="s")
+
+	for day in pd.date_range(start_date, periods=n_days, freq="D"):
+		day_str = day.strftime("%Y-%m-%d")
+		day_dir = os.path.join(outdir, day_str)
+		os.makedirs(day_dir, exist_ok=True)
+
+		for i, sensor_id in enumerate(sensor_ids):
+			p2 = np.abs(rng.normal(15.0, 8.0, n_readings)).round(2)
+			df = pd.DataFrame({
+				"sensor_id": sensor_id,
+				"sensor_type": "SDS011",
+				"location": 500 + i,
+				"lat": lats[i],
+				"lon": lons[i],
+				"timestamp": (day + offsets).strftime("%Y-%m-%dT%H:%M:%S"),
+				"P1": (p2 * rng.uniform(1.0, 1.5, n_readings)).round(2),
+				"durP1": "",
+				"ratioP1": "",
+				"P2": p2,
+				"durP2": "",
+				"ratioP2": ""}, columns=SENSOR_COLS)
+			fname = "{}_sds011_sensor_{}.csv".format(day_str, sensor_id)
+			df.to_csv(os.path.join(day_dir, fname), sep=";", index=False)
+
+	return sensor_ids
+
+
+def generate_weather(n_days, start_date="2020-10-01", seed=0):
+	"""
+	--- Create a synthetic hourly weather frame like the pivoted DWD observations ----
+	n_days : number of days
+	start_date : string indicating the first day in format "YYYY-MM-DD"
+	seed : seed of the random number generator
+	return pandas DataFrame with one row per hour
+	"""
+	rng = np.random.RandomState(seed)
+	hours = pd.date_range(start_date, periods=24 * n_days, freq="H")
+	n = len(hours)
+	weather_df = pd.DataFrame({
+		"timestamp": hours.strftime("%Y-%m-%d %H:%M:%S"),
+		"precipitation": np.clip(rng.normal(0.0, 0.5, n), 0, None).round(1),
+		"temperature": rng.normal(10.0, 4.0, n).round(1),
+		"humidity": rng.uniform(40, 100, n).round(0),
+		"pressure": rng.normal(975.0, 5.0, n).round(1),
+		"wind_speed": np.abs(rng.normal(2.0, 1.0, n)).round(1),
+		"wind_deg": rng.randint(0, 36, n) * 10})
+
+	return weather_df
+
+
+def _measure(results, stage, func, rows):
+	"""
+	--- Record wall time, throughput and peak memory of a stage ----
+	results : dictionary to which the measurement of the stage is added
+	stage : name of the stage
+	func : callable running the stage, it is called twice: timed without tracemalloc, which slows down every
+		allocation, and then again with tracemalloc for the peak memory
+	rows : callable returning the number of rows processed from the result of func
+	return result of the timed call of func
+	"""
+	t_start = time.perf_counter()
+	result = func()
+	wall_time = time.perf_counter() - t_start
+
+	tracemalloc.start()
+	try:
+		func()
+		_, peak = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+
+	n_rows = rows(result)
+	results[stage] = {
+		"wall_time_s": wall_time,
+		"rows": n_rows,
+		"rows_per_s": n_rows / wall_time if wall_time > 0 else None,
+		"peak_memory_mb": peak / 1024 ** 2}
+	return result
+
+
+def run_benchmark(n_sensors, n_days, readings_per_hour, workdir=None):
+	"""
+	--- Time each stage of the pipeline on a synthetic archive ----
+	n_sensors : number of sensors
+	n_days : number of days
+	readings_per_hour : number of readings per sensor and hour
+	workdir : folder for the synthetic archive, a temporary folder is used if None
+	return dictionary with the measurements of each stage
+	"""
+	results = {}
+	with tempfile.TemporaryDirectory() as tmpdir:
+		workdir = workdir or tmpdir
+		archive_dir = os.path.join(workdir, "archive")
+		out_dir = os.path.join(workdir, "merged")
+		os.makedirs(out_dir, exist_ok=True)
+
+		sensor_ids = generate_sensor_archive(archive_dir, n_sensors, n_days, readings_per_hour)
+		weather_df = generate_weather(n_days)
+
+		# mergedCSVpattern() globs relative to the current directory
+		cwd = os.getcwd()
+		os.chdir(archive_dir)
+		try:
+			patterns = ["sensor_{}".format(s) for s in sensor_ids]
+			sensor_dfs = _measure(results, "mergedCSVpattern",
+				lambda: mergedCSVpattern(patterns, selected_cols=["sensor_id", "lat", "lon", "timestamp", "P1", "P2"]),
+				lambda dfs: sum(len(df) for df in dfs))
+		finally:
+			os.chdir(cwd)
+
+		# hourly mean per sensor, like in the notebook before merging with the weather data
+		hourly_dfs = []
+		for df in sensor_dfs:
+			df = df.assign(timestamp=pd.to_datetime(df.timestamp).dt.floor("H"))
+			df = df.groupby("timestamp", as_index=False).agg({"sensor_id": "first", "lat": "first", "lon": "first", "P1": "mean", "P2": "mean"})
+			df["timestamp"] = df.timestamp.dt.strftime("%Y-%m-%d %H:%M:%S")
+			hourly_dfs.append(df)
+
+		merged_dfs = _measure(results, "merge_df2csv",
+			lambda: merge_df2csv(hourly_dfs, weather_df, "timestamp", "timestamp", out_dir, "sensor_id"),
+			lambda dfs: sum(len(df) for df in dfs))
+
+		df_all = pd.concat(merged_dfs).set_index("timestamp").sort_index()
+		split_date = df_all.index[int(len(df_all) * 0.8)]
+		def split():
+			with contextlib.redirect_stdout(io.StringIO()):
+				return splitTrainTest_TS(df_all, split_date, WEATHER_COLS, "P2")
+
+		X_train, y_train, X_test, y_test = _measure(results, "splitTrainTest_TS", split, lambda splits: len(df_all))
+
+		model = SVR()
+		_measure(results, "fit", lambda: model.fit(X_train, y_train), lambda model: len(X_train))
+		_measure(results, "predict", lambda: model.predict(X_test), lambda y_pred: len(y_pred))
+
+	return results
+
+
+def compare_to_baseline(report, baseline, tolerance):
+	"""
+	--- Find stages which became slower than in the baseline report ----
+	report : benchmark report (dictionary) of the current run
+	baseline : benchmark report (dictionary) of an earlier run
+	tolerance : allowed relative increase of the wall time, eg. 0.2 for 20 %
+	return list of strings describing the regressions
+	"""
+	regressions = []
+	for stage, result in report["stages"].items():
+		if stage not in baseline["stages"]:
+			continue
+		base_time = baseline["stages"][stage]["wall_time_s"]
+		if result["wall_time_s"] > base_time * (1 + tolerance):
+			regressions.append("{}: {:.3f} s (baseline {:.3f} s)".format(stage, result["wall_time_s"], base_time))
+
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Benchmark the PM2.5 pipeline with a synthetic sensor archive.")
+	parser.add_argument("--sensors", type=int, default=13, help="number of sensors")
+	parser.add_argument("--days", type=int, default=31, help="number of days")
+	parser.add_argument("--readings-per-hour", type=int, default=12, help="readings per sensor and hour")
+	parser.add_argument("--out", help="write the report as JSON to this file")
+	parser.add_argument("--baseline", help="JSON report of an earlier run to compare with")
+	parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown against the baseline")
+	args = parser.parse_args(argv)
+
+	stages = run_benchmark(args.sensors, args.days, args.readings_per_hour)
+	report = {
+		"created": datetime.now().isoformat(timespec="seconds"),
+		"python": platform.python_version(),
+		"config": {"sensors": args.sensors, "days": args.days, "readings_per_hour": args.readings_per_hour},
+		"stages": stages}
+
+	for stage, result in stages.items():
+		print("{:<20} {:8.3f} s  {:>10} rows  {:8.1f} MB".format(stage, result["wall_time_s"], result["rows"], result["peak_memory_mb"]))
+
+	if args.out:
+		with open(args.out, "w") as dst:
+			json.dump(report, dst, indent=2)
+
+	if args.baseline:
+		with open(args.baseline) as src:
+			baseline = json.load(src)
+		regressions = compare_to_baseline(report, baseline, args.tolerance)
+		for regression in regressions:
+			print("Regression", regression)
+		if regressions:
+			return 1
+
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Precomputed datasets of the SVM Explorer.
+
+Every dataset x sample size x noise combination offered by the sliders is
+generated once, standardized, split into training and test data and kept as
+compact float32 arrays, optionally persisted as .npz files, so callbacks never
+generate data themselves.
+"""
+
+import os
+import tempfile
+import threading
+import zipfile
+
+import numpy as np
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+
+class DatasetCache:
+    def __init__(
+        self,
+        generate_data,
+        datasets,
+        sample_sizes,
+        noise_levels,
+        cache_dir=None,
+        test_size=0.4,
+        random_state=42,
+    ):
+        self.generate_data = generate_data
+        self.datasets = list(datasets)
+        self.sample_sizes = list(sample_sizes)
+        self.noise_levels = list(noise_levels)
+        self.cache_dir = cache_dir
+        self.test_size = test_size
+        self.random_state = random_state
+        self._data = {}
+        self._lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(dataset, sample_size, noise):
+        # slider values like 0.30000000000000004 map to the same entry as 0.3
+        return dataset, int(sample_size), round(float(noise), 1)
+
+    def _path(self, key):
+        dataset, sample_size, noise = key
+        return os.path.join(
+            self.cache_dir, "{}_{}_{:.1f}.npz".format(dataset, sample_size, noise)
+        )
+
+    def _build(self, key):
+        dataset, sample_size, noise = key
+        if self.cache_dir is not None and os.path.exists(self._path(key)):
+            try:
+                with np.load(self._path(key)) as npz:
+                    return {name: npz[name] for name in npz.files}
+            except (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile):
+                # truncated or corrupt file, e.g. left by a killed worker: rebuilt
+                pass
+
+        X, y = self.generate_data(n_samples=sample_size, dataset=dataset, noise=noise)
+        X = StandardScaler().fit_transform(X)
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=self.test_size, random_state=self.random_state
+        )
+        data = dict(
+            X=X.astype(np.float32),
+            X_train=X_train.astype(np.float32),
+            X_test=X_test.astype(np.float32),
+            y_train=y_train.astype(np.int8),
+            y_test=y_test.astype(np.int8),
+        )
+        if self.cache_dir is not None:
+            self._save(key, data)
+        return data
+
+    def _save(self, key, data):
+        # written to a temporary file in the same directory and renamed, so
+        # other workers never load a partially written file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".npz.tmp")
+        try:
+            with os.fdopen(fd, "wb") as dst:
+                np.savez(dst, **data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get(self, dataset, sample_size, noise):
+        """Scaled data and train/test split of one combination, built on first use."""
+        key = self.key(dataset, sample_size, noise)
+        data = self._data.get(key)
+        if data is None:
+            data = self._build(key)
+            with self._lock:
+                data = self._data.setdefault(key, data)
+        return data
+
+    def __len__(self):
+        return len(self._data)
+
+    def warm_up(self):
+        """Build all combinations offered by the sliders."""
+        for dataset in self.datasets:
+            for sample_size in self.sample_sizes:
+                for noise in self.noise_levels:
+                    self.get(dataset, sample_size, noise)
@@ -0,0 +1,140 @@
+"""
+Evaluation of the SVM decision function on the mesh of the prediction plot.
+
+The mesh is evaluated in chunks on a thread pool, and with `coarse_factor` > 1
+only every n-th mesh point is evaluated exactly at first. The rest of the mesh
+is interpolated from this coarse grid and then evaluated exactly only in the
+coarse cells whose corner values reach the contour level (a range of levels or
+evenly spaced levels, e.g. of a threshold slider), where the contour needs to
+be sharp.
+
+A coarse cell is only refined if one of its corners reaches the level, so an
+island or sliver of the other side of the contour which lies completely inside
+one coarse cell is missed, and the values (and extremes) away from the refined
+cells are interpolated. Use coarse_factor=1 where the contour level is not known
+when the mesh is evaluated.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+CHUNK_SIZE = 2048
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=MAX_WORKERS, thread_name_prefix="decision-surface"
+            )
+    return _executor
+
+
+def evaluate_points(decision_function, x, y, chunk_size=CHUNK_SIZE):
+    """Evaluate `decision_function` at the points (x[i], y[i]).
+
+    Every chunk is copied into its own small (n, 2) buffer, so the full
+    point array of np.c_[x, y] is never built."""
+    n_points = len(x)
+    out = np.empty(n_points, dtype=np.float64)
+
+    def evaluate_chunk(start):
+        stop = min(start + chunk_size, n_points)
+        points = np.empty((stop - start, 2), dtype=np.float64)
+        points[:, 0] = x[start:stop]
+        points[:, 1] = y[start:stop]
+        out[start:stop] = decision_function(points)
+
+    starts = range(0, n_points, chunk_size)
+    if len(starts) <= 1:
+        for start in starts:
+            evaluate_chunk(start)
+    else:
+        # list() re-raises exceptions of the workers
+        list(_get_executor().map(evaluate_chunk, starts))
+
+    return out
+
+
+def _interpolation_weights(n, nodes):
+    """Index of the left coarse node and relative position of every fine index."""
+    fine = np.arange(n)
+    left = np.clip(np.searchsorted(nodes, fine, side="right") - 1, 0, len(nodes) - 2)
+    t = (fine - nodes[left]) / (nodes[left + 1] - nodes[left])
+    return left, t
+
+
+def evaluate_mesh(
+    decision_function,
+    xs,
+    ys,
+    coarse_factor=1,
+    level=0.0,
+    n_levels=None,
+    chunk_size=CHUNK_SIZE,
+):
+    """Decision values of the mesh np.meshgrid(xs, ys), flattened like
+    np.c_[xx.ravel(), yy.ravel()].
+
+    coarse_factor: step (in mesh points) of the coarse grid evaluated first,
+        1 evaluates every mesh point exactly
+    level: decision value of the contour which is refined, or a (low, high)
+        range of levels, e.g. the values a threshold slider can reach; every
+        coarse cell whose corner values overlap it is evaluated exactly
+    n_levels: number of evenly spaced levels from the minimum to the maximum
+        of the coarse grid whose contours are refined instead of `level`, e.g.
+        every position of a threshold slider scaled to the decision values;
+        only cells whose corner values lie between two neighbouring levels
+        stay interpolated
+    """
+    n_x, n_y = len(xs), len(ys)
+    f = int(coarse_factor)
+    if f <= 1 or n_x <= 2 * f or n_y <= 2 * f:
+        xx, yy = np.meshgrid(xs, ys)
+        return evaluate_points(decision_function, xx.ravel(), yy.ravel(), chunk_size)
+
+    # coarse grid, always including the last row and column of the mesh
+    nodes_x = np.unique(np.r_[np.arange(0, n_x, f), n_x - 1])
+    nodes_y = np.unique(np.r_[np.arange(0, n_y, f), n_y - 1])
+    cxx, cyy = np.meshgrid(xs[nodes_x], ys[nodes_y])
+    Z_coarse = evaluate_points(
+        decision_function, cxx.ravel(), cyy.ravel(), chunk_size
+    ).reshape(len(nodes_y), len(nodes_x))
+
+    # bilinear interpolation onto the full mesh
+    ix, tx = _interpolation_weights(n_x, nodes_x)
+    iy, ty = _interpolation_weights(n_y, nodes_y)
+    Z_x = Z_coarse[:, ix] * (1 - tx) + Z_coarse[:, ix + 1] * tx
+    Z = Z_x[iy, :] * (1 - ty)[:, None] + Z_x[iy + 1, :] * ty[:, None]
+
+    # coarse cells crossed by the contour, i.e. whose corner values overlap the
+    # levels (cells with all corners on one side are not, see the module doc)
+    corners = np.stack(
+        [Z_coarse[:-1, :-1], Z_coarse[:-1, 1:], Z_coarse[1:, :-1], Z_coarse[1:, 1:]]
+    )
+    corner_min, corner_max = corners.min(axis=0), corners.max(axis=0)
+    if n_levels is not None:
+        levels = np.linspace(Z_coarse.min(), Z_coarse.max(), int(n_levels))
+        # number of levels within the corner range of every cell
+        crossed = np.searchsorted(levels, corner_max, side="right") > np.searchsorted(
+            levels, corner_min, side="left"
+        )
+    else:
+        low, high = np.broadcast_to(np.asarray(level, dtype=np.float64), (2,))
+        crossed = (corner_min <= high) & (corner_max >= low)
+
+    refine = crossed[iy[:, None], ix[None, :]]
+    refine[np.ix_(nodes_y, nodes_x)] = False  # coarse nodes are exact already
+    rows, cols = np.nonzero(refine)
+    if len(rows):
+        Z[rows, cols] = evaluate_points(decision_function, xs[cols], ys[rows], chunk_size)
+
+    return Z.ravel()
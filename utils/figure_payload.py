@@ -0,0 +1,94 @@
+"""
+Compact JSON payloads for the figures of the SVM Explorer.
+
+Numeric trace arrays (x, y, z and marker colors) are sent as base64 encoded
+float32 buffers ({"dtype": "f4", "bdata": ...}) instead of lists of Python
+floats. plotly.js decodes these typed arrays since version 2.28, which ships
+with dash 2.15. For older versions the arrays are sent as rounded lists, set
+SVM_TYPED_ARRAYS=0/1 to override the detection.
+"""
+
+import base64
+import os
+
+import dash
+import numpy as np
+
+LIST_DECIMALS = 4
+
+
+def typed_arrays_supported():
+    setting = os.environ.get("SVM_TYPED_ARRAYS")
+    if setting in ("0", "1"):
+        return setting == "1"
+    try:
+        major, minor = (int(part) for part in dash.__version__.split(".")[:2])
+    except ValueError:
+        return False
+    return (major, minor) >= (2, 15)
+
+
+TYPED_ARRAYS = typed_arrays_supported()
+
+
+def encode_array(values, dtype="f4"):
+    """Base64 encoded little-endian typed array in the format of plotly.js."""
+    array = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    encoded = {
+        "dtype": dtype,
+        "bdata": base64.b64encode(array.tobytes()).decode("ascii"),
+    }
+    if array.ndim > 1:
+        encoded["shape"] = ",".join(str(n) for n in array.shape)
+    return encoded
+
+
+def decode_array(encoded):
+    array = np.frombuffer(
+        base64.b64decode(encoded["bdata"]),
+        dtype=np.dtype(encoded["dtype"]).newbyteorder("<"),
+    )
+    if "shape" in encoded:
+        array = array.reshape([int(n) for n in str(encoded["shape"]).split(",")])
+    return array
+
+
+def _compact_array(values, typed_arrays):
+    if isinstance(values, dict):
+        if "bdata" not in values:
+            return values
+        # already a typed array (plotly >= 6 encodes float64)
+        array = decode_array(values)
+    else:
+        array = np.asarray(values)
+    if array.dtype.kind not in "fiu" or array.size == 0:
+        return values
+    if typed_arrays:
+        return encode_array(array, "f4")
+    return np.around(array.astype(np.float64), LIST_DECIMALS).tolist()
+
+
+def compact_figure(figure, typed_arrays=None):
+    """Figure as plain dict with compact numeric arrays."""
+    if typed_arrays is None:
+        typed_arrays = TYPED_ARRAYS
+    if hasattr(figure, "to_plotly_json"):
+        figure = figure.to_plotly_json()
+    figure = dict(figure)
+
+    data = []
+    for trace in figure.get("data", []):
+        trace = dict(trace)
+        for key in ("x", "y", "z"):
+            if key in trace and trace[key] is not None:
+                trace[key] = _compact_array(trace[key], typed_arrays)
+        marker = trace.get("marker")
+        if isinstance(marker, dict) and marker.get("color") is not None:
+            if not isinstance(marker["color"], str):
+                trace["marker"] = dict(
+                    marker, color=_compact_array(marker["color"], typed_arrays)
+                )
+        data.append(trace)
+    figure["data"] = data
+
+    return figure
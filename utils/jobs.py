@@ -0,0 +1,249 @@
+"""
+Background worker pool for long SVM fits of the SVM Explorer.
+
+Jobs are submitted per session; a new job of a session cancels the previous
+one, so rapid slider drags don't keep the workers busy with stale fits. A
+queued job which was cancelled never starts, and a running job reports its
+progress with report_progress(), which also stops the job at its next stage
+when it was cancelled. A stage itself is not interrupted, e.g. a libsvm fit
+that has started runs to completion and its result is discarded.
+
+RequestCoalescer does the same for the synchronous callbacks: identical
+requests running at the same time share one computation, and a request still
+waiting for a free slot is dropped when a newer request of its session arrives.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+_current = threading.local()
+
+
+class JobCancelled(Exception):
+    """Raised inside a job which was cancelled or superseded."""
+
+
+def report_progress(progress, message=""):
+    """Report the progress (0..1) of the job running in this thread.
+
+    Raises JobCancelled if the job was cancelled in the meantime, so call it
+    right before each expensive stage; the stage itself can't be stopped once
+    it runs. Outside of
+    a job this does nothing, so the same code can run in a callback."""
+    job = getattr(_current, "job", None)
+    if job is None:
+        return
+    if job.cancelled:
+        raise JobCancelled(job.id)
+    job.progress = progress
+    job.message = message
+
+
+class Job:
+    def __init__(self, session_id, key=None):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.key = key
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = "Queued"
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.future = None
+        self.submitted = time.time()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Local worker pool with one active job per session."""
+
+    def __init__(self, max_workers=2, keep_finished=64):
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="fit-job"
+        )
+        self._jobs = {}
+        self._by_session = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session_id, func, *args, key=None):
+        """Run func(*args) in the background and cancel the previous job of the session."""
+        job = Job(session_id, key=key)
+        with self._lock:
+            previous = self._by_session.get(session_id)
+            self._jobs[job.id] = job
+            self._by_session[session_id] = job
+            self._prune()
+        if previous is not None and not previous.finished:
+            self.cancel(previous.id)
+        job.future = self._executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job, func, args):
+        if job.cancelled:
+            job.status = "cancelled"
+            return
+        job.status = "running"
+        job.message = "Running"
+        _current.job = job
+        try:
+            job.result = func(*args)
+            job.progress = 1.0
+            job.message = "Done"
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = repr(e)
+            job.status = "failed"
+        finally:
+            _current.job = None
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda j: j.submitted)[: -self.keep_finished]:
+            del self._jobs[job.id]
+            if self._by_session.get(job.session_id) is job:
+                del self._by_session[job.session_id]
+
+    def cancel(self, job_id):
+        """Cancel a job; queued jobs never start, running jobs stop at their next
+        report_progress()."""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancelled = True
+        if job.future is not None and job.future.cancel():
+            job.status = "cancelled"
+        return True
+
+    def cancel_session(self, session_id):
+        with self._lock:
+            job = self._by_session.get(session_id)
+        if job is not None:
+            return self.cancel(job.id)
+        return False
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+class RequestSuperseded(Exception):
+    """Raised for a request dropped in favour of a newer one of its session."""
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiting = 0
+
+
+class RequestCoalescer:
+    """Runs at most `max_concurrent` computations at a time, shares identical
+    computations and drops requests superseded while waiting for a slot."""
+
+    def __init__(self, max_concurrent=2, poll_interval=0.02):
+        self.poll_interval = poll_interval
+        self._slots = threading.Semaphore(max_concurrent)
+        self._inflight = {}
+        self._latest = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.computed = 0
+        self.coalesced = 0
+        self.superseded = 0
+        self.failed = 0
+
+    def run(self, key, func, *args, session_id=None):
+        """Return func(*args), computed once for all concurrent requests of `key`.
+
+        Raises RequestSuperseded if a newer request of `session_id` arrived
+        before this one got a slot and no other request waits for its result."""
+        ticket = object()
+        leader = None
+        with self._lock:
+            self.requests += 1
+            if session_id is not None:
+                self._latest[session_id] = ticket
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                inflight.waiting += 1
+                self.coalesced += 1
+            else:
+                inflight = self._inflight[key] = _InFlight()
+                leader = inflight
+        try:
+            if inflight is not leader:
+                return self._wait(inflight)
+            return self._compute(key, inflight, func, args, session_id, ticket)
+        finally:
+            with self._lock:
+                if session_id is not None and self._latest.get(session_id) is ticket:
+                    del self._latest[session_id]
+
+    def _compute(self, key, inflight, func, args, session_id, ticket):
+        try:
+            while not self._slots.acquire(timeout=self.poll_interval):
+                with self._lock:
+                    stale = (
+                        session_id is not None
+                        and self._latest.get(session_id) is not ticket
+                        and not inflight.waiting
+                    )
+                    if stale:
+                        self.superseded += 1
+                        del self._inflight[key]
+                if stale:
+                    raise RequestSuperseded(key)
+            try:
+                inflight.result = func(*args)
+                with self._lock:
+                    self.computed += 1
+            except Exception as e:
+                inflight.error = e
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                self._slots.release()
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is inflight:
+                    del self._inflight[key]
+            inflight.done.set()
+        return inflight.result
+
+    def _wait(self, inflight):
+        inflight.done.wait()
+        if inflight.error is not None:
+            raise inflight.error
+        return inflight.result
+
+    def info(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "computed": self.computed,
+                "coalesced": self.coalesced,
+                "superseded": self.superseded,
+                "failed": self.failed,
+                "in_flight": len(self._inflight),
+            }
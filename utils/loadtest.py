@@ -0,0 +1,376 @@
+"""
+Load test of the Dash callbacks of the SVM Explorer.
+
+Virtual users load the page (all server callbacks fire once with the initial
+values of the layout) and then drag the parameter sliders and switch the
+dropdowns of update_svm_graph; every intermediate slider value sends the
+callbacks depending on it to /_dash-update-component, and background fits are
+polled like dcc.Interval does. Latency percentiles, throughput and CPU time are
+reported per callback.
+
+The app is driven in-process through the Flask test client, or over HTTP:
+
+    python utils/loadtest.py --users 8 --drags 20 --steps 5
+    python utils/loadtest.py --url http://127.0.0.1:8050 --users 8 --out load.json
+
+In-process, the CPU time is the thread time of the request handler; work done
+on other threads (decision surface pool, background fits) is not included.
+Over HTTP no CPU time is measured.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TARGET_OUTPUT = ("div-graphs", "children")
+POLL_INTERVAL = 0.5
+
+
+class InProcessClient:
+    """Requests to a Flask server through one test client per thread."""
+
+    measures_cpu = True
+
+    def __init__(self, server):
+        self.server = server
+        self._local = threading.local()
+
+    def _client(self):
+        if getattr(self._local, "client", None) is None:
+            self._local.client = self.server.test_client()
+        return self._local.client
+
+    def get_json(self, path):
+        return json.loads(self._client().get(path).data)
+
+    def post_json(self, path, payload):
+        response = self._client().post(path, json=payload)
+        return response.status_code, response.data
+
+
+class HTTPClient:
+    """Requests to a running instance of the app."""
+
+    measures_cpu = False
+
+    def __init__(self, url, timeout=120):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def get_json(self, path):
+        with urllib.request.urlopen(self.url + path, timeout=self.timeout) as r:
+            return json.loads(r.read())
+
+    def post_json(self, path, payload):
+        request = urllib.request.Request(
+            self.url + path,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as r:
+                return r.status, r.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def layout_props(layout):
+    """Props of all components with an id in the JSON layout, by id."""
+    props = {}
+    stack = [layout]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict) and "props" in node:
+            if "id" in node["props"]:
+                props[node["props"]["id"]] = node["props"]
+            stack.append(node["props"].get("children"))
+    return props
+
+
+def parse_outputs(output):
+    """[(id, property)] of the output string of a callback."""
+    if output.startswith(".."):
+        outputs = output[2:-2].split("...")
+    else:
+        outputs = [output]
+    return [tuple(o.rsplit(".", 1)) for o in outputs]
+
+
+class Callback:
+    def __init__(self, dependency):
+        self.name = dependency["output"]
+        self.outputs = parse_outputs(dependency["output"])
+        self.multi = self.name.startswith("..")
+        self.inputs = [(i["id"], i["property"]) for i in dependency["inputs"]]
+        self.state = [(s["id"], s["property"]) for s in dependency.get("state", [])]
+
+    def payload(self, values, changed):
+        def items(deps):
+            return [
+                {"id": i, "property": p, "value": values.get((i, p))} for i, p in deps
+            ]
+
+        outputs = [{"id": i, "property": p} for i, p in self.outputs]
+        return {
+            "output": self.name,
+            "outputs": outputs if self.multi else outputs[0],
+            "inputs": items(self.inputs),
+            "state": items(self.state),
+            "changedPropIds": ["{}.{}".format(*c) for c in changed],
+        }
+
+
+def server_callbacks(dependencies):
+    return [Callback(d) for d in dependencies if not d.get("clientside_function")]
+
+
+def option_values(props):
+    """Values a user can pick for a slider, dropdown or radio items."""
+    if "options" in props:
+        return [o["value"] if isinstance(o, dict) else o for o in props["options"]]
+    if "min" in props and "max" in props:
+        step = props.get("step")
+        if step is None and props.get("marks"):
+            return sorted(float(m) for m in props["marks"])
+        values = np.arange(props["min"], props["max"] + 1e-9, step or 1)
+        return [round(float(v), 10) for v in values]
+    return []
+
+
+def drag(values, current, steps, rng):
+    """Intermediate values of a drag from the current value to a random one."""
+    if not values:
+        return []
+    target = rng.randrange(len(values))
+    if current in values and steps > 1:
+        start = values.index(current)
+        path = (
+            values[start : target + 1]
+            if target >= start
+            else values[target:start][::-1]
+        )
+        if len(path) > steps:
+            # the browser skips values when the slider moves fast
+            path = [path[int(i)] for i in np.linspace(0, len(path) - 1, steps)]
+        return path[1:] if len(path) > 1 else path
+    return [values[target]]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, cpu_seconds, ok, n_bytes):
+        with self._lock:
+            self.samples.setdefault(name, []).append(
+                (seconds, cpu_seconds, ok, n_bytes)
+            )
+
+    def summary(self, duration, measures_cpu):
+        callbacks = {}
+        for name, samples in sorted(self.samples.items()):
+            seconds = np.array([s[0] for s in samples]) * 1000
+            p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+            callbacks[name] = {
+                "requests": len(samples),
+                "errors": sum(not s[2] for s in samples),
+                "p50_ms": round(float(p50), 2),
+                "p95_ms": round(float(p95), 2),
+                "p99_ms": round(float(p99), 2),
+                "mean_bytes": int(np.mean([s[3] for s in samples])),
+                "throughput_per_s": round(len(samples) / duration, 2),
+            }
+            if measures_cpu:
+                cpu = np.array([s[1] for s in samples]) * 1000
+                callbacks[name]["cpu_mean_ms"] = round(float(cpu.mean()), 2)
+                callbacks[name]["cpu_total_s"] = round(float(cpu.sum()) / 1000, 3)
+        total = sum(c["requests"] for c in callbacks.values())
+        return {
+            "duration_s": round(duration, 3),
+            "requests": total,
+            "throughput_per_s": round(total / duration, 2),
+            "callbacks": callbacks,
+        }
+
+
+class VirtualUser:
+    def __init__(self, client, callbacks, props, recorder, rng, think_time=0.05):
+        self.client = client
+        self.callbacks = callbacks
+        self.props = props
+        self.recorder = recorder
+        self.rng = rng
+        self.think_time = think_time
+        self.values = {
+            (component_id, prop): value
+            for component_id, component_props in props.items()
+            for prop, value in component_props.items()
+        }
+        # a session of its own, like the session-id store of the page
+        if ("session-id", "data") in self.values:
+            self.values[("session-id", "data")] = uuid.uuid4().hex
+
+    def send(self, callback, changed):
+        payload = callback.payload(self.values, changed)
+        cpu_start = time.thread_time()
+        start = time.perf_counter()
+        status, body = self.client.post_json("/_dash-update-component", payload)
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.thread_time() - cpu_start
+        self.recorder.add(callback.name, seconds, cpu_seconds, status < 400, len(body))
+        if status == 200 and body:
+            response = json.loads(body).get("response", {})
+            if not callback.multi and "props" in response:
+                # response format of single outputs in dash < 1.11
+                response = {callback.outputs[0][0]: response["props"]}
+            for component_id, props in response.items():
+                for prop, value in props.items():
+                    self.values[(component_id, prop)] = value
+
+    def change(self, key, value):
+        self.values[key] = value
+        for callback in self.callbacks:
+            if key in callback.inputs:
+                self.send(callback, [key])
+
+    def poll_fit(self, max_polls):
+        interval = ("interval-fit-job", "n_intervals")
+        for _ in range(max_polls):
+            if self.values.get(("interval-fit-job", "disabled"), True) is not False:
+                return
+            time.sleep(POLL_INTERVAL)
+            self.change(interval, (self.values.get(interval) or 0) + 1)
+
+    def controls(self):
+        """Sliders and dropdowns of the inputs of update_svm_graph."""
+        target = next(c for c in self.callbacks if TARGET_OUTPUT in c.outputs)
+        return [
+            key
+            for key in target.inputs
+            if key[1] == "value" and option_values(self.props.get(key[0], {}))
+        ]
+
+    def run(self, drags, steps, max_polls=240):
+        # page load, all callbacks fire with the initial values
+        for callback in self.callbacks:
+            self.send(callback, [])
+        self.poll_fit(max_polls)
+
+        controls = self.controls()
+        for _ in range(drags):
+            key = self.rng.choice(controls)
+            values = option_values(self.props[key[0]])
+            for value in drag(values, self.values.get(key), steps, self.rng):
+                self.change(key, value)
+                time.sleep(self.think_time)
+            self.poll_fit(max_polls)
+
+
+def run_load_test(
+    client, users=4, drags=10, steps=5, think_time=0.05, max_polls=240, seed=0
+):
+    """Run `users` virtual users concurrently and summarize the requests."""
+    props = layout_props(client.get_json("/_dash-layout"))
+    callbacks = server_callbacks(client.get_json("/_dash-dependencies"))
+    recorder = Recorder()
+    virtual_users = [
+        VirtualUser(
+            client, callbacks, props, recorder, random.Random(seed + n), think_time
+        )
+        for n in range(users)
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        futures = [
+            executor.submit(user.run, drags, steps, max_polls) for user in virtual_users
+        ]
+        for future in futures:
+            future.result()
+    duration = time.perf_counter() - start
+
+    summary = recorder.summary(duration, client.measures_cpu)
+    summary["settings"] = dict(users=users, drags=drags, steps=steps, seed=seed)
+    return summary
+
+
+def print_summary(summary):
+    print(
+        "{requests} requests in {duration_s:.1f} s ({throughput_per_s:.1f}/s)".format(
+            **summary
+        )
+    )
+    row = "{:<44} {:>6} {:>6} {:>9} {:>9} {:>9} {:>9}"
+    print(row.format("callback", "n", "errors", "p50 ms", "p95 ms", "p99 ms", "cpu ms"))
+    for name, c in summary["callbacks"].items():
+        outputs = parse_outputs(name)
+        label = "{}.{}".format(*outputs[0])
+        if len(outputs) > 1:
+            label += " (+{})".format(len(outputs) - 1)
+        print(
+            row.format(
+                label[:44],
+                c["requests"],
+                c["errors"],
+                c["p50_ms"],
+                c["p95_ms"],
+                c["p99_ms"],
+                c.get("cpu_mean_ms", "-"),
+            )
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--url", help="running instance, default: in-process")
+    parser.add_argument("--users", type=int, default=4, help="concurrent users")
+    parser.add_argument("--drags", type=int, default=10, help="drags per user")
+    parser.add_argument(
+        "--steps",
+        type=int,
+        default=5,
+        help="requests per drag, 1 like updatemode=mouseup",
+    )
+    parser.add_argument("--think-time", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the summary as JSON")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        client = HTTPClient(args.url)
+    else:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from app import server
+
+        client = InProcessClient(server)
+
+    summary = run_load_test(
+        client,
+        users=args.users,
+        drags=args.drags,
+        steps=args.steps,
+        think_time=args.think_time,
+        seed=args.seed,
+    )
+    print_summary(summary)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
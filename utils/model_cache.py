@@ -0,0 +1,203 @@
+"""
+Caches for the fitted SVM models and decision surfaces of the SVM Explorer.
+
+LRUCache lives in the memory of one process. DiskCache stores pickled entries
+in a SQLite file which all worker processes of a multi-process deployment
+share, and TieredCache puts a small LRUCache in front of it.
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class LRUCache:
+    """Thread-safe in-memory cache keeping the `maxsize` most recently used entries."""
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def info(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+class DiskCache:
+    """Cache of pickled entries in a SQLite file shared between processes.
+
+    Writes of concurrent processes are serialized by the locking of SQLite,
+    the threads of one process by a local lock. When the pickled entries
+    exceed `max_bytes`, the least recently used entries are evicted."""
+
+    def __init__(self, path, max_bytes=512 * 2 ** 20, timeout=30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS accessed ON entries (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=self.timeout)
+        # entries can be recomputed, so commits don't need to wait for fsync
+        db.execute("PRAGMA synchronous=OFF")
+        try:
+            with db:  # commits, or rolls back on errors
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _key(key):
+        # repr of the parameter tuples is the same in every process
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def get(self, key, default=None):
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                "SELECT value FROM entries WHERE key = ?", (self._key(key),)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            db.execute(
+                "UPDATE entries SET accessed = ? WHERE key = ?",
+                (time.time(), self._key(key)),
+            )
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (self._key(key), sqlite3.Binary(blob), len(blob), time.time()),
+            )
+            self._evict(db)
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall()
+        evicted = []
+        # the most recent entry is kept, even if it exceeds max_bytes on its own
+        for key, size in rows[:-1]:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        db.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def __contains__(self, key):
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                "SELECT 1 FROM entries WHERE key = ?", (self._key(key),)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock, self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM entries")
+
+    def info(self):
+        with self._lock, self._connect() as db:
+            size, n_bytes = db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": size,
+            "bytes": n_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class TieredCache:
+    """In-memory LRUCache in front of a cache shared between processes."""
+
+    def __init__(self, local, shared):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is None:
+                return default
+            self.local.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.local.put(key, value)
+        self.shared.put(key, value)
+
+    def __contains__(self, key):
+        return key in self.local or key in self.shared
+
+    def __len__(self):
+        return len(self.shared)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def info(self):
+        return {"local": self.local.info(), "shared": self.shared.info()}
@@ -0,0 +1,183 @@
+"""
+PM2.5 dashboard of the sensor archive (APP_MODE=pm in app.py).
+
+Stations are picked in a dropdown and only the selected ones are loaded
+(utils/timeseries.py). Every trace is downsampled on the server to about the
+width of the plot, and zooming into the plot fetches the zoomed window again
+at full resolution.
+"""
+
+import dash
+import dash_core_components as dcc
+import dash_html_components as html
+import pandas as pd
+from dash.dependencies import Input, Output, State
+
+from utils.figure_payload import TYPED_ARRAYS, encode_array
+from utils.timeseries import downsample
+
+# points per trace, about the width of the plot in pixels
+POINTS_PER_TRACE = 1200
+DEFAULT_STATIONS = 3
+
+VARIABLES = {"P2": "PM2.5 (µg/m³)", "P1": "PM10 (µg/m³)"}
+
+
+def layout(stations):
+    return html.Div(
+        children=[
+            html.Div(
+                className="banner",
+                children=[
+                    html.Div(
+                        className="container scalable",
+                        children=[
+                            html.H2(
+                                id="banner-title",
+                                children="Particulate Matter Stuttgart",
+                            )
+                        ],
+                    )
+                ],
+            ),
+            html.Div(
+                id="body",
+                className="container scalable",
+                children=[
+                    html.Div(
+                        id="app-container",
+                        children=[
+                            html.Div(
+                                id="left-column",
+                                children=[
+                                    html.P("Stations"),
+                                    dcc.Dropdown(
+                                        id="dropdown-pm-stations",
+                                        options=[
+                                            {"label": s, "value": s} for s in stations
+                                        ],
+                                        value=stations[:DEFAULT_STATIONS],
+                                        multi=True,
+                                    ),
+                                    html.P("Variable"),
+                                    dcc.RadioItems(
+                                        id="radio-pm-variable",
+                                        options=[
+                                            {"label": label, "value": value}
+                                            for value, label in VARIABLES.items()
+                                        ],
+                                        value="P2",
+                                    ),
+                                    html.P("Downsampling"),
+                                    dcc.RadioItems(
+                                        id="radio-pm-downsampling",
+                                        options=[
+                                            {"label": "Shape (LTTB)", "value": "lttb"},
+                                            {
+                                                "label": "Peaks (min/max)",
+                                                "value": "minmax",
+                                            },
+                                        ],
+                                        value="lttb",
+                                    ),
+                                ],
+                            ),
+                            html.Div(
+                                id="div-graphs",
+                                children=dcc.Graph(id="graph-pm-timeseries"),
+                            ),
+                            # x range of the current zoom, in nanoseconds
+                            dcc.Store(id="store-pm-range"),
+                        ],
+                    )
+                ],
+            ),
+        ]
+    )
+
+
+def parse_relayout(relayout_data, previous=None):
+    """x range (ns) of a relayout event of the graph, None for the full range.
+
+    Events without x range (e.g. zooming only the y axis) keep the previous range."""
+    if not relayout_data:
+        return previous
+    if relayout_data.get("xaxis.autorange"):
+        return None
+    if "xaxis.range[0]" in relayout_data:
+        bounds = relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]
+    elif "xaxis.range" in relayout_data:
+        bounds = relayout_data["xaxis.range"]
+    else:
+        return previous
+    return [int(pd.Timestamp(b).value) for b in bounds]
+
+
+def _array(values, dtype):
+    if TYPED_ARRAYS:
+        return encode_array(values, dtype)
+    return values.tolist()
+
+
+def serve_timeseries_figure(cache, stations, variable, method, x_range=None):
+    start, end = x_range if x_range else (None, None)
+    data = []
+    for station in stations:
+        t, values = cache.window(station, variable, start, end)
+        t, values = downsample(t, values, POINTS_PER_TRACE, method)
+        data.append(
+            dict(
+                type="scattergl",
+                mode="lines",
+                name=str(station),
+                # milliseconds since epoch, the date axis needs float64
+                x=_array(t / 1e6, "f8"),
+                y=_array(values, "f4"),
+            )
+        )
+
+    xaxis = dict(type="date")
+    if x_range:
+        xaxis["range"] = [pd.Timestamp(b).isoformat() for b in x_range]
+    return dict(
+        data=data,
+        layout=dict(
+            xaxis=xaxis,
+            yaxis=dict(title=VARIABLES.get(variable, variable)),
+            # keeps the zoom of the user when the traces are replaced
+            uirevision="pm",
+            margin=dict(l=60, r=20, t=20, b=40),
+            legend=dict(title="Station"),
+        ),
+    )
+
+
+def register(app, cache):
+    """Set the layout of the dashboard on `app` and add its callbacks."""
+    app.layout = layout(cache.stations())
+
+    @app.callback(
+        [Output("graph-pm-timeseries", "figure"), Output("store-pm-range", "data")],
+        [
+            Input("dropdown-pm-stations", "value"),
+            Input("radio-pm-variable", "value"),
+            Input("radio-pm-downsampling", "value"),
+            Input("graph-pm-timeseries", "relayoutData"),
+        ],
+        [State("store-pm-range", "data")],
+    )
+    def update_pm_graph(stations, variable, method, relayout_data, x_range):
+        triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+        if "graph-pm-timeseries.relayoutData" in triggered:
+            new_range = parse_relayout(relayout_data, x_range)
+            if new_range == x_range:
+                # e.g. y axis zoom or autosize, the plotted data stays the same
+                return dash.no_update, dash.no_update
+            x_range = new_range
+
+        figure = serve_timeseries_figure(
+            cache, stations or [], variable, method, x_range
+        )
+        return figure, x_range
+
+    return update_pm_graph
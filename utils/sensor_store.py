@@ -0,0 +1,198 @@
+"""
+Time-indexed in-memory store of the merged sensor datasets.
+
+The readings of a station (data/dataset_<sensor_id>.csv written by
+merge_df2csv, or the rows of a merged DataFrame) are kept as one sorted int64
+array of timestamps in nanoseconds and one float32 array per value column.
+A time window is found by binary search on the timestamps and returned as a
+view of these arrays, so a query costs O(log N) instead of a boolean mask over
+all rows and copies nothing. A reading takes 8 bytes plus 4 bytes per column.
+"""
+
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+
+def to_ns(value):
+    """Nanoseconds since epoch of a timestamp given as int (ns), string,
+    datetime or numpy datetime64; None stays None."""
+    if value is None or isinstance(value, (int, np.integer)):
+        return value
+    return pd.Timestamp(value).value
+
+
+def station_files(data_dir, pattern="dataset_*.csv"):
+    """Paths of the datasets in `data_dir` by station id, without reading them."""
+    regex = re.compile(re.escape(pattern).replace(r"\*", "(.+)") + "$")
+    files = {}
+    for path in glob.glob(os.path.join(data_dir, pattern)):
+        match = regex.match(os.path.basename(path))
+        if match:
+            files[match.group(1)] = path
+    return files
+
+
+def station_order(station):
+    """Sort key of station ids, numeric ids in numeric order."""
+    return len(station), station
+
+
+class StationSeries:
+    """Readings of one station sorted by time.
+
+    `t` holds the timestamps (ns) and `columns` the float32 values by column
+    name; windows of a series are views of the same arrays."""
+
+    __slots__ = ("station", "t", "columns")
+
+    def __init__(self, station, t, columns):
+        self.station = str(station)
+        self.t = t
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.t)
+
+    def __getitem__(self, col):
+        return self.t if col == "t" else self.columns[col]
+
+    @property
+    def nbytes(self):
+        return self.t.nbytes + sum(v.nbytes for v in self.columns.values())
+
+    def bounds(self, start=None, end=None, pad=0):
+        """Index range [lo, hi) of the readings from start to end (inclusive),
+        extended by `pad` readings on either side."""
+        lo = 0 if start is None else int(np.searchsorted(self.t, to_ns(start), "left"))
+        hi = (
+            len(self.t)
+            if end is None
+            else int(np.searchsorted(self.t, to_ns(end), "right"))
+        )
+        return max(lo - pad, 0), min(hi + pad, len(self.t))
+
+    def window(self, start=None, end=None, pad=0):
+        """Readings from start to end as a StationSeries of views."""
+        lo, hi = self.bounds(start, end, pad)
+        return StationSeries(
+            self.station,
+            self.t[lo:hi],
+            {col: values[lo:hi] for col, values in self.columns.items()},
+        )
+
+    def to_frame(self):
+        """Copy of the readings as a DataFrame indexed by timestamp."""
+        return pd.DataFrame(
+            self.columns, index=pd.DatetimeIndex(self.t.view("datetime64[ns]"))
+        )
+
+
+def read_station_csv(path, station, time_col="timestamp", value_cols=None, sep=";"):
+    """StationSeries of one dataset file; `value_cols` None reads all numeric
+    columns except the sensor id."""
+    usecols = None if value_cols is None else [time_col] + list(value_cols)
+    df = pd.read_csv(path, sep=sep, usecols=usecols)
+    if value_cols is None:
+        value_cols = _numeric_columns(df, (time_col, "sensor_id"))
+    t = pd.to_datetime(df[time_col]).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    order = np.argsort(t, kind="stable")
+    columns = {col: df[col].to_numpy(dtype=np.float32)[order] for col in value_cols}
+    return StationSeries(station, t[order], columns)
+
+
+def _numeric_columns(df, exclude):
+    return [
+        col
+        for col in df.columns
+        if col not in exclude and pd.api.types.is_numeric_dtype(df[col])
+    ]
+
+
+class SensorStore:
+    """Station series by station id."""
+
+    def __init__(self, series=()):
+        self._series = {s.station: s for s in series}
+
+    @classmethod
+    def from_frame(
+        cls, df, station_col="sensor_id", time_col="timestamp", value_cols=None
+    ):
+        """Store of a DataFrame with the readings of several stations, e.g.
+        the concatenated outputs of merge_df2csv."""
+        if value_cols is None:
+            value_cols = _numeric_columns(df, (station_col, time_col))
+        stations = df[station_col].astype(str).to_numpy()
+        t = pd.to_datetime(df[time_col]).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        # one sort by station and time instead of one mask per station, the
+        # series are views of the sorted arrays
+        order = np.lexsort((t, stations))
+        stations, t = stations[order], t[order]
+        values = {col: df[col].to_numpy(dtype=np.float32)[order] for col in value_cols}
+        starts = np.flatnonzero(np.r_[True, stations[1:] != stations[:-1]])
+        ends = np.r_[starts[1:], len(stations)]
+        return cls(
+            StationSeries(
+                stations[lo],
+                t[lo:hi],
+                {col: v[lo:hi] for col, v in values.items()},
+            )
+            for lo, hi in zip(starts, ends)
+        )
+
+    @classmethod
+    def from_csv(
+        cls,
+        data_dir,
+        pattern="dataset_*.csv",
+        time_col="timestamp",
+        value_cols=None,
+        sep=";",
+        stations=None,
+    ):
+        """Store of the dataset files in `data_dir`, optionally only of `stations`."""
+        files = station_files(data_dir, pattern)
+        if stations is not None:
+            files = {str(s): files[str(s)] for s in stations}
+        return cls(
+            read_station_csv(path, station, time_col, value_cols, sep)
+            for station, path in files.items()
+        )
+
+    def __len__(self):
+        return len(self._series)
+
+    def __contains__(self, station):
+        return str(station) in self._series
+
+    def __getitem__(self, station):
+        return self._series[str(station)]
+
+    def add(self, series):
+        self._series[series.station] = series
+
+    def stations(self):
+        return sorted(self._series, key=station_order)
+
+    @property
+    def nbytes(self):
+        return sum(s.nbytes for s in self._series.values())
+
+    def window(self, station, start=None, end=None, pad=0):
+        """Readings of a station from start to end, as views."""
+        return self[station].window(start, end, pad)
+
+    def query(self, start=None, end=None, stations=None):
+        """Readings from start to end of several stations (default: all), by
+        station id; stations without readings in the window are left out."""
+        stations = self.stations() if stations is None else [str(s) for s in stations]
+        windows = {}
+        for station in stations:
+            window = self.window(station, start, end)
+            if len(window):
+                windows[station] = window
+        return windows
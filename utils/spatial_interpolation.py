@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Spatial interpolation of PM2.5 predictions from the station points onto a regular grid (eg. the city of Stuttgart).
+The neighbours and weights of each grid cell are searched once with a KD-tree for a fixed set of stations,
+afterwards all timestamps are interpolated together by a single sparse matrix product.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.sparse import csr_matrix
+
+
+EARTH_RADIUS = 6371000.0  # metres
+
+
+def lonlat_to_xy(lon, lat, lat_ref):
+	"""
+	--- Project geographic coordinates to local metric coordinates (equirectangular projection) ----
+	lon : array of longitudes in degrees
+	lat : array of latitudes in degrees
+	lat_ref : reference latitude in degrees, eg. the centre of the study area
+	return numpy array of shape (n, 2) with x and y in metres
+	"""
+	lon = np.radians(np.asarray(lon, dtype=np.float64))
+	lat = np.radians(np.asarray(lat, dtype=np.float64))
+	x = EARTH_RADIUS * lon * np.cos(np.radians(lat_ref))
+	y = EARTH_RADIUS * lat
+	return np.column_stack([x, y])
+
+
+def make_grid(bounds, resolution):
+	"""
+	--- Create the cell centres of a regular grid in geographic coordinates ----
+	bounds : list of coordinates in epsg:4326, format [min_x, min_y, max_x, max_y]
+	resolution : cell size in degrees
+	return tuple of 2-dimensional arrays (lon, lat) with the first row in the north, and the affine transformation
+	"""
+	from affine import Affine
+
+	min_x, min_y, max_x, max_y = bounds
+	n_cols = int(np.ceil(round((max_x - min_x) / resolution, 6)))
+	n_rows = int(np.ceil(round((max_y - min_y) / resolution, 6)))
+	lons = min_x + (np.arange(n_cols) + 0.5) * resolution
+	lats = max_y - (np.arange(n_rows) + 0.5) * resolution
+	grid_lon, grid_lat = np.meshgrid(lons, lats)
+	transform = Affine(resolution, 0.0, min_x, 0.0, -resolution, max_y)
+
+	return grid_lon, grid_lat, transform
+
+
+class GridInterpolator:
+	"""
+	--- Interpolate values of fixed stations onto a grid for many timestamps at once ----
+	station_lon, station_lat : arrays with the coordinates of the stations
+	grid_lon, grid_lat : arrays (eg. from make_grid) with the coordinates of the grid cells
+	method : "idw" (inverse distance weighting of the k nearest stations) or "nearest"
+	k : number of nearest stations used for "idw"
+	power : power of the inverse distance for "idw"
+	"""
+
+	def __init__(self, station_lon, station_lat, grid_lon, grid_lat, method="idw", k=4, power=2.0):
+		if method not in ["idw", "nearest"]:
+			raise ValueError("Interpolation method incorrectly specified. Please choose 'idw' or 'nearest'.")
+
+		station_lon = np.asarray(station_lon, dtype=np.float64)
+		station_lat = np.asarray(station_lat, dtype=np.float64)
+		self.grid_shape = np.shape(grid_lon)
+		self.n_stations = len(station_lon)
+
+		lat_ref = station_lat.mean()
+		station_xy = lonlat_to_xy(station_lon, station_lat, lat_ref)
+		grid_xy = lonlat_to_xy(np.ravel(grid_lon), np.ravel(grid_lat), lat_ref)
+
+		k = 1 if method == "nearest" else min(k, self.n_stations)
+		dist, idx = cKDTree(station_xy).query(grid_xy, k=k)
+		dist = dist.reshape(len(grid_xy), k)
+		idx = idx.reshape(len(grid_xy), k)
+
+		if method == "nearest":
+			weights = np.ones_like(dist)
+		else:
+			# a minimum distance of 1 mm gives cells on top of a station (practically) the value of this station,
+			# while the other neighbours are still used if the station has no value at a timestamp
+			weights = 1.0 / np.maximum(dist, 1e-3) ** power
+			weights /= weights.sum(axis=1, keepdims=True)
+
+		rows = np.repeat(np.arange(len(grid_xy)), k)
+		self.weights = csr_matrix((weights.ravel(), (rows, idx.ravel())), shape=(len(grid_xy), self.n_stations))
+
+	def interpolate(self, values):
+		"""
+		--- Interpolate station values of one or many timestamps ----
+		values : array of shape (n_stations,) or (n_timestamps, n_stations), missing values as NaN
+		return numpy array of shape grid_shape or (n_timestamps,) + grid_shape
+		"""
+		values = np.asarray(values, dtype=np.float64)
+		single = values.ndim == 1
+		values = np.atleast_2d(values)
+		if values.shape[1] != self.n_stations:
+			raise ValueError("Number of values ({}) does not match the number of stations ({}).".format(values.shape[1], self.n_stations))
+
+		missing = np.isnan(values)
+		if missing.any():
+			# renormalize the weights of each cell over the stations which have a value
+			numerator = self.weights @ np.where(missing, 0.0, values).T
+			denominator = self.weights @ (~missing).T.astype(np.float64)
+			with np.errstate(invalid="ignore", divide="ignore"):
+				grids = (numerator / denominator).T
+		else:
+			grids = (self.weights @ values.T).T
+
+		grids = grids.reshape((len(values),) + self.grid_shape)
+		return grids[0] if single else grids
+
+
+def predictions_to_matrix(df, value_col, time_col="timestamp", station_col="sensor_id"):
+	"""
+	--- Reshape predictions in long format (one row per station and timestamp) to a matrix ----
+	df : pandas DataFrame with columns for time, station, lon, lat and the predicted value
+	value_col : string indicating the column with the predicted values
+	time_col : string indicating the column with the timestamps
+	station_col : string indicating the column with the station ids
+	return tuple of (timestamps, stations as DataFrame with lon and lat, values of shape (n_timestamps, n_stations))
+	"""
+	stations = df.groupby(station_col)[["lon", "lat"]].first()
+	matrix = df.pivot_table(index=time_col, columns=station_col, values=value_col, aggfunc="mean")
+	matrix = matrix.reindex(columns=stations.index).sort_index()
+
+	return matrix.index, stations, matrix.to_numpy(dtype=np.float64)
+
+
+def write_grids(outfilepath, grids, transform, crs="EPSG:4326", timestamps=None):
+	"""
+	--- Save time-stacked grids as numpy file (.npy) or as multiband GeoTIFF (one band per timestamp) ----
+	outfilepath : path of the output file, the file type is chosen by the ending
+	grids : array of shape (n_timestamps, rows, cols)
+	transform : affine transformation of the grid (eg. from make_grid)
+	crs : crs of the grid given as string
+	timestamps : optional list of timestamps, used as band descriptions of the GeoTIFF
+	"""
+	grids = np.asarray(grids, dtype=np.float32)
+	if outfilepath.endswith(".npy"):
+		np.save(outfilepath, grids)
+		return
+
+	import rasterio as rio
+
+	profile = {"driver": "GTiff", "dtype": "float32", "count": grids.shape[0], "height": grids.shape[1],
+		"width": grids.shape[2], "crs": crs, "transform": transform, "nodata": np.nan, "compress": "deflate"}
+	with rio.open(outfilepath, "w", **profile) as dst:
+		dst.write(grids)
+		if timestamps is not None:
+			for band, timestamp in enumerate(timestamps, start=1):
+				dst.set_band_description(band, str(timestamp))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the synthetic archive and the baseline comparison of "benchmark_finalproject"
+"""
+
+import os
+import glob
+import pandas as pd
+
+from benchmark_finalproject import *
+
+
+def test_generate_sensor_archive(tmp_path):
+	"""
+	--- Check if one file per sensor and day is written in the layout of archive.sensor.community ---
+	"""
+	# when
+	sensor_ids = generate_sensor_archive(str(tmp_path), n_sensors=2, n_days=3, readings_per_hour=4)
+	files = glob.glob(os.path.join(str(tmp_path), "**", "*.csv"), recursive=True)
+	df = pd.read_csv(files[0], sep=";")
+
+	# then
+	assert len(sensor_ids) == 2
+	assert len(files) == 2 * 3
+	assert os.path.basename(files[0]).split("_sds011_sensor_")[1] in ["1000.csv", "1001.csv"]
+	assert list(df.columns) == SENSOR_COLS
+	assert len(df) == 24 * 4
+
+
+
+def test_compare_to_baseline():
+	"""
+	--- Check if only stages slower than the tolerance are reported ---
+	"""
+	# Given
+	baseline = {"stages": {"fit": {"wall_time_s": 1.0}, "predict": {"wall_time_s": 1.0}}}
+	report = {"stages": {"fit": {"wall_time_s": 1.1}, "predict": {"wall_time_s": 1.5}, "new_stage": {"wall_time_s": 9.0}}}
+
+	# when
+	regressions = compare_to_baseline(report, baseline, tolerance=0.2)
+
+	# then
+	assert len(regressions) == 1
+	assert regressions[0].startswith("predict")
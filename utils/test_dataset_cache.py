@@ -0,0 +1,78 @@
+"""
+Tests for the precomputed datasets of the SVM Explorer in "dataset_cache"
+"""
+
+import numpy as np
+from sklearn import datasets
+
+from dataset_cache import *
+
+
+class CountingGenerator:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, n_samples, dataset, noise):
+        self.calls += 1
+        return datasets.make_moons(n_samples=n_samples, noise=noise, random_state=0)
+
+
+def test_DatasetCache_lazy():
+    """
+    --- Check if each combination is generated once, as float32, and if noise values are rounded ---
+    """
+    # Given
+    generator = CountingGenerator()
+    cache = DatasetCache(generator, ["moons"], [100, 200], [0.1, 0.3])
+
+    # when
+    data = cache.get("moons", 100, 0.30000000000000004)
+    data_again = cache.get("moons", 100, 0.3)
+
+    # then
+    assert generator.calls == 1
+    assert data is data_again
+    assert data["X"].dtype == np.float32
+    assert len(data["X_train"]) == 60 and len(data["X_test"]) == 40
+    assert np.allclose(data["X"].mean(axis=0), 0, atol=1e-6)
+
+
+def test_DatasetCache_persisted(tmp_path):
+    """
+    --- Check if warm_up builds all combinations and a new cache reads them from disk ---
+    """
+    # Given
+    generator = CountingGenerator()
+    DatasetCache(generator, ["moons"], [100, 200], [0.1, 0.3], cache_dir=str(tmp_path)).warm_up()
+
+    # when
+    reloaded_generator = CountingGenerator()
+    cache = DatasetCache(reloaded_generator, ["moons"], [100, 200], [0.1, 0.3], cache_dir=str(tmp_path))
+    cache.warm_up()
+
+    # then
+    assert generator.calls == 4
+    assert reloaded_generator.calls == 0
+    assert len(cache) == 4
+    assert len(list(tmp_path.iterdir())) == 4
+
+
+def test_DatasetCache_corrupt_file(tmp_path):
+    """
+    --- Check if an unreadable cache file is rebuilt and no temporary files are left ---
+    """
+    # Given
+    generator = CountingGenerator()
+    cache = DatasetCache(generator, ["moons"], [100], [0.1], cache_dir=str(tmp_path))
+    path = tmp_path / "moons_100_0.1.npz"
+    path.write_bytes(b"PK\x03\x04 partially written")
+
+    # when
+    data = cache.get("moons", 100, 0.1)
+    reloaded = DatasetCache(generator, ["moons"], [100], [0.1], cache_dir=str(tmp_path))
+    data_reloaded = reloaded.get("moons", 100, 0.1)
+
+    # then
+    assert generator.calls == 1
+    assert np.array_equal(data["X"], data_reloaded["X"])
+    assert [p.name for p in tmp_path.iterdir()] == ["moons_100_0.1.npz"]
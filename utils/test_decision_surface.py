@@ -0,0 +1,120 @@
+"""
+Tests for the mesh evaluation of the SVM Explorer in "decision_surface"
+"""
+
+import numpy as np
+
+from decision_surface import *
+
+
+class CountingCircle:
+    """Decision function x^2 + y^2 - 1 which counts the evaluated points."""
+
+    def __init__(self):
+        self.n_points = 0
+
+    def __call__(self, points):
+        self.n_points += len(points)
+        return points[:, 0] ** 2 + points[:, 1] ** 2 - 1
+
+
+def test_evaluate_points_chunked():
+    """
+    --- Check if the chunked evaluation on the thread pool equals one evaluation of all points ---
+    """
+    # Given
+    rng = np.random.RandomState(0)
+    x, y = rng.normal(size=(2, 5000))
+    circle = CountingCircle()
+
+    # when
+    values = evaluate_points(circle, x, y, chunk_size=512)
+
+    # then
+    assert circle.n_points == 5000
+    assert np.array_equal(values, x ** 2 + y ** 2 - 1)
+
+
+def test_evaluate_mesh_refined():
+    """
+    --- Check if the boundary is exact with fewer evaluations than the full mesh ---
+    """
+    # Given
+    xs = np.arange(-3, 3, 0.05)
+    ys = np.arange(-3, 3, 0.05)
+    xx, yy = np.meshgrid(xs, ys)
+    exp_Z = (xx ** 2 + yy ** 2 - 1).ravel()
+    circle = CountingCircle()
+
+    # when
+    Z = evaluate_mesh(circle, xs, ys, coarse_factor=4)
+
+    # then
+    near_boundary = np.abs(exp_Z) < 0.02
+    assert Z.shape == exp_Z.shape
+    assert np.allclose(Z[near_boundary], exp_Z[near_boundary])
+    assert np.array_equal(np.sign(Z), np.sign(exp_Z))
+    assert circle.n_points < 0.5 * len(exp_Z)
+
+
+def test_evaluate_mesh_level_range():
+    """
+    --- Check if all contours within a range of levels are exact ---
+    """
+    # Given
+    xs = np.arange(-3, 3, 0.05)
+    ys = np.arange(-3, 3, 0.05)
+    xx, yy = np.meshgrid(xs, ys)
+    exp_Z = (xx ** 2 + yy ** 2 - 1).ravel()
+    circle = CountingCircle()
+
+    # when
+    Z = evaluate_mesh(circle, xs, ys, coarse_factor=4, level=(0.0, 1.0))
+
+    # then
+    in_range = (exp_Z > 0.1) & (exp_Z < 0.9)
+    assert np.allclose(Z[in_range], exp_Z[in_range])
+    assert not np.allclose(Z, exp_Z)
+
+
+def test_evaluate_mesh_n_levels():
+    """
+    --- Check if the contours of evenly spaced levels between the coarse extremes are exact ---
+    """
+    # Given
+    xs = np.arange(-3, 3, 0.05)
+    ys = np.arange(-3, 3, 0.05)
+    xx, yy = np.meshgrid(xs, ys)
+    exp_Z = (xx ** 2 + yy ** 2 - 1).ravel()
+    circle = CountingCircle()
+
+    # when
+    Z = evaluate_mesh(circle, xs, ys, coarse_factor=4, n_levels=5)
+
+    # then
+    levels = np.linspace(exp_Z.min(), exp_Z.max(), 5)
+    near_level = np.abs(exp_Z[:, None] - levels[None, :]).min(axis=1) < 0.02
+    assert np.allclose(Z[near_level], exp_Z[near_level])
+    assert circle.n_points < len(exp_Z)
+
+
+def test_evaluate_mesh_subcell_island():
+    """
+    --- Check the documented limitation: an island smaller than a coarse cell is only found with coarse_factor=1 ---
+    """
+    # Given
+    xs = np.arange(0, 3, 0.05)
+    ys = np.arange(0, 3, 0.05)
+
+    def island(points):
+        # positive except for a dip of radius ~0.05 between the coarse nodes
+        r2 = (points[:, 0] - 1.1) ** 2 + (points[:, 1] - 1.1) ** 2
+        return 1 - 2 * np.exp(-r2 / 0.002)
+
+    # when
+    Z_coarse = evaluate_mesh(island, xs, ys, coarse_factor=4)
+    Z_exact = evaluate_mesh(island, xs, ys, coarse_factor=1)
+
+    # then
+    assert Z_exact.min() < 0
+    assert Z_coarse.min() > 0
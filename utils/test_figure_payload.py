@@ -0,0 +1,63 @@
+"""
+Tests for the compact figure payloads of the SVM Explorer in "figure_payload"
+"""
+
+import json
+
+import numpy as np
+
+from figure_payload import *
+
+
+def test_compact_figure():
+    """
+    --- Check if numeric arrays are sent as float32 typed arrays or rounded lists ---
+    """
+    # Given
+    Z = np.linspace(-1, 1, 12).reshape(3, 4)
+    figure = {
+        "data": [
+            {"type": "contour", "x": np.arange(4.0), "y": np.arange(3.0), "z": Z},
+            {
+                "type": "scatter",
+                "x": [0.123456789, 1.0],
+                "y": [2.0, 3.0],
+                "name": "Training Data",
+                "marker": {"color": [0, 1], "colorscale": "RdBu"},
+            },
+        ],
+        "layout": {"title": "test"},
+    }
+
+    # when
+    typed = compact_figure(figure, typed_arrays=True)
+    plain = compact_figure(figure, typed_arrays=False)
+
+    # then
+    assert typed["data"][0]["z"]["dtype"] == "f4"
+    assert typed["data"][0]["z"]["shape"] == "3,4"
+    np.testing.assert_allclose(decode_array(typed["data"][0]["z"]), Z, atol=1e-6)
+    assert typed["data"][1]["name"] == "Training Data"
+    assert typed["data"][1]["marker"]["colorscale"] == "RdBu"
+    assert decode_array(typed["data"][1]["marker"]["color"]).tolist() == [0, 1]
+    assert typed["layout"] == figure["layout"]
+    assert plain["data"][1]["x"] == [0.1235, 1.0]
+    assert len(plain["data"][0]["z"]) == 3
+    # float32 buffers are smaller than the list of floats
+    assert len(json.dumps(typed["data"][0]["z"])) < len(json.dumps(Z.tolist()))
+
+
+def test_compact_figure_reencodes_float64():
+    """
+    --- Check if float64 typed arrays (plotly >= 6) are re-encoded as float32 ---
+    """
+    # Given
+    values = np.random.RandomState(0).rand(100)
+    figure = {"data": [{"type": "scatter", "x": encode_array(values, "f8")}]}
+
+    # when
+    compact = compact_figure(figure, typed_arrays=True)
+
+    # then
+    assert compact["data"][0]["x"]["dtype"] == "f4"
+    np.testing.assert_allclose(decode_array(compact["data"][0]["x"]), values, rtol=1e-6)
@@ -0,0 +1,109 @@
+"""
+Tests for the background worker pool of the SVM Explorer in "jobs"
+"""
+
+import threading
+import time
+
+from jobs import *
+
+
+def test_JobQueue_supersede():
+    """
+    --- Check if a new job of a session cancels the previous one, also while it is running ---
+    """
+    # Given
+    queue = JobQueue(max_workers=1)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_fit():
+        calls.append(1)
+        report_progress(0.1, "Generating data")
+        started.set()
+        release.wait(5)
+        report_progress(0.5, "Fitting SVM")  # stops here if superseded
+        return "stale model"
+
+    # when
+    running = queue.submit("session-a", slow_fit)
+    started.wait(5)
+    queued = queue.submit("session-a", slow_fit)
+    latest = queue.submit("session-a", lambda: "model")
+    other = queue.submit("session-b", lambda: "other model")
+    release.set()
+    latest.future.result(5)
+    other.future.result(5)
+    running.future.result(5)
+
+    # then
+    assert running.status == "cancelled"
+    assert queued.status == "cancelled"
+    assert len(calls) == 1  # the cancelled queued fit never started
+    assert latest.status == "done" and latest.result == "model"
+    assert other.status == "done"
+    assert queue.get(latest.id).to_dict()["progress"] == 1.0
+
+
+def test_report_progress_outside_job():
+    """
+    --- Check if progress reports are ignored outside of a job ---
+    """
+    assert report_progress(0.5, "Fitting SVM") is None
+
+
+def test_RequestCoalescer():
+    """
+    --- Check if identical requests share one computation and queued stale requests are dropped ---
+    """
+    # Given
+    coalescer = RequestCoalescer(max_concurrent=1)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fit(name):
+        calls.append(name)
+        started.set()
+        release.wait(5)
+        return name
+
+    def request(key, session_id, results):
+        try:
+            results[session_id] = coalescer.run(key, fit, key, session_id=session_id)
+        except RequestSuperseded:
+            results[session_id] = "superseded"
+
+    # when
+    results = {}
+    threads = [threading.Thread(target=request, args=("a", "session-a", results))]
+    threads[0].start()
+    started.wait(5)
+    # the same parameters from another session share the running computation
+    threads.append(threading.Thread(target=request, args=("a", "session-b", results)))
+    # session-c waits for the only slot, then moves its slider once more
+    threads.append(threading.Thread(target=request, args=("b", "session-c", results)))
+    threads[1].start()
+    threads[2].start()
+    time.sleep(0.1)
+    newest = {}
+    threads.append(threading.Thread(target=request, args=("c", "session-c", newest)))
+    threads[3].start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    # then
+    assert results == {"session-a": "a", "session-b": "a", "session-c": "superseded"}
+    assert newest == {"session-c": "c"}
+    assert calls == ["a", "c"]
+    assert coalescer.info() == {
+        "requests": 4,
+        "computed": 2,
+        "coalesced": 1,
+        "superseded": 1,
+        "failed": 0,
+        "in_flight": 0,
+    }
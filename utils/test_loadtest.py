@@ -0,0 +1,92 @@
+"""
+Tests for the load test of the Dash callbacks in "loadtest"
+"""
+
+import dash
+from dash.dependencies import Input, Output, State
+
+try:
+    from dash import dcc, html
+except ImportError:  # dash < 2
+    import dash_core_components as dcc
+    import dash_html_components as html
+
+from loadtest import *
+
+
+def make_app():
+    app = dash.Dash(__name__)
+    app.layout = html.Div(
+        [
+            dcc.Slider(id="slider-a", min=0, max=10, step=1, value=0),
+            dcc.Dropdown(
+                id="dropdown-b",
+                options=[{"label": v, "value": v} for v in ["x", "y"]],
+                value="x",
+            ),
+            html.Div(id="div-graphs"),
+            html.Div(id="div-label"),
+        ]
+    )
+
+    @app.callback(
+        [Output("div-graphs", "children"), Output("div-label", "children")],
+        [Input("slider-a", "value"), Input("dropdown-b", "value")],
+    )
+    def update(a, b):
+        return "{}-{}".format(a, b), b
+
+    @app.callback(
+        Output("slider-a", "marks"),
+        [Input("dropdown-b", "value")],
+        [State("slider-a", "value")],
+    )
+    def update_marks(b, a):
+        return {str(a): b}
+
+    return app
+
+
+def test_run_load_test():
+    """
+    --- Check if concurrent users drag the controls and every callback is reported ---
+    """
+    # Given
+    client = InProcessClient(make_app().server)
+
+    # when
+    summary = run_load_test(client, users=3, drags=4, steps=3, think_time=0)
+
+    # then
+    callbacks = summary["callbacks"]
+    assert set(callbacks) == {
+        "..div-graphs.children...div-label.children..",
+        "slider-a.marks",
+    }
+    assert all(c["errors"] == 0 for c in callbacks.values())
+    # page load of every user plus at least one request per drag
+    assert (
+        callbacks["..div-graphs.children...div-label.children.."]["requests"] >= 3 * 5
+    )
+    assert summary["requests"] == sum(c["requests"] for c in callbacks.values())
+    assert {"p50_ms", "p95_ms", "p99_ms", "cpu_mean_ms"} <= set(
+        callbacks["slider-a.marks"]
+    )
+
+
+def test_drag():
+    """
+    --- Check if a drag moves through the values between the current and a random target ---
+    """
+    # Given
+    values = option_values({"min": 0, "max": 1, "step": 0.1})
+    rng = random.Random(1)
+
+    # when
+    path = drag(values, 0.5, steps=20, rng=rng)
+
+    # then
+    assert len(values) == 11
+    assert 0.5 not in path and len(path) >= 1
+    assert all(v in values for v in path)
+    assert path == sorted(path) or path == sorted(path, reverse=True)
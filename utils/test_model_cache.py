@@ -0,0 +1,68 @@
+"""
+Tests for the caches of the SVM Explorer in "model_cache"
+"""
+
+from model_cache import *
+
+
+def test_LRUCache():
+    """
+    --- Check if the least recently used entry is evicted and if hits and misses are counted ---
+    """
+    # Given
+    cache = LRUCache(maxsize=2)
+    cache.put(("rbf", 1.0), "model a")
+    cache.put(("rbf", 2.0), "model b")
+
+    # when
+    cache.get(("rbf", 1.0))  # a is now more recently used than b
+    cache.put(("poly", 1.0), "model c")
+
+    # then
+    assert ("rbf", 1.0) in cache
+    assert ("rbf", 2.0) not in cache
+    assert cache.get(("rbf", 2.0)) is None
+    assert cache.info() == {"hits": 1, "misses": 1, "size": 2, "maxsize": 2}
+
+
+def test_DiskCache(tmp_path):
+    """
+    --- Check if entries are shared between instances and evicted when exceeding max_bytes ---
+    """
+    # Given
+    path = str(tmp_path / "cache.sqlite")
+    cache = DiskCache(path, max_bytes=2500)
+    other_worker = DiskCache(path, max_bytes=2500)
+
+    # when
+    cache.put(("rbf", 1.0), b"a" * 1000)
+    cache.put(("rbf", 2.0), b"b" * 1000)
+    other_worker.get(("rbf", 1.0))  # a is now more recently used than b
+    other_worker.put(("poly", 1.0), b"c" * 1000)
+
+    # then
+    assert other_worker.get(("rbf", 2.0)) is None
+    assert cache.get(("rbf", 1.0)) == b"a" * 1000
+    assert cache.get(("poly", 1.0)) == b"c" * 1000
+    assert ("rbf", 2.0) not in cache
+    assert len(cache) == 2
+    assert cache.info()["bytes"] <= 2500
+
+
+def test_TieredCache(tmp_path):
+    """
+    --- Check if hits of the shared cache are copied into the local cache ---
+    """
+    # Given
+    shared = DiskCache(str(tmp_path / "cache.sqlite"))
+    cache = TieredCache(LRUCache(maxsize=2), shared)
+    other_worker = TieredCache(LRUCache(maxsize=2), shared)
+
+    # when
+    cache.put(("rbf", 1.0), {"Z": [1, 2, 3]})
+    value = other_worker.get(("rbf", 1.0))
+
+    # then
+    assert value == {"Z": [1, 2, 3]}
+    assert ("rbf", 1.0) in other_worker.local
+    assert other_worker.get(("rbf", 2.0), "missing") == "missing"
@@ -0,0 +1,80 @@
+"""
+Tests for the time-indexed sensor store in "sensor_store"
+"""
+
+import numpy as np
+import pandas as pd
+
+from sensor_store import *
+
+
+def _readings():
+    frames = []
+    for station in [12441, 2199]:
+        frames.append(
+            pd.DataFrame(
+                {
+                    "timestamp": pd.date_range("2020-10-01", periods=48, freq="H")[
+                        ::-1
+                    ].astype(str),
+                    "sensor_id": station,
+                    "P1": np.arange(48.0)[::-1] + station,
+                    "P2": np.arange(48.0)[::-1] / 2,
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_SensorStore_window():
+    """
+    --- Check if a time window equals the boolean mask over the DataFrame and is a view of the store ---
+    """
+    # Given
+    df = _readings()
+    store = SensorStore.from_frame(df)
+    start, end = "2020-10-01 10:00", "2020-10-01 12:00"
+
+    # when
+    window = store.window(12441, start, end)
+    padded = store.window("12441", start, end, pad=1)
+    windows = store.query("2020-10-02 23:00")
+    mask = (
+        (df["sensor_id"] == 12441)
+        & (pd.to_datetime(df["timestamp"]) >= start)
+        & (pd.to_datetime(df["timestamp"]) <= end)
+    )
+
+    # then
+    assert store.stations() == ["2199", "12441"]
+    assert window.columns["P1"].dtype == np.float32 and window.t.dtype == np.int64
+    assert window["P1"].tolist() == sorted(df.loc[mask, "P1"].tolist())
+    assert len(padded) == len(window) + 2
+    assert np.shares_memory(window["P1"], store["12441"]["P1"])
+    assert {s: len(w) for s, w in windows.items()} == {"2199": 1, "12441": 1}
+    assert window.to_frame().index[0] == pd.Timestamp(start)
+    assert store.nbytes == 2 * 48 * (8 + 4 + 4)
+
+
+def test_SensorStore_from_csv(tmp_path):
+    """
+    --- Check if the dataset files are read per station and sorted by time ---
+    """
+    # Given
+    df = _readings()
+    for station, station_df in df.groupby("sensor_id"):
+        station_df.to_csv(
+            tmp_path / "dataset_{}.csv".format(station), sep=";", index=False
+        )
+
+    # when
+    store = SensorStore.from_csv(str(tmp_path), value_cols=["P2"])
+    only = SensorStore.from_csv(str(tmp_path), stations=[2199])
+
+    # then
+    assert store.stations() == ["2199", "12441"]
+    assert list(store["2199"].columns) == ["P2"]
+    assert np.all(np.diff(store["2199"].t) > 0)
+    assert store["2199"]["P2"][0] == 0.0
+    assert only.stations() == ["2199"]
+    assert sorted(only["2199"].columns) == ["P1", "P2"]
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the interpolation of station values onto a grid in "spatial_interpolation"
+"""
+
+import numpy as np
+import pandas as pd
+
+from spatial_interpolation import *
+
+
+def test_GridInterpolator_idw():
+	"""
+	--- Check if cells on a station get its value, cells in between a weighted mean and if NaNs are skipped ---
+	"""
+	# Given
+	station_lon = [9.10, 9.20]
+	station_lat = [48.75, 48.75]
+	grid_lon = np.array([[9.10, 9.15, 9.20]])
+	grid_lat = np.array([[48.75, 48.75, 48.75]])
+	values = np.array([[10.0, 20.0], [np.nan, 30.0]])
+
+	# when
+	interpolator = GridInterpolator(station_lon, station_lat, grid_lon, grid_lat, method="idw", k=2)
+	grids = interpolator.interpolate(values)
+
+	# then
+	assert grids.shape == (2, 1, 3)
+	assert np.allclose(grids[0], [[10.0, 15.0, 20.0]])
+	assert np.allclose(grids[1], [[30.0, 30.0, 30.0]])
+
+
+
+def test_GridInterpolator_nearest():
+	"""
+	--- Check if each cell gets the value of the closest station and if a 1-dimensional input returns one grid ---
+	"""
+	# Given
+	grid_lon, grid_lat, transform = make_grid([9.0, 48.7, 9.3, 48.8], 0.05)
+
+	# when
+	interpolator = GridInterpolator([9.01, 9.29], [48.75, 48.75], grid_lon, grid_lat, method="nearest")
+	grid = interpolator.interpolate([1.0, 2.0])
+
+	# then
+	assert grid.shape == (2, 6)
+	assert (grid[:, :3] == 1.0).all()
+	assert (grid[:, 3:] == 2.0).all()
+	assert transform.c == 9.0 and transform.f == 48.8
+
+
+
+def test_predictions_to_matrix():
+	"""
+	--- Check if long format predictions are pivoted to timestamps x stations ---
+	"""
+	# Given
+	df = pd.DataFrame({"timestamp": ["t1", "t1", "t2"], "sensor_id": [1, 2, 2],
+		"lon": [9.1, 9.2, 9.2], "lat": [48.7, 48.8, 48.8], "P2_pred": [5.0, 6.0, 7.0]})
+
+	# when
+	timestamps, stations, values = predictions_to_matrix(df, "P2_pred")
+
+	# then
+	assert list(timestamps) == ["t1", "t2"]
+	assert list(stations.lon) == [9.1, 9.2]
+	assert np.isnan(values[1, 0])
+	assert values[1, 1] == 7.0
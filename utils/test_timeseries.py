@@ -0,0 +1,66 @@
+"""
+Tests for the station time series of the PM2.5 dashboard in "timeseries"
+"""
+
+import numpy as np
+import pandas as pd
+
+from timeseries import *
+
+
+def test_downsample():
+    """
+    --- Check if LTTB and min/max reduce the points but keep a single peak ---
+    """
+    # Given
+    x = np.arange(10000)
+    y = np.sin(x / 500.0)
+    y[4321] = 50.0
+
+    # when
+    x_lttb, y_lttb = downsample(x, y, 200, "lttb")
+    x_minmax, y_minmax = downsample(x, y, 200, "minmax")
+
+    # then
+    assert len(x_lttb) == 200
+    assert x_lttb[0] == 0 and x_lttb[-1] == 9999
+    assert len(x_minmax) <= 200
+    assert 4321 in x_lttb and 4321 in x_minmax
+    assert np.all(np.diff(x_lttb) > 0) and np.all(np.diff(x_minmax) > 0)
+
+
+def test_StationSeriesCache(tmp_path):
+    """
+    --- Check if stations are loaded on first use and windows are cut by time ---
+    """
+    # Given
+    for station in [12441, 2199]:
+        pd.DataFrame(
+            {
+                "timestamp": pd.date_range("2020-10-01", periods=48, freq="H")[::-1],
+                "sensor_id": station,
+                "P1": np.arange(48.0)[::-1],
+                "P2": np.arange(48.0)[::-1] / 2,
+            }
+        ).to_csv(tmp_path / "dataset_{}.csv".format(station), sep=";", index=False)
+    cache = StationSeriesCache(str(tmp_path), maxsize=1)
+
+    # when
+    stations = cache.stations()
+    loaded_before = len(cache)
+    t, values = cache.window(
+        "2199",
+        "P2",
+        pd.Timestamp("2020-10-01 10:00").value,
+        pd.Timestamp("2020-10-01 12:00").value,
+    )
+    cache.window("12441", "P1")
+
+    # then
+    assert stations == ["2199", "12441"]
+    assert loaded_before == 0
+    assert values.dtype == np.float32
+    # one point on either side of the window
+    assert pd.to_datetime(t).hour.tolist() == [9, 10, 11, 12, 13]
+    assert values.tolist() == [4.5, 5.0, 5.5, 6.0, 6.5]
+    assert len(cache) == 1
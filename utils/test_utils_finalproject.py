@@ -13,6 +13,9 @@
 ### in CMD: python -m pytest jupyterworkflow package -- tests all in package
 
 import os
+import sys
+import subprocess
+import tracemalloc
 import pandas as pd
 import numpy as np
 from wetterdienst.dwd.observations import DWDObservationMetadata
@@ -156,4 +159,231 @@ def test_brackets():
 	# when
 	test_str = brackets(control_str)
 	# then
-	assert "Unbalanced" == test_str
\ No newline at end of file
+	assert "Unbalanced" == test_str
+
+
+def test_RunningScaler():
+	"""
+	--- Check if running statistics over several batches equal those of StandardScaler on all rows ---
+	"""
+	# Given
+	rng = np.random.RandomState(0)
+	X = rng.normal(loc=[10.0, -3.0, 1000.0], scale=[2.0, 0.5, 30.0], size=(300, 3))
+
+	# when
+	scaler = RunningScaler()
+	for batch in np.array_split(X, 7):
+		scaler.partial_fit(batch)
+	exp_scaler = StandardScaler().fit(X)
+
+	# then
+	assert scaler.n_samples_seen_ == 300
+	assert np.allclose(scaler.mean_, exp_scaler.mean_)
+	assert np.allclose(scaler.var_, exp_scaler.var_)
+	assert np.allclose(scaler.transform(X), exp_scaler.transform(X))
+
+
+
+def test_IncrementalRegressor():
+	"""
+	--- Check if only new hourly rows are used and if the support data stays bounded ---
+	"""
+	# Given
+	rng = np.random.RandomState(1)
+	index = pd.date_range("2020-10-01", periods=96, freq="H")
+	df = pd.DataFrame(rng.normal(size=(96, 2)), columns=["temperature", "humidity"], index=index)
+	df["P2"] = 2 * df.temperature - df.humidity
+
+	# when
+	model = IncrementalRegressor(["temperature", "humidity"], "P2", window_size=30)
+	n_first = model.update(df.iloc[:48])
+	n_again = model.update(df.iloc[:60])  # the first 48 rows were already seen
+
+	# then
+	assert n_first == 48
+	assert n_again == 12
+	assert model.scaler.n_samples_seen_ == 60
+	assert len(model.window) == 30
+	assert model.window.index.max() == index[59]
+	assert model.predict(df.iloc[60:]).shape == (36,)
+
+
+
+def test_instrumentation(tmp_path):
+	"""
+	--- Check if calls are only recorded while enabled and if rows, files and bytes are counted ---
+	"""
+	# Given
+	left_df = pd.DataFrame({"D": ["2020-01-01", "2020-01-02"], "A": [1, 2]})
+	right_df = pd.DataFrame({"D": ["2020-01-01", "2020-01-02"], "B": [3.0, 4.0]})
+	collector.clear()
+
+	# when
+	merge_df2csv([left_df], right_df, "D", "D", str(tmp_path), "A")
+	n_disabled = len(collector.records)
+
+	enable_instrumentation(trace_memory=True)
+	try:
+		merge_df2csv([left_df, left_df], right_df, "D", "D", str(tmp_path), "A")
+	finally:
+		disable_instrumentation()
+	summary = collector.summary()
+	prom_file = tmp_path / "metrics.prom"
+	collector.to_prometheus(str(prom_file))
+
+	# then
+	assert n_disabled == 0
+	assert summary["merge_df2csv"]["calls"] == 1
+	assert summary["merge_df2csv"]["rows"] == 4
+	assert summary["merge_df2csv"]["files"] == 2
+	assert summary["merge_df2csv"]["bytes_written"] == 2 * os.path.getsize(str(tmp_path / "dataset_1.csv"))
+	assert summary["merge_df2csv.to_csv"]["calls"] == 2
+	assert summary["merge_df2csv"]["alloc_peak_bytes"] > 0
+	assert 'finalproject_calls_total{function="merge_df2csv"} 1' in prom_file.read_text()
+	collector.clear()
+
+
+def test_instrumentation_nested_peak():
+	"""
+	--- Check if a nested span keeps the memory peak of the enclosing span, also inside an untraced span, and tracing started by the caller keeps running ---
+	"""
+	# Given
+	collector.clear()
+	tracemalloc.start()
+
+	# when
+	try:
+		enable_instrumentation()
+		with measure("untraced"):
+			enable_instrumentation(trace_memory=True)
+			with measure("outer"):
+				buffer = bytearray(8 * 1024 * 1024)
+				del buffer
+				with measure("inner"):
+					pass
+		disable_instrumentation()
+		still_tracing = tracemalloc.is_tracing()
+	finally:
+		tracemalloc.stop()
+	summary = collector.summary()
+
+	# then
+	assert summary["outer"]["alloc_peak_bytes"] >= 8 * 1024 * 1024
+	assert 0 <= summary["inner"]["alloc_peak_bytes"] < 1024 * 1024
+	assert summary["untraced"]["calls"] == 1
+	assert still_tracing
+	collector.clear()
+
+
+
+def test_assign_nearest_stations():
+	"""
+	--- Check if the nearest stations are found by haversine distance and if the weights sum up to one ---
+	"""
+	# Given
+	sensor_df = pd.DataFrame({"sensor_id": [1, 1, 2], "lat": [48.75, 48.75, 52.52], "lon": [9.17, 9.17, 13.40]})
+	station_df = pd.DataFrame({"STATION_ID": [4928, 433, 5792], "LAT": [48.83, 52.47, 47.42], "LON": [9.20, 13.40, 10.98]})
+
+	# when
+	assignments = assign_nearest_stations(sensor_df, station_df, k=2)
+	nearest = assignments.sort_values("distance_km").groupby("sensor_id").first()
+
+	# then
+	assert len(assignments) == 2 * 2
+	assert nearest.loc[1, "STATION_ID"] == 4928  # Stuttgart-Schnarrenberg
+	assert nearest.loc[2, "STATION_ID"] == 433  # Berlin-Tempelhof
+	assert 9.0 < nearest.loc[1, "distance_km"] < 9.5
+	assert np.allclose(assignments.groupby("sensor_id").weight.sum(), 1.0)
+
+
+
+def test_join_nearest_weather():
+	"""
+	--- Check if the weather is weighted by station and if missing station values are left out ---
+	"""
+	# Given
+	sensor_df = pd.DataFrame({"sensor_id": [1, 1], "timestamp": ["2020-10-01 00:00", "2020-10-01 01:00"], "P2": [5.0, 6.0]})
+	assignments = pd.DataFrame({"sensor_id": [1, 1], "STATION_ID": [10, 20], "distance_km": [1.0, 3.0], "weight": [0.75, 0.25]})
+	weather_df = pd.DataFrame({"STATION_ID": [10, 20, 10, 20],
+		"DATE": ["2020-10-01 00:00", "2020-10-01 00:00", "2020-10-01 01:00", "2020-10-01 01:00"],
+		"TEMPERATURE_AIR_200": [10.0, 14.0, np.nan, 12.0]})
+
+	# when
+	df = join_nearest_weather(sensor_df, weather_df, assignments, ["TEMPERATURE_AIR_200"], weather_time_col="DATE")
+
+	# then
+	assert len(df) == 2
+	assert "DATE" not in df.columns
+	assert np.allclose(df.TEMPERATURE_AIR_200, [11.0, 12.0])
+
+
+
+def test_StreamingQC():
+	"""
+	--- Check if each rule sets its bit and if the flags do not depend on how the stream is split into chunks ---
+	"""
+	# Given
+	hours = pd.date_range("2020-10-01", periods=40, freq="H")
+	df = pd.DataFrame({"timestamp": np.tile(hours, 2), "sensor_id": np.repeat([2199, 12441], 40),
+		"P1": np.tile(20.0 + np.arange(40) % 5, 2), "P2": np.tile(10.0 + np.arange(40) % 5, 2), "humidity": 60.0})
+	df.loc[5, "P2"] = -1.0				# out of range
+	df.loc[6, "P2"] = np.nan
+	df.loc[30, "P2"] = 300.0			# spike
+	df.loc[10, "humidity"] = 95.0
+	df.loc[40 + 20:40 + 27, "P2"] = 7.0	# stuck for 8 hours
+	## stream in time order, the stuck run and the spike window span two chunks
+	stream = df.sort_values(["timestamp", "sensor_id"])
+
+	# when
+	qc = StreamingQC(value_cols=["P1", "P2"])
+	chunked = pd.concat([qc.update(stream.iloc[:47]), qc.update(stream.iloc[47:])]).loc[df.index]
+	single = StreamingQC(value_cols=["P1", "P2"]).update(df)
+	empty = qc.update(stream.iloc[:0])
+	upper_case = StreamingQC(value_cols=["P2"]).update(df.rename(columns={"humidity": "HUMIDITY"}))
+	try:
+		StreamingQC(value_cols=["P2"]).update(df.drop(columns="humidity"))
+		missing_humidity = None
+	except KeyError as e:
+		missing_humidity = e
+	no_humidity_rule = StreamingQC(value_cols=["P2"], humidity_limit=None).update(df.drop(columns="humidity"))
+
+	# then
+	assert chunked.equals(single)
+	assert chunked["P2_qc"].dtype == np.uint8
+	flagged = {bit: chunked.index[(chunked["P2_qc"] & bit) > 0].tolist()
+		for bit in [QC_MISSING, QC_RANGE, QC_SPIKE, QC_HUMIDITY, QC_STUCK]}
+	assert flagged == {QC_MISSING: [6], QC_RANGE: [5], QC_SPIKE: [30], QC_HUMIDITY: [10], QC_STUCK: [65, 66, 67]}
+	assert chunked["P1_qc"].tolist() == [QC_HUMIDITY if i == 10 else 0 for i in range(80)]
+	assert list(empty.columns) == ["P1_qc", "P2_qc"] and len(empty) == 0 and empty["P2_qc"].dtype == np.uint8
+	assert upper_case["P2_qc"].equals(single["P2_qc"])
+	assert missing_humidity is not None
+	assert no_humidity_rule["P2_qc"].tolist() == (single["P2_qc"] & ~QC_HUMIDITY).tolist()
+
+
+
+def test_import_time():
+	"""
+	--- Check if importing the module stays within a generous startup budget and does not load the heavy dependencies ---
+	"""
+	# Given
+	## several times the usual import time, as it depends on the machine and the disk cache (IMPORT_TIME_BUDGET_S overrides it)
+	budget_s = float(os.environ.get("IMPORT_TIME_BUDGET_S", "1.0"))
+	module_dir = os.path.dirname(os.path.abspath(__file__))
+
+	# when
+	result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import utils_finalproject"],
+		cwd=module_dir, capture_output=True, text=True, check=True)
+	## stderr lines: "import time: self [us] | cumulative | imported package"
+	imports = {}
+	for line in result.stderr.splitlines()[1:]:
+		_, cumulative, name = line.split("|")
+		imports[name.strip()] = int(cumulative)
+
+	# then
+	assert not [name for name in imports if name.split(".")[0] in ("pandas", "sklearn", "wetterdienst")]
+	assert imports["utils_finalproject"] / 1e6 < budget_s
+	## the lazily imported names can still be taken from the module
+	import utils_finalproject
+	assert utils_finalproject.SVR.__name__ == "SVR"
+	## and star imports get the same names as before the lazy imports
+	assert {"pd", "np", "SVR", "StandardScaler", "DWDObservationParameterSet", "merge_df2csv"} <= set(utils_finalproject.__all__)
@@ -0,0 +1,140 @@
+"""
+Station time series of the PM2.5 dashboard.
+
+The series of a station are read from its data/dataset_<sensor_id>.csv when it
+is selected for the first time and kept sorted by time (utils/sensor_store.py),
+so the data of a zoomed time window is found by binary search. Before being sent to the browser
+a window is downsampled to about one point per pixel of the plot, with Largest
+Triangle Three Buckets (keeps the visual shape) or min/max per bucket (keeps
+the peaks).
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    from utils.sensor_store import read_station_csv, station_files, station_order
+except ImportError:  # tests import the modules of utils/ directly
+    from sensor_store import read_station_csv, station_files, station_order
+
+
+def lttb(x, y, n_out):
+    """Indices of the `n_out` points of (x, y) selected by Largest Triangle
+    Three Buckets; the first and the last point are always kept."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # n_out - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+        # (doubled) area of the triangles of the selected point a, every point
+        # of this bucket and the average of the next bucket
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(y, n_buckets):
+    """Indices of the minimum and maximum of `y` in `n_buckets` buckets of
+    consecutive points, in time order."""
+    n = len(y)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+    bucket = np.arange(n) * n_buckets // n
+    # sorted by bucket and value, the first point of a bucket is its minimum
+    # and the last one its maximum
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(n_buckets))
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.r_[order[starts], order[ends]])
+
+
+def downsample(x, y, n_out, method="lttb"):
+    """(x, y) reduced to about `n_out` points; missing values are dropped."""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    valid = np.isfinite(y)
+    if not valid.all():
+        x, y = x[valid], y[valid]
+    if method == "lttb":
+        index = lttb(x, y, n_out)
+    elif method == "minmax":
+        index = minmax(y, n_out // 2)
+    else:
+        raise ValueError("Unknown downsampling method {!r}".format(method))
+    return x[index], y[index]
+
+
+class StationSeriesCache:
+    """Time series of the stations in `data_dir`, loaded on first use.
+
+    A station is kept as a StationSeries (int64 nanosecond timestamps and
+    float32 values), the `maxsize` most recently used stations stay in memory."""
+
+    def __init__(
+        self,
+        data_dir,
+        value_cols=("P1", "P2"),
+        time_col="timestamp",
+        pattern="dataset_*.csv",
+        sep=";",
+        maxsize=64,
+    ):
+        self.data_dir = data_dir
+        self.value_cols = list(value_cols)
+        self.time_col = time_col
+        self.pattern = pattern
+        self.sep = sep
+        self.maxsize = maxsize
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stations(self):
+        """Ids of all stations in the archive, without reading their files."""
+        return sorted(station_files(self.data_dir, self.pattern), key=station_order)
+
+    def _path(self, station):
+        return os.path.join(self.data_dir, self.pattern.replace("*", str(station)))
+
+    def _load(self, station):
+        return read_station_csv(
+            self._path(station), station, self.time_col, self.value_cols, self.sep
+        )
+
+    def series(self, station):
+        station = str(station)
+        with self._lock:
+            if station in self._series:
+                self._series.move_to_end(station)
+                return self._series[station]
+        series = self._load(station)
+        with self._lock:
+            self._series[station] = series
+            while len(self._series) > self.maxsize:
+                self._series.popitem(last=False)
+        return series
+
+    def window(self, station, col, start=None, end=None):
+        """Timestamps (ns) and values of `col` between start and end (ns),
+        including one point on either side so lines reach the plot edges."""
+        window = self.series(station).window(start, end, pad=1)
+        return window.t, window[col]
+
+    def __len__(self):
+        return len(self._series)
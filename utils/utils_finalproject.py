@@ -2,20 +2,264 @@
 # -*- coding: utf-8 -*-
 
 
+import sys
 import json
 import os
 import glob
+import time
+import functools
+import importlib
+import contextlib
+import threading
+import tracemalloc
 import numpy as np
-import pandas as pd
 from datetime import datetime, date
-from wetterdienst.dwd.observations import DWDObservationData, DWDObservationParameterSet, DWDObservationPeriod, DWDObservationResolution
 
-from sklearn.svm import SVR, SVC
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.metrics import mean_squared_error
+########## ------- Lazily imported dependencies ------- ##########
+## pandas, scikit-learn and wetterdienst take seconds to import, so they are imported by the functions which
+## need them on their first call. The names can still be taken from this module, eg. from utils_finalproject import SVR,
+## and a star import still gets them (see __all__ at the end of the module), only "import utils_finalproject" stays light.
 
+_LAZY_IMPORTS = {
+	"pd": ("pandas", None),
+	"DWDObservationData": ("wetterdienst.dwd.observations", "DWDObservationData"),
+	"DWDObservationParameterSet": ("wetterdienst.dwd.observations", "DWDObservationParameterSet"),
+	"DWDObservationPeriod": ("wetterdienst.dwd.observations", "DWDObservationPeriod"),
+	"DWDObservationResolution": ("wetterdienst.dwd.observations", "DWDObservationResolution"),
+	"DWDObservationSites": ("wetterdienst.dwd.observations", "DWDObservationSites"),
+	"SVR": ("sklearn.svm", "SVR"),
+	"SVC": ("sklearn.svm", "SVC"),
+	"SGDRegressor": ("sklearn.linear_model", "SGDRegressor"),
+	"BallTree": ("sklearn.neighbors", "BallTree"),
+	"StandardScaler": ("sklearn.preprocessing", "StandardScaler"),
+	"train_test_split": ("sklearn.model_selection", "train_test_split"),
+	"cross_val_score": ("sklearn.model_selection", "cross_val_score"),
+	"mean_squared_error": ("sklearn.metrics", "mean_squared_error"),
+}
 
+
+def __getattr__(name):
+	## only called for names which are not defined in the module (PEP 562)
+	if name not in _LAZY_IMPORTS:
+		raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+	module_name, attribute = _LAZY_IMPORTS[name]
+	value = importlib.import_module(module_name)
+	if attribute is not None:
+		value = getattr(value, attribute)
+	globals()[name] = value
+	return value
+
+########## ------- Opt-in instrumentation of the pipeline functions ------- ##########
+## Enable with enable_instrumentation() or by setting the environment variable FINALPROJECT_INSTRUMENT=1.
+## While disabled, decorated functions only pay for one dictionary lookup per call.
+
+_INSTRUMENTATION = {"enabled": os.environ.get("FINALPROJECT_INSTRUMENT", "0") == "1", "trace_memory": False,
+	"started_tracing": False}
+_open_spans = threading.local()
+
+
+class InstrumentationCollector:
+	"""
+	--- Collect the records of instrumented calls and export them ----
+	Each record is a dictionary with name, wall time, rows, files, bytes and allocation deltas of one call.
+	"""
+
+	def __init__(self):
+		self.records = []
+		self._lock = threading.Lock()
+
+	def add(self, record):
+		with self._lock:
+			self.records.append(record)
+
+	def clear(self):
+		with self._lock:
+			self.records = []
+
+	def summary(self):
+		"""
+		--- Aggregate the records per function or stage name ----
+		return dictionary with name as key and summed up measurements as values
+		"""
+		summary = {}
+		with self._lock:
+			records = list(self.records)
+		for record in records:
+			total = summary.setdefault(record["name"], {"calls": 0, "wall_time_s": 0.0, "rows": 0, "files": 0,
+				"bytes_read": 0, "bytes_written": 0, "alloc_delta_bytes": 0, "alloc_peak_bytes": 0})
+			total["calls"] += 1
+			for key in ["wall_time_s", "rows", "files", "bytes_read", "bytes_written", "alloc_delta_bytes"]:
+				total[key] += record[key] or 0
+			total["alloc_peak_bytes"] = max(total["alloc_peak_bytes"], record["alloc_peak_bytes"] or 0)
+		return summary
+
+	def to_jsonl(self, path):
+		"""
+		--- Write one JSON line per recorded call ----
+		path : output file, existing files are extended
+		"""
+		with self._lock:
+			records = list(self.records)
+		with open(path, "a") as dst:
+			for record in records:
+				dst.write(json.dumps(record) + "\n")
+
+	def to_prometheus(self, path, prefix="finalproject"):
+		"""
+		--- Write the aggregated measurements in the Prometheus text format (eg. for the node exporter) ----
+		path : output file, will be overwritten
+		prefix : prefix of the metric names
+		"""
+		metrics = [("calls", "calls_total", "counter", "Number of calls"),
+			("wall_time_s", "wall_seconds_total", "counter", "Wall time in seconds"),
+			("rows", "rows_total", "counter", "Rows returned"),
+			("files", "files_total", "counter", "Files read or written"),
+			("bytes_read", "read_bytes_total", "counter", "Bytes read from files"),
+			("bytes_written", "written_bytes_total", "counter", "Bytes written to files"),
+			("alloc_peak_bytes", "alloc_peak_bytes", "gauge", "Highest traced memory allocation of a single call")]
+		summary = self.summary()
+		lines = []
+		for key, metric, metric_type, help_text in metrics:
+			lines.append("# HELP {}_{} {}".format(prefix, metric, help_text))
+			lines.append("# TYPE {}_{} {}".format(prefix, metric, metric_type))
+			for name, total in sorted(summary.items()):
+				lines.append('{}_{}{{function="{}"}} {}'.format(prefix, metric, name, total[key]))
+		with open(path, "w") as dst:
+			dst.write("\n".join(lines) + "\n")
+
+
+collector = InstrumentationCollector()
+
+
+def enable_instrumentation(trace_memory=False):
+	"""
+	--- Start recording instrumented calls into the collector ----
+	trace_memory : boolean indicating if allocation deltas are traced with tracemalloc (slows down the calls)
+	"""
+	_INSTRUMENTATION["enabled"] = True
+	_INSTRUMENTATION["trace_memory"] = trace_memory
+	if trace_memory and not tracemalloc.is_tracing():
+		tracemalloc.start()
+		_INSTRUMENTATION["started_tracing"] = True
+
+
+def disable_instrumentation():
+	"""
+	--- Stop recording, tracemalloc is only stopped if enable_instrumentation started it ----
+	"""
+	_INSTRUMENTATION["enabled"] = False
+	if _INSTRUMENTATION["started_tracing"] and tracemalloc.is_tracing():
+		tracemalloc.stop()
+	_INSTRUMENTATION["trace_memory"] = False
+	_INSTRUMENTATION["started_tracing"] = False
+
+
+class _Span:
+	"""
+	--- Context manager recording a single call or stage ----
+	"""
+
+	def __init__(self, name):
+		self.record = {"name": name, "start": None, "wall_time_s": None, "rows": None, "files": 0,
+			"bytes_read": 0, "bytes_written": 0, "alloc_delta_bytes": None, "alloc_peak_bytes": None}
+		## spans opened before memory tracing was enabled have no peak of their own
+		self._traced = False
+		self._peak = 0
+
+	def __enter__(self):
+		stack = getattr(_open_spans, "stack", None)
+		if stack is None:
+			stack = _open_spans.stack = []
+		self._traced = _INSTRUMENTATION["trace_memory"] and tracemalloc.is_tracing()
+		if self._traced:
+			## tracemalloc has a single peak, before resetting it for this span the peak so far
+			## is kept by the enclosing span, so nested spans do not lose the maxima of their parents
+			self._mem_start, peak = tracemalloc.get_traced_memory()
+			if stack and stack[-1]._traced:
+				stack[-1]._peak = max(stack[-1]._peak, peak)
+			tracemalloc.reset_peak()
+			self._peak = self._mem_start
+		stack.append(self)
+		self.record["start"] = datetime.now().isoformat()
+		self._t_start = time.perf_counter()
+		return self.record
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.record["wall_time_s"] = time.perf_counter() - self._t_start
+		stack = _open_spans.stack
+		stack.pop()
+		if self._traced and tracemalloc.is_tracing():
+			current, peak = tracemalloc.get_traced_memory()
+			self._peak = max(self._peak, peak)
+			self.record["alloc_delta_bytes"] = current - self._mem_start
+			self.record["alloc_peak_bytes"] = self._peak - self._mem_start
+			## the absolute peak of this span is part of the enclosing span
+			if stack and stack[-1]._traced:
+				stack[-1]._peak = max(stack[-1]._peak, self._peak)
+		collector.add(self.record)
+		return False
+
+
+def measure(name):
+	"""
+	--- Context manager to time a stage of a function, eg. with measure("mergedCSVpattern.concat"): ----
+	name : name of the stage in the collector
+	return context manager, which does nothing while the instrumentation is disabled
+	"""
+	if not _INSTRUMENTATION["enabled"]:
+		return contextlib.nullcontext()
+	return _Span(name)
+
+
+def _count_rows(result):
+	## DataFrame, list of DataFrames (mergedCSVpattern, merge_df2csv) or tuple of splits (splitTrainTest_TS)
+	## results can only be DataFrames if pandas was already imported by the recorded function
+	pd = sys.modules.get("pandas")
+	if pd is None:
+		return None
+	if isinstance(result, (pd.DataFrame, pd.Series)):
+		return len(result)
+	if isinstance(result, list):
+		return sum(len(df) for df in result if isinstance(df, (pd.DataFrame, pd.Series)))
+	if isinstance(result, tuple) and len(result) > 0 and isinstance(result[0], (pd.DataFrame, pd.Series)):
+		return sum(len(df) for df in result[::2])
+	return None
+
+
+def note_io(files_read=(), files_written=()):
+	"""
+	--- Add files and their size to all calls which are currently recorded ----
+	files_read : list of paths which were read
+	files_written : list of paths which were written
+	"""
+	if not _INSTRUMENTATION["enabled"]:
+		return
+	bytes_read = sum(os.path.getsize(f) for f in files_read if os.path.exists(f))
+	bytes_written = sum(os.path.getsize(f) for f in files_written if os.path.exists(f))
+	for span in getattr(_open_spans, "stack", []):
+		record = span.record
+		record["files"] += len(files_read) + len(files_written)
+		record["bytes_read"] += bytes_read
+		record["bytes_written"] += bytes_written
+
+
+def instrumented(func):
+	"""
+	--- Decorator recording each call of func while the instrumentation is enabled ----
+	"""
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		if not _INSTRUMENTATION["enabled"]:
+			return func(*args, **kwargs)
+		with _Span(func.__name__) as record:
+			result = func(*args, **kwargs)
+			record["rows"] = _count_rows(result)
+		return result
+
+	return wrapper
+
+
+@instrumented
 def get_weatherdata(station_id, weather_parameters, resolution, periods, start_date, end_date):
 	"""
 	--- Return timeseries of DWD weatherstations with userdefined parameters, spatial and temporal resoultion ---- 
@@ -30,6 +274,8 @@ def get_weatherdata(station_id, weather_parameters, resolution, periods, start_d
 	Further information for parameter types: https://wetterdienst.readthedocs.io/_/downloads/en/latest/pdf/	  
 	If resolution has not a certain parameter: --> Atrribute error 
 	"""
+	from wetterdienst.dwd.observations import DWDObservationData
+
 	observations = DWDObservationData(
 		station_ids = station_id,
 		parameters = weather_parameters,
@@ -43,6 +289,7 @@ def get_weatherdata(station_id, weather_parameters, resolution, periods, start_d
 	return observations
 	
 	
+@instrumented
 def mergedCSVpattern(pattern_list, selected_cols=None, sep_char="[;,|]"):
 	'''
 	--- Read in and merge csv files accoridng to pattern in filename ----
@@ -51,13 +298,20 @@ def mergedCSVpattern(pattern_list, selected_cols=None, sep_char="[;,|]"):
 	sep_char : string or regular expression to indicate seperator
 	return : group files in current and all subdirectories based on pattern in filename and filetype to one pd.DF
 	'''
+	import pandas as pd
+
 	df_combi_list = []
 
 	for item in pattern_list:
 		## also look in the next subfolders
-		files = glob.glob("**/*{}*.csv".format(item), recursive=True)  ## get from cur. dir and all sub.dirs
+		with measure("mergedCSVpattern.glob"):
+			files = glob.glob("**/*{}*.csv".format(item), recursive=True)  ## get from cur. dir and all sub.dirs
 		#pdb.set_trace()
-		df_combi = pd.concat([pd.DataFrame(pd.read_csv(f, sep=sep_char, engine="python", index_col=False), columns=selected_cols) for f in files], join="inner")  # join on identical col.names
+		with measure("mergedCSVpattern.read_csv"):
+			dfs = [pd.DataFrame(pd.read_csv(f, sep=sep_char, engine="python", index_col=False), columns=selected_cols) for f in files]
+			note_io(files_read=files)
+		with measure("mergedCSVpattern.concat"):
+			df_combi = pd.concat(dfs, join="inner")  # join on identical col.names
 		# index_col shouldnt be read in
 		# try to fetch multiple separor types, def engine="python" to not confuse it with regex separators, which can be read via c-engine
 		df_combi_list.append(df_combi)
@@ -65,6 +319,7 @@ def mergedCSVpattern(pattern_list, selected_cols=None, sep_char="[;,|]"):
 	return df_combi_list
 
 
+@instrumented
 def merge_df2csv(left_dfs_list, right_df, col2merge_left, col2merge_right, outdir, outname):
 	"""
 	---- Merges pandas DataFrames according to identic column values and saves them as CSV ----
@@ -74,19 +329,144 @@ def merge_df2csv(left_dfs_list, right_df, col2merge_left, col2merge_right, outdi
 	merge_pattern : column names with identical values and datatype in both dataframes (str)
 	returns list of merged dataframes and saves each dataframe as csv file
 	"""
+	import pandas as pd
+
 	df_all_list = []
 
 	for df in left_dfs_list:
-		df_merged = pd.merge(df, right_df, left_on=col2merge_left, right_on=col2merge_right)
+		with measure("merge_df2csv.merge"):
+			df_merged = pd.merge(df, right_df, left_on=col2merge_left, right_on=col2merge_right)
 		df_all_list.append(df_merged)
 		#pdb.set_trace()
 		outname_sep = df_merged[outname][0]
 		fpath = os.path.join(outdir, "dataset_" + str(outname_sep) + ".csv")
-		df_merged.to_csv(fpath, sep=";")
+		with measure("merge_df2csv.to_csv"):
+			df_merged.to_csv(fpath, sep=";")
+			note_io(files_written=[fpath])
 
 	return df_all_list
 
 
+@instrumented
+def get_dwd_stations(weather_parameter, resolution, period):
+	"""
+	--- Return the DWD weatherstations (id, coordinates, name) which offer a certain parameter set ----
+	weather_parameter : parameter in format: DWDObservationParameterSet.PARAMETERNAME
+	resolution : resolution time in format: DWDObservationResolution.RESOLUTION
+	period : observation period in format: DWDObservationPeriod.PERIOD
+	return pandas DataFrame with one row per station, incl. the columns STATION_ID, LAT and LON
+	"""
+	from wetterdienst.dwd.observations import DWDObservationSites
+
+	stations = DWDObservationSites(parameter_set=weather_parameter, resolution=resolution, period=period).all()
+
+	return stations
+
+
+@instrumented
+def assign_nearest_stations(sensor_df, station_df, k=3, power=2, sensor_col="sensor_id", station_col="STATION_ID"):
+	"""
+	--- Assign each sensor its k nearest weatherstations with inverse distance weights ----
+	sensor_df : pandas DataFrame with the columns sensor_col, "lat" and "lon", several rows per sensor are allowed
+	station_df : pandas DataFrame with the columns station_col, "LAT" and "LON" (eg. from get_dwd_stations())
+	k : number of nearest stations per sensor
+	power : power of the inverse distance weights
+	sensor_col : string indicating the column with the sensor ids
+	station_col : string indicating the column with the station ids
+	return pandas DataFrame with one row per sensor and station: sensor_col, station_col, distance_km and weight
+	
+	The stations are searched by a BallTree on the haversine distance, so no sensor x station distance matrix is built.
+	"""
+	import pandas as pd
+	from sklearn.neighbors import BallTree
+
+	sensors = sensor_df.groupby(sensor_col)[["lat", "lon"]].first()
+	stations = station_df.drop_duplicates(station_col).reset_index(drop=True)
+	k = min(k, len(stations))
+
+	tree = BallTree(np.radians(stations[["LAT", "LON"]].to_numpy(dtype=np.float64)), metric="haversine")
+	dist, idx = tree.query(np.radians(sensors[["lat", "lon"]].to_numpy(dtype=np.float64)), k=k)
+	dist_km = dist * 6371.0
+
+	# a minimum distance of 1 m avoids a division by zero for sensors located at a station
+	weights = 1.0 / np.maximum(dist_km, 1e-3) ** power
+	weights /= weights.sum(axis=1, keepdims=True)
+
+	assignments = pd.DataFrame({
+		sensor_col: np.repeat(sensors.index.to_numpy(), k),
+		station_col: stations[station_col].to_numpy()[idx.ravel()],
+		"distance_km": dist_km.ravel(),
+		"weight": weights.ravel()})
+
+	return assignments
+
+
+def pivot_weatherdata(observations, time_col="DATE", station_col="STATION_ID"):
+	"""
+	--- Convert tidy DWD observations (one row per element) to one column per element ----
+	observations : pandas DataFrame from get_weatherdata() with the columns ELEMENT and VALUE
+	time_col : string indicating the column with the timestamps
+	station_col : string indicating the column with the station ids
+	return pandas DataFrame with one row per station and timestamp
+	"""
+	weather_df = observations.pivot_table(index=[station_col, time_col], columns="ELEMENT", values="VALUE", aggfunc="first")
+	weather_df.columns.name = None
+
+	return weather_df.reset_index()
+
+
+@instrumented
+def get_weatherdata_for_sensors(assignments, weather_parameters, resolution, periods, start_date, end_date, station_col="STATION_ID"):
+	"""
+	--- Download the weather only for the distinct stations assigned to the sensors ----
+	assignments : pandas DataFrame from assign_nearest_stations()
+	weather_parameters, resolution, periods, start_date, end_date : see get_weatherdata()
+	station_col : string indicating the column with the station ids
+	return pandas DataFrame with one row per station and timestamp and one column per element
+	"""
+	station_ids = sorted(assignments[station_col].unique().tolist())
+	observations = get_weatherdata(station_ids, weather_parameters, resolution, periods, start_date, end_date)
+
+	return pivot_weatherdata(observations, station_col=station_col)
+
+
+@instrumented
+def join_nearest_weather(sensor_df, weather_df, assignments, value_cols, sensor_time_col="timestamp", weather_time_col="DATE", sensor_col="sensor_id", station_col="STATION_ID"):
+	"""
+	--- Join each sensor row with the distance weighted weather of its nearest stations ----
+	sensor_df : pandas DataFrame with the sensor readings
+	weather_df : pandas DataFrame with one row per station and timestamp (eg. from get_weatherdata_for_sensors())
+	assignments : pandas DataFrame from assign_nearest_stations()
+	value_cols : list of weather columns which should be interpolated
+	sensor_time_col, weather_time_col : string indicating the timestamp columns, values and datatype should be identic
+	sensor_col, station_col : string indicating the columns with the sensor and station ids
+	return pandas DataFrame of sensor_df with the weighted weather columns, rows without weather are ignored
+	
+	Missing weather values of a station are left out and the weights of the other stations are rescaled.
+	"""
+	import pandas as pd
+
+	weighted = pd.merge(assignments[[sensor_col, station_col, "weight"]], weather_df[[station_col, weather_time_col] + value_cols], on=station_col)
+
+	values = weighted[value_cols].astype(np.float64)
+	valid = values.notna()
+	weight = weighted["weight"].to_numpy()[:, None]
+	numerator = pd.DataFrame(values.fillna(0.0).to_numpy() * weight, columns=value_cols)
+	denominator = pd.DataFrame(valid.to_numpy() * weight, columns=value_cols)
+	keys = [weighted[sensor_col].to_numpy(), weighted[weather_time_col].to_numpy()]
+
+	numerator = numerator.groupby(keys).sum()
+	denominator = denominator.groupby(keys).sum()
+	sensor_weather = (numerator / denominator.where(denominator > 0)).rename_axis([sensor_col, weather_time_col]).reset_index()
+
+	df_merged = pd.merge(sensor_df, sensor_weather, left_on=[sensor_col, sensor_time_col], right_on=[sensor_col, weather_time_col])
+	if weather_time_col != sensor_time_col:
+		df_merged = df_merged.drop(columns=weather_time_col)
+
+	return df_merged
+
+
+@instrumented
 def splitTrainTest_TS(df, split_date, feature_cols, target_col, standarize=False):
 	"""
 	--- Create Train and Test data based on a certain boundary date ----
@@ -102,6 +482,9 @@ def splitTrainTest_TS(df, split_date, feature_cols, target_col, standarize=False
 	#preX_train, preX_test, y_train, y_test = train_test_split(X, Y, test_size=0.4, random_state=42)
 
 	if standarize == True:
+		import pandas as pd
+		from sklearn.preprocessing import StandardScaler
+
 		### Standardize data due to different untis of the paramters/features (columns)
 		scaler = StandardScaler() 
 		X = pd.DataFrame(scaler.fit_transform(X),columns=X.columns) 
@@ -121,7 +504,313 @@ def splitTrainTest_TS(df, split_date, feature_cols, target_col, standarize=False
 	return X_train, y_train, X_test, y_test
 
 
+class RunningScaler:
+	"""
+	--- Standardize features with running mean and variance (Welford's algorithm) ----
+	Unlike StandardScaler the statistics are updated batch by batch with partial_fit(),
+	so new hourly rows can be added without revisiting the full history.
+	"""
+
+	def __init__(self):
+		self.n_samples_seen_ = 0
+		self.mean_ = None
+		self.m2_ = None  # sum of squared differences from the current mean
+
+	def partial_fit(self, X):
+		"""
+		--- Update running mean and variance with a new batch of rows ----
+		X : pandas DataFrame or 2-dimensional numpy array with the new rows
+		return the updated scaler
+		"""
+		X = np.asarray(X, dtype=np.float64)
+		n_new = X.shape[0]
+		if n_new == 0:
+			return self
+
+		batch_mean = X.mean(axis=0)
+		batch_m2 = ((X - batch_mean) ** 2).sum(axis=0)
+
+		if self.n_samples_seen_ == 0:
+			self.mean_ = batch_mean
+			self.m2_ = batch_m2
+		else:
+			# combine the statistics of both batches (parallel variant of Welford's algorithm)
+			n_total = self.n_samples_seen_ + n_new
+			delta = batch_mean - self.mean_
+			self.mean_ = self.mean_ + delta * n_new / n_total
+			self.m2_ = self.m2_ + batch_m2 + delta ** 2 * self.n_samples_seen_ * n_new / n_total
+		self.n_samples_seen_ += n_new
+
+		return self
+
+	@property
+	def var_(self):
+		return self.m2_ / self.n_samples_seen_
+
+	@property
+	def scale_(self):
+		scale = np.sqrt(self.var_)
+		# constant features would lead to a division by zero, keep them unscaled like StandardScaler
+		return np.where(scale == 0.0, 1.0, scale)
+
+	def transform(self, X):
+		"""
+		--- Scale rows with the statistics seen so far ----
+		X : pandas DataFrame or 2-dimensional numpy array
+		return numpy array with standardized features
+		"""
+		return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+class IncrementalRegressor:
+	"""
+	--- Keep a regression model up to date while new hourly observations arrive ----
+	feature_cols : list of strings indicating the column names which are used as features
+	target_col : string indicating the column which should be predicted
+	estimator : sklearn regressor, estimators with partial_fit() (default SGDRegressor) are updated
+				with the new rows only, all others (eg. SVR) are refitted from scratch on the sliding window
+				at every update (no warm start), so an update costs a full fit on up to window_size rows
+	window_size : maximum number of most recent rows which are kept as support data, older rows are dropped
+				and do not influence refitted estimators anymore
+	"""
+
+	def __init__(self, feature_cols, target_col, estimator=None, window_size=5000):
+		self.feature_cols = feature_cols
+		self.target_col = target_col
+		if estimator is None:
+			from sklearn.linear_model import SGDRegressor
+			estimator = SGDRegressor(random_state=42)
+		self.estimator = estimator
+		self.window_size = window_size
+		self.scaler = RunningScaler()
+		self.window = None
+		self.last_timestamp = None
+
+	def update(self, df):
+		"""
+		--- Update scaler and support data with rows not seen before and update or refit the regressor ----
+		df : pandas DataFrame with feature and target columns, if indexed by timestamp
+			only rows after the last update are used
+		return number of new rows used for the update
+		"""
+		import pandas as pd
+
+		if self.last_timestamp is not None and isinstance(df.index, pd.DatetimeIndex):
+			df = df.loc[df.index > self.last_timestamp]
+		df = df.dropna(subset=self.feature_cols + [self.target_col])
+		if df.empty:
+			return 0
+
+		X_new = df[self.feature_cols]
+		y_new = df[self.target_col]
+		self.scaler.partial_fit(X_new)
+
+		# sliding window of the most recent observations, bounded by window_size
+		if self.window is None:
+			self.window = df[self.feature_cols + [self.target_col]].tail(self.window_size)
+		else:
+			self.window = pd.concat([self.window, df[self.feature_cols + [self.target_col]]]).tail(self.window_size)
 
+		if hasattr(self.estimator, "partial_fit"):
+			self.estimator.partial_fit(self.scaler.transform(X_new), y_new.values)
+		else:
+			# full refit on the sliding window (at most window_size rows), not on the whole history
+			self.estimator.fit(self.scaler.transform(self.window[self.feature_cols]), self.window[self.target_col].values)
+
+		if isinstance(df.index, pd.DatetimeIndex):
+			self.last_timestamp = df.index.max()
+
+		return len(df)
+
+	def predict(self, X):
+		"""
+		--- Predict the target for new feature rows ----
+		X : pandas DataFrame with the feature columns
+		return numpy array of predictions
+		"""
+		return self.estimator.predict(self.scaler.transform(X[self.feature_cols]))
+
+
+########## ------- Quality control of the SDS011 readings ------- ##########
+## Each rule sets one bit of the flag of a reading, 0 means the reading passed all rules.
+
+QC_MISSING = 1		# no value
+QC_RANGE = 2		# outside the measurement range of the sensor
+QC_SPIKE = 4		# far from the rolling median of the previous readings (Hampel filter)
+QC_HUMIDITY = 8		# relative humidity above the limit, the SDS011 overestimates particles in fog
+QC_STUCK = 16		# the same value for stuck_count or more consecutive readings
+
+
+def _row_nanmedian(values):
+	## median of every row without NaN and the number of values, np.nanmedian is much slower on many short rows
+	values = np.sort(values, axis=1)  # NaN are sorted to the end
+	n_valid = (~np.isnan(values)).sum(axis=1)
+	lower = np.take_along_axis(values, np.maximum(n_valid - 1, 0)[:, None] // 2, axis=1)[:, 0]
+	upper = np.take_along_axis(values, n_valid[:, None] // 2, axis=1)[:, 0]
+	## rows without values stay NaN
+	return (lower + upper) / 2, n_valid
+
+
+class StreamingQC:
+	"""
+	--- Quality control of sensor readings which arrive chunk by chunk ----
+	value_cols : list of the columns which are checked, eg. ["P1", "P2"]
+	sensor_col, time_col : string indicating the columns with the sensor ids and the timestamps
+	limits : dictionary with column and (min, max), defaults to the range of the SDS011 (0 - 999.9 µg/m³)
+	window : number of previous readings of a sensor for the rolling median and MAD
+	mad_threshold : a reading is a spike if it differs from the median by more than mad_threshold * 1.4826 * MAD
+	spike_floor : minimum difference to the median of a spike, in units of the column (avoids flags for MAD = 0)
+	min_periods : minimum number of valid previous readings for the spike detection
+	humidity_col : column with the relative humidity or list of candidates, the first one in a chunk is used, the
+		default covers the datasets of merge_df2csv ("humidity") and the DWD weather of join_nearest_weather ("HUMIDITY")
+	humidity_limit : limit of the relative humidity in %, None switches the rule off, otherwise chunks without
+		a humidity column raise a KeyError instead of silently passing the rule
+	stuck_count : number of identical consecutive readings from which on a sensor is considered stuck
+	
+	The readings of a sensor have to arrive in time order over the chunks. The last window readings, the last value
+	and its run length are kept per sensor, so the flags of a chunk do not depend on how the stream is split.
+	All rules are evaluated with numpy for all sensors of a chunk at once.
+	"""
+
+	def __init__(self, value_cols=("P1", "P2"), sensor_col="sensor_id", time_col="timestamp", limits=None,
+			window=24, mad_threshold=6.0, spike_floor=5.0, min_periods=12, humidity_col=("humidity", "HUMIDITY"),
+			humidity_limit=80.0, stuck_count=6):
+		self.value_cols = list(value_cols)
+		self.sensor_col = sensor_col
+		self.time_col = time_col
+		self.limits = limits if limits is not None else {col: (0.0, 999.9) for col in self.value_cols}
+		self.window = window
+		self.mad_threshold = mad_threshold
+		self.spike_floor = spike_floor
+		self.min_periods = min_periods
+		self.humidity_col = [humidity_col] if isinstance(humidity_col, str) else list(humidity_col)
+		self.humidity_limit = humidity_limit
+		self.stuck_count = stuck_count
+		## state per column and sensor: previous readings, last value and length of its run
+		self._history = {col: {} for col in self.value_cols}
+		self._last = {col: {} for col in self.value_cols}
+
+	def update(self, chunk):
+		"""
+		--- Flags of the readings of the next chunk of the stream ----
+		chunk : pandas DataFrame with the sensor, time and value columns and the humidity (unless humidity_limit is None)
+		return pandas DataFrame with the index of chunk and one uint8 column "<col>_qc" per value column
+		"""
+		import pandas as pd
+
+		humidity_col = None
+		if self.humidity_limit is not None:
+			humidity_col = next((col for col in self.humidity_col if col in chunk), None)
+			if humidity_col is None:
+				raise KeyError("None of the humidity columns {} is in the chunk, set humidity_col or humidity_limit=None"
+					.format(self.humidity_col))
+		if len(chunk) == 0:
+			return pd.DataFrame({col + "_qc": np.array([], dtype=np.uint8) for col in self.value_cols}, index=chunk.index)
+
+		with measure("StreamingQC.update"):
+			sensors = chunk[self.sensor_col].to_numpy()
+			times = chunk[self.time_col]
+			if not pd.api.types.is_datetime64_dtype(times):
+				times = pd.to_datetime(times)
+			times = times.to_numpy(dtype="datetime64[ns]").view(np.int64)
+			## sorted by sensor and time, every sensor is a contiguous group
+			order = np.lexsort((times, sensors))
+			sensors = sensors[order]
+			group_starts = np.flatnonzero(np.r_[True, sensors[1:] != sensors[:-1]])
+			group_sizes = np.diff(np.r_[group_starts, len(sensors)])
+			group_ids = sensors[group_starts].tolist()
+
+			humid = np.zeros(len(order), dtype=bool)
+			if humidity_col is not None:
+				humid = chunk[humidity_col].to_numpy(dtype=np.float64)[order] > self.humidity_limit
+
+			flags = {}
+			for col in self.value_cols:
+				x = chunk[col].to_numpy(dtype=np.float64)[order]
+				col_flags = np.where(np.isnan(x), QC_MISSING, 0).astype(np.uint8)
+				lower, upper = self.limits.get(col, (-np.inf, np.inf))
+				out_of_range = (x < lower) | (x > upper)
+				col_flags[out_of_range] |= QC_RANGE
+				## readings without a value or outside the range are left out of the history of the spike detection
+				valid = np.where(out_of_range, np.nan, x)
+				col_flags[self._spikes(col, valid, group_ids, group_starts, group_sizes)] |= QC_SPIKE
+				col_flags[self._stuck(col, x, group_ids, group_starts, group_sizes)] |= QC_STUCK
+				col_flags[humid] |= QC_HUMIDITY
+
+				## back to the order of the chunk
+				flags[col + "_qc"] = np.empty_like(col_flags)
+				flags[col + "_qc"][order] = col_flags
+
+		return pd.DataFrame(flags, index=chunk.index)
+
+	def _spikes(self, col, x, group_ids, group_starts, group_sizes):
+		## every group gets window slots with its previous readings (NaN if there are less) in front of its readings,
+		## float32 like the readings of the sensor, which halves the time of the sorts of the medians
+		w = self.window
+		n_groups = len(group_ids)
+		offsets = group_starts + np.arange(n_groups) * w
+		extended = np.full(len(x) + n_groups * w, np.nan, dtype=np.float32)
+		history = self._history[col]
+		empty = np.full(w, np.nan, dtype=np.float32)
+		extended[(offsets[:, None] + np.arange(w)).ravel()] = np.concatenate([history.get(g, empty) for g in group_ids])
+		positions = np.repeat(offsets + w - group_starts, group_sizes) + np.arange(len(x))
+		extended[positions] = x
+
+		## the window readings before each reading, they never cross into another sensor
+		previous = np.lib.stride_tricks.sliding_window_view(extended, w)[positions - w]
+		median, n_valid = _row_nanmedian(previous)
+		mad, _ = _row_nanmedian(np.abs(previous - median[:, None]))
+		with np.errstate(invalid="ignore"):
+			deviation = np.abs(x - median)
+			spikes = (n_valid >= self.min_periods) & (deviation > np.maximum(self.mad_threshold * 1.4826 * mad, self.spike_floor))
+
+		## the last window slots of every group are the history of the next chunk
+		tails = extended[(offsets + group_sizes)[:, None] + np.arange(w)]
+		history.update(zip(group_ids, tails))
+		return spikes
+
+	def _stuck(self, col, x, group_ids, group_starts, group_sizes):
+		last = self._last[col]
+		previous_value = np.array([last.get(g, (np.nan, 0))[0] for g in group_ids])
+		previous_run = np.array([last.get(g, (np.nan, 0))[1] for g in group_ids])
+
+		## same value as the reading before, the first reading of a sensor is compared with the last chunk
+		same = np.r_[False, x[1:] == x[:-1]]
+		same[group_starts] = x[group_starts] == previous_value
+		index = np.arange(len(x))
+		## a run also starts at the first reading of every sensor, continued runs are added below
+		starts_run = ~same
+		starts_run[group_starts] = True
+		run_start = np.maximum.accumulate(np.where(starts_run, index, 0))
+		run_length = index - run_start + 1
+		## runs continuing from the last chunk start at the first reading of their sensor
+		group_of = np.repeat(np.arange(len(group_ids)), group_sizes)
+		continued = same[group_starts][group_of] & (run_start == group_starts[group_of])
+		run_length[continued] += previous_run[group_of[continued]]
+
+		group_ends = group_starts + group_sizes - 1
+		last.update(zip(group_ids, zip(x[group_ends].tolist(), run_length[group_ends].tolist())))
+		return run_length >= self.stuck_count
+
+
+def qc_csv(path, qc=None, chunksize=100000, sep=";"):
+	"""
+	--- Quality control of a CSV file (eg. a dataset of merge_df2csv) chunk by chunk ----
+	path : CSV file with the sensor, time and value columns
+	qc : StreamingQC, eg. shared by the files of several sensors, a new one with the default rules if None
+	chunksize : number of rows read at once, bounds the memory
+	sep : separator of the CSV file
+	return generator of pandas DataFrames with the flags of each chunk (see StreamingQC.update)
+	"""
+	import pandas as pd
+
+	qc = qc if qc is not None else StreamingQC()
+	note_io(files_read=[path])
+	for chunk in pd.read_csv(path, sep=sep, chunksize=chunksize):
+		yield qc.update(chunk)
+
+
+@instrumented
 def brackets(input_section):
 	## https://www.geeksforgeeks.org/check-for-balanced-parentheses-in-python/
 	'''
@@ -171,4 +860,9 @@ def brackets(input_section):
 # n = int(input())
 # for i in range(n):
 #	  exp = input()
-#	  print(check_balance(exp))
\ No newline at end of file
+#	  print(check_balance(exp))
+
+
+## every public name like without __all__, plus the lazily imported ones, so star imports (eg. in the notebooks)
+## get the same names as before the lazy imports
+__all__ = [name for name in globals() if not name.startswith("_")] + list(_LAZY_IMPORTS)
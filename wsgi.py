@@ -0,0 +1,15 @@
+"""
+Production entry point of the SVM Explorer for a multi-process WSGI server, e.g.
+
+    SVM_CACHE_DIR=/tmp/svm-cache gunicorn --workers 4 --threads 2 wsgi:server
+
+SVM_CACHE_DIR makes all workers share the fitted models and rendered figures,
+each worker warms up its datasets on start unless SVM_WARM_UP=0.
+"""
+
+from app import server, start_warm_up
+
+start_warm_up()
+
+if __name__ == "__main__":
+    server.run()